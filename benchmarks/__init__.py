@@ -0,0 +1,6 @@
+"""
+Benchmarks for gitmit.
+
+These aren't part of the gitmit package, and are run from a checkout of the
+repository. See the Benchmarks section of the README.
+"""
@@ -0,0 +1,162 @@
+"""
+Make synthetic git repositories to benchmark gitmit against::
+
+    from benchmarks.generate import generate_repo
+
+    generated = generate_repo("/tmp/repo", files=10000, depth=4, commits=1000, merge_every=10, symlinks=5)
+
+The history is written with ``git fast-import`` so even big repositories only
+take a few seconds to make, and the same arguments always make the same
+repository.
+
+The shape of the repository is controlled by:
+
+files
+    How many files there are. They are spread evenly over the folders, with
+    ``per_folder`` files in each folder.
+
+depth
+    How many folders deep the files are.
+
+commits
+    How many commits there are on the main branch. The first commit adds every
+    file and each commit after that changes ``changes`` random files.
+
+merge_every
+    Every ``merge_every`` commits on the main branch we make a commit on a side
+    branch that starts two commits back and merge it in. These side commits
+    aren't counted in ``commits``. Zero means no merges.
+
+symlinks
+    How many symlinks to folders there are at the top of the repository.
+
+Commit times start at 1500000000 and go up by a minute for each commit.
+"""
+from collections import namedtuple
+import subprocess
+import random
+import os
+
+Generated = namedtuple("Generated", ["location", "files", "folders", "commits", "merges", "symlinks"])
+
+start_time = 1500000000
+
+def folder_for(index, depth, fanout, per_folder):
+    """Return the folder for the file at this index"""
+    parts = []
+    number = index // per_folder
+    for level in range(depth):
+        parts.append("d{0}".format(number % fanout))
+        number //= fanout
+    return "/".join(reversed(parts))
+
+def fanout_for(files, depth, per_folder):
+    """Return how many folders each folder needs so there are enough folders for our files"""
+    if depth == 0:
+        return 1
+    needed = max(1, -(-files // per_folder))
+    fanout = 1
+    while fanout ** depth < needed:
+        fanout += 1
+    return fanout
+
+def paths_for(files, depth, per_folder=20):
+    """Return the paths of the files in our repository"""
+    fanout = fanout_for(files, depth, per_folder)
+    paths = []
+    for index in range(files):
+        folder = folder_for(index, depth, fanout, per_folder)
+        name = "file{0}.txt".format(index)
+        paths.append("{0}/{1}".format(folder, name) if folder else name)
+    return paths
+
+class FastImport(object):
+    """Writes commits to a git fast-import stream"""
+    def __init__(self, stream):
+        self.mark = 0
+        self.count = 0
+        self.stream = stream
+
+    def data(self, body):
+        body = body.encode("utf-8")
+        self.stream.write("data {0}\n".format(len(body)).encode("utf-8"))
+        self.stream.write(body)
+        self.stream.write(b"\n")
+
+    def commit(self, branch, parents, changes, links=()):
+        """
+        Write a commit to branch with these parent marks, where changes is a
+        list of (path, content) and links a list of (path, target).
+
+        Return the mark for the commit.
+        """
+        self.mark += 1
+        epoch = start_time + self.count * 60
+        self.count += 1
+
+        write = lambda line: self.stream.write("{0}\n".format(line).encode("utf-8"))
+        write("commit refs/heads/{0}".format(branch))
+        write("mark :{0}".format(self.mark))
+        write("committer gitmit <gitmit@example.com> {0} +0000".format(epoch))
+        self.data("commit {0}".format(self.count))
+
+        for index, parent in enumerate(parents):
+            write("{0} :{1}".format("from" if index == 0 else "merge", parent))
+
+        for path, content in changes:
+            write("M 100644 inline {0}".format(path))
+            self.data(content)
+
+        for path, target in links:
+            write("M 120000 inline {0}".format(path))
+            self.data(target)
+
+        write("")
+        return self.mark
+
+def generate_repo(location, files=1000, depth=3, commits=100, merge_every=0, symlinks=0, changes=None, per_folder=20, seed=0):
+    """
+    Make a repository at location with the shape we're given and return a
+    Generated describing it.
+
+    ``changes`` is the number of files changed in each commit after the first,
+    which defaults to one percent of the files.
+    """
+    if changes is None:
+        changes = max(1, files // 100)
+    changes = min(changes, files)
+
+    paths = paths_for(files, depth, per_folder=per_folder)
+    folders = sorted(set(os.path.dirname(path) for path in paths) - set([""]))
+
+    # Symlinks at the top point at the top level folders
+    top = sorted(set(folder.split("/")[0] for folder in folders))
+    links = []
+    if top:
+        links = [("link{0}".format(index), top[index % len(top)]) for index in range(symlinks)]
+
+    rand = random.Random(seed)
+
+    subprocess.check_call(["git", "init", "-q", location])
+    p = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=location, stdin=subprocess.PIPE)
+    try:
+        importer = FastImport(p.stdin)
+        main = [importer.commit("bench", [], [(path, "{0} 0\n".format(path)) for path in paths], links)]
+        merges = 0
+
+        for number in range(1, commits):
+            if merge_every and number % merge_every == 0 and len(main) > 1:
+                changed = [(path, "{0} side {1}\n".format(path, number)) for path in rand.sample(paths, changes)]
+                side = importer.commit("side", [main[-2]], changed)
+                main.append(importer.commit("bench", [main[-1], side], changed))
+                merges += 1
+            else:
+                changed = [(path, "{0} {1}\n".format(path, number)) for path in rand.sample(paths, changes)]
+                main.append(importer.commit("bench", [main[-1]], changed))
+    finally:
+        p.stdin.close()
+        if p.wait() != 0:
+            raise Exception("git fast-import failed\tlocation={0}".format(location))
+
+    subprocess.check_call(["git", "checkout", "-q", "-f", "bench"], cwd=location)
+    return Generated(location, len(paths), len(folders), commits, merges, len(links))
@@ -0,0 +1,248 @@
+"""
+Time the parts of gitmit that do the most work, one at a time::
+
+    $ python -m benchmarks.micro --size 1000000 --output micro.json
+
+Each benchmark reports how many operations it did per second and the peak
+memory python allocated while doing them, as measured by tracemalloc.
+
+prefix_tree.fill, prefix_tree.contains, prefix_tree.remove
+    Filling a PrefixTree with ``size`` paths, looking up the folder of each
+    path, and removing every path
+
+is_filtered, relpath_for
+    ``GitTimes.is_filtered`` and ``GitTimes.relpath_for`` for ``size`` paths
+    with a realistic set of globs
+
+differences_between.wide, differences_between.deep
+    ``Repo.differences_between`` for every commit on the first parent chain
+    of a generated repository with all the files in one folder, or with the
+    files eight folders deep
+
+The timing and the memory are measured in separate runs, because tracemalloc
+makes everything slower.
+"""
+from benchmarks.generate import generate_repo, paths_for
+
+from gitmit.prefix_tree import PrefixTree
+from gitmit.mit import GitTimes
+from gitmit.repo import Repo
+from gitmit import VERSION
+
+from collections import OrderedDict
+from itertools import chain
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+extensions = [".py", ".pyc", ".txt", ".js", ".log", ".md"]
+
+timestamps_for = ["d*", "*.md"]
+exclude = ["*.pyc", "*.log", "*/node_modules/*", "d1/*"]
+include = ["d1/*.py", "*/keep.log"]
+
+def realistic_paths(size):
+    """Return size paths spread over folders with a mix of extensions"""
+    paths = []
+    for index, path in enumerate(paths_for(size, 4)):
+        paths.append(path[:-len(".txt")] + extensions[index % len(extensions)])
+    return paths
+
+def measure(name, setup, func, ops, repeat=3):
+    """
+    Time func(setup()) repeat times and then run it once more with tracemalloc
+    to find the peak memory. Only func is measured, not setup.
+    """
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        func(state)
+        took = time.perf_counter() - start
+        if best is None or took < best:
+            best = took
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        func(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict([
+          ("name", name)
+        , ("ops", ops)
+        , ("seconds", best)
+        , ("ops_per_sec", ops / best if best else None)
+        , ("peak_bytes", peak)
+        ])
+
+def filled(paths):
+    tree = PrefixTree()
+    tree.fill(paths)
+    return tree
+
+def prefix_tree_benchmarks(paths):
+    parts = [tuple(path.split("/")) for path in paths]
+    yield "prefix_tree.fill", lambda: paths, lambda paths: PrefixTree().fill(paths), len(paths)
+
+    def contains(tree):
+        for path in parts:
+            path[:-1] in tree
+    yield "prefix_tree.contains", lambda: filled(paths), contains, len(paths)
+
+    def remove(tree):
+        for path in parts:
+            tree.remove(path[:-1], path[-1])
+    yield "prefix_tree.remove", lambda: filled(paths), remove, len(paths)
+
+def filter_benchmarks(paths):
+    def gittimes(parent_dir):
+        gittimes = GitTimes("/nowhere", parent_dir, timestamps_for=timestamps_for, include=include, exclude=exclude, silent=True)
+        # Compile the globs before we start timing
+        gittimes.filters
+        return gittimes
+
+    def is_filtered(gittimes):
+        for path in paths:
+            gittimes.is_filtered(path)
+    yield "is_filtered", lambda: gittimes("."), is_filtered, len(paths)
+
+    def relpath_for(gittimes):
+        for path in paths:
+            gittimes.relpath_for(path)
+    yield "relpath_for", lambda: gittimes("d0"), relpath_for, len(paths)
+
+def first_parent_pairs(repo):
+    """Return (tree, [parent_tree]) for each commit on the first parent chain of HEAD"""
+    pairs = []
+    info = repo.commit_info(repo.git.head())
+    while info.parents:
+        parent = repo.commit_info(info.parents[0])
+        pairs.append((info.tree, [parent.tree]))
+        info = parent
+    return pairs
+
+def differences_benchmarks(work_dir, files, commits):
+    shapes = [("wide", dict(depth=0)), ("deep", dict(depth=8, per_folder=2))]
+    for name, options in shapes:
+        location = os.path.join(work_dir, "{0}-{1}-{2}".format(name, files, commits))
+        paths = paths_for(files, **options)
+
+        def setup(location=location, options=options, paths=paths):
+            if not os.path.exists(location):
+                generate_repo(location, files=files, commits=commits, **options)
+            repo = Repo(location, use_commit_graph=False)
+            return repo, first_parent_pairs(repo), filled(paths)
+
+        def differences(state):
+            repo, pairs, prefixes = state
+            for tree, parent_trees in pairs:
+                for _ in repo.differences_between(tree, parent_trees, prefixes):
+                    pass
+
+        yield "differences_between.{0}".format(name), setup, differences, commits - 1
+
+def run(size, files, commits, repeat=3, only=None, work_dir=None, report=None):
+    """
+    Run the benchmarks and return the results with information about where
+    they were run.
+
+    ``only`` is a list of prefixes of the names of the benchmarks we want to
+    run. The repositories for differences_between are only made if we run
+    those benchmarks. ``report`` is called with each result as we get it.
+    """
+    cleanup = work_dir is None
+    if cleanup:
+        work_dir = tempfile.mkdtemp(prefix="gitmit_micro")
+
+    results = []
+    try:
+        paths = realistic_paths(size)
+        benchmarks = chain(prefix_tree_benchmarks(paths), filter_benchmarks(paths), differences_benchmarks(work_dir, files, commits))
+
+        for name, setup, func, ops in benchmarks:
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+
+            result = measure(name, setup, func, ops, repeat=repeat)
+            if report is not None:
+                report(result)
+            results.append(result)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir)
+
+    return OrderedDict([
+          ("gitmit", VERSION)
+        , ("python", platform.python_version())
+        , ("platform", platform.platform())
+        , ("created", int(time.time()))
+        , ("size", size)
+        , ("files", files)
+        , ("commits", commits)
+        , ("repeat", repeat)
+        , ("results", results)
+        ])
+
+def print_result(result, out=sys.stdout):
+    out.write("{0:<28} {1:>14,.0f} ops/sec\tpeak={2:.1f}MB\n".format(result["name"], result["ops_per_sec"] or 0, result["peak_bytes"] / 1024.0 / 1024.0))
+    out.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the parts of gitmit that do the most work")
+
+    parser.add_argument("--size"
+        , help = "How many paths to use for the prefix_tree, is_filtered and relpath_for benchmarks"
+        , type = int
+        , default = 1000000
+        )
+
+    parser.add_argument("--files"
+        , help = "How many files the repositories for the differences_between benchmarks have"
+        , type = int
+        , default = 5000
+        )
+
+    parser.add_argument("--commits"
+        , help = "How many commits the repositories for the differences_between benchmarks have"
+        , type = int
+        , default = 200
+        )
+
+    parser.add_argument("--repeat"
+        , help = "How many times to run each benchmark"
+        , type = int
+        , default = 3
+        )
+
+    parser.add_argument("--only"
+        , help = "Only run benchmarks starting with this name (can be specified multiple times)"
+        , action = "append"
+        )
+
+    parser.add_argument("--work-dir"
+        , help = "Where to make the repositories. Defaults to a temporary folder that is removed afterwards"
+        )
+
+    parser.add_argument("--output"
+        , help = "Where to write the results as json"
+        )
+
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.files, args.commits, repeat=args.repeat, only=args.only, work_dir=args.work_dir, report=print_result)
+
+    if args.output:
+        with open(args.output, "w") as fle:
+            json.dump(results, fle, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Time gitmit against generated repositories of different shapes::
+
+    $ python -m benchmarks.scaling --scale small --output results.json
+
+For each case we make a repository with benchmarks.generate and time:
+
+no_cache
+    ``GitTimes.find()`` without any cache
+
+cold_cache
+    ``GitTimes.find()`` with the cache turned on but nothing in it yet
+
+warm_cache
+    ``GitTimes.find()`` with the cache from the cold_cache run, without the
+    fast path from gitmit.fast_path
+
+fast_path
+    ``GitTimes.find()`` when the fast path has the result from the warm_cache
+    run
+
+git_backend
+    ``GitTimes.find()`` with the git backend and no cache
+
+whatchanged
+    Reading all of ``git whatchanged --pretty=%at``, which is what people
+    tend to use instead of gitmit
+
+Each case changes one of the axes of the base case for the scale, so we can
+see how gitmit scales along that axis.
+
+The results are saved as json, and passing the results from another version
+of gitmit with ``--compare`` prints how much faster or slower each timing got.
+"""
+from benchmarks.generate import generate_repo
+
+from gitmit.fast_path import fast_path_location
+from gitmit.tree_cache import tree_cache_location
+from gitmit.sqlite_cache import sqlite_cache_location
+from gitmit.cache import cache_location
+from gitmit.mit import GitTimes
+from gitmit import VERSION
+
+from collections import namedtuple, OrderedDict
+import subprocess
+import argparse
+import platform
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+Case = namedtuple("Case", ["name", "files", "depth", "commits", "merge_every", "symlinks"])
+
+scales = {
+      "small": Case("base", files=500, depth=2, commits=100, merge_every=0, symlinks=0)
+    , "medium": Case("base", files=5000, depth=3, commits=1000, merge_every=0, symlinks=0)
+    , "large": Case("base", files=50000, depth=4, commits=5000, merge_every=0, symlinks=0)
+    }
+
+# Multiply files and commits by these, and use these for the other axes
+axes = OrderedDict([
+      ("files", [4, 16])
+    , ("depth", [1, 6])
+    , ("commits", [4, 16])
+    , ("merge_every", [10, 3])
+    , ("symlinks", [4, 16])
+    ])
+
+def cases_for(scale, only=None):
+    """
+    Return the cases for this scale, which is the base case and then the base
+    case with each axis changed. ``only`` is a list of the axes we want.
+    """
+    base = scales[scale]
+    cases = [base]
+    for axis, values in axes.items():
+        if only and axis not in only:
+            continue
+
+        for value in values:
+            if axis in ("files", "commits"):
+                value = getattr(base, axis) * value
+            cases.append(base._replace(name="{0}={1}".format(axis, value), **{axis: value}))
+    return cases
+
+def clear_caches(root_folder):
+    """Remove anything gitmit has cached for this repository"""
+    sqlite_location = sqlite_cache_location(root_folder)
+    for location in (cache_location(root_folder), tree_cache_location(root_folder), fast_path_location(root_folder), sqlite_location, sqlite_location + "-wal", sqlite_location + "-shm"):
+        if os.path.exists(location):
+            os.remove(location)
+
+def clear_fast_path(root_folder):
+    """Remove the fast path so the next find has to use the cache"""
+    location = fast_path_location(root_folder)
+    if os.path.exists(location):
+        os.remove(location)
+
+def find(root_folder, **kwargs):
+    """Find every commit time in the repository and return how many there were"""
+    return sum(1 for _ in GitTimes(root_folder, ".", silent=True, **kwargs).find())
+
+def whatchanged(root_folder):
+    """Read all of git whatchanged and return how many lines there were"""
+    # Newer versions of git want us to say we know whatchanged is deprecated
+    for args in (["whatchanged"], ["whatchanged", "--i-still-use-this"], ["log", "--raw", "--no-merges"]):
+        p = subprocess.Popen(["git"] + args + ["--pretty=%at"], cwd=root_folder, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        lines = sum(1 for _ in p.stdout)
+        p.stdout.close()
+        p.stderr.close()
+        if p.wait() == 0:
+            return lines
+    raise Exception("Couldn't run git whatchanged\troot_folder={0}".format(root_folder))
+
+def measure(func, repeat, before=None):
+    """
+    Call func repeat times, calling before before each one without timing it,
+    and return the best and median seconds along with what func returned.
+    """
+    took = []
+    result = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = func()
+        took.append(time.perf_counter() - start)
+
+    took.sort()
+    return {"best": took[0], "median": took[len(took) // 2], "result": result}
+
+def run_case(case, root_folder, repeat=3):
+    """Make the repository for this case and return the results for it"""
+    generated = generate_repo(root_folder, files=case.files, depth=case.depth, commits=case.commits, merge_every=case.merge_every, symlinks=case.symlinks)
+
+    results = OrderedDict()
+    results["no_cache"] = measure(lambda: find(root_folder, with_cache=False), repeat)
+    results["cold_cache"] = measure(lambda: find(root_folder, with_cache=True), repeat, before=lambda: clear_caches(root_folder))
+    results["warm_cache"] = measure(lambda: find(root_folder, with_cache=True), repeat, before=lambda: clear_fast_path(root_folder))
+    results["fast_path"] = measure(lambda: find(root_folder, with_cache=True), repeat)
+    results["git_backend"] = measure(lambda: find(root_folder, with_cache=False, backend="git"), repeat)
+    results["whatchanged"] = measure(lambda: whatchanged(root_folder), repeat)
+
+    return OrderedDict([
+          ("case", case._asdict())
+        , ("repository", generated._replace(location=None)._asdict())
+        , ("timings", results)
+        ])
+
+def git_version():
+    return subprocess.check_output(["git", "--version"]).decode("utf-8").strip()
+
+def run(scale, repeat=3, only=None, work_dir=None, report=None):
+    """
+    Run all the cases for this scale and return the results with information
+    about where they were run.
+
+    Repositories are made under work_dir, which is a temporary folder we remove
+    afterwards if it's not given. report is called with each case's results as
+    we get them.
+    """
+    cleanup = work_dir is None
+    if cleanup:
+        work_dir = tempfile.mkdtemp(prefix="gitmit_benchmark")
+
+    cases = []
+    try:
+        for case in cases_for(scale, only=only):
+            root_folder = os.path.join(work_dir, case.name)
+            if os.path.exists(root_folder):
+                shutil.rmtree(root_folder)
+
+            result = run_case(case, root_folder, repeat=repeat)
+            if report is not None:
+                report(result)
+            cases.append(result)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir)
+
+    return OrderedDict([
+          ("gitmit", VERSION)
+        , ("python", platform.python_version())
+        , ("git", git_version())
+        , ("platform", platform.platform())
+        , ("created", int(time.time()))
+        , ("scale", scale)
+        , ("repeat", repeat)
+        , ("cases", cases)
+        ])
+
+def compare(old, new):
+    """
+    Yield (case, timing, old_seconds, new_seconds, ratio) for the cases and
+    timings in both results, where ratio above one means new is slower.
+    """
+    before = dict((case["case"]["name"], case["timings"]) for case in old["cases"])
+    for case in new["cases"]:
+        name = case["case"]["name"]
+        if name not in before:
+            continue
+
+        for timing, result in case["timings"].items():
+            if timing in before[name]:
+                old_seconds = before[name][timing]["best"]
+                new_seconds = result["best"]
+                yield name, timing, old_seconds, new_seconds, new_seconds / old_seconds if old_seconds else None
+
+def print_case(result, out=sys.stdout):
+    out.write("{0}\n".format(result["case"]["name"]))
+    for timing, took in result["timings"].items():
+        out.write("\t{0:<12} best={1:.4f}s\tmedian={2:.4f}s\n".format(timing, took["best"], took["median"]))
+    out.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time gitmit against generated repositories")
+
+    parser.add_argument("--scale"
+        , help = "How big the repositories are"
+        , choices = sorted(scales)
+        , default = "small"
+        )
+
+    parser.add_argument("--repeat"
+        , help = "How many times to run each timing"
+        , type = int
+        , default = 3
+        )
+
+    parser.add_argument("--only"
+        , help = "Only change these axes from the base case (can be specified multiple times)"
+        , choices = list(axes)
+        , action = "append"
+        )
+
+    parser.add_argument("--work-dir"
+        , help = "Where to make the repositories. Defaults to a temporary folder that is removed afterwards"
+        )
+
+    parser.add_argument("--output"
+        , help = "Where to write the results as json"
+        )
+
+    parser.add_argument("--compare"
+        , help = "Results from a previous run to compare against"
+        )
+
+    args = parser.parse_args(argv)
+
+    results = run(args.scale, repeat=args.repeat, only=args.only, work_dir=args.work_dir, report=print_case)
+
+    if args.output:
+        with open(args.output, "w") as fle:
+            json.dump(results, fle, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fle:
+            old = json.load(fle)
+
+        print("Compared to gitmit {0}".format(old.get("gitmit")))
+        for name, timing, old_seconds, new_seconds, ratio in compare(old, results):
+            ratio = "n/a" if ratio is None else "{0:.2f}x".format(ratio)
+            print("\t{0:<20} {1:<12} {2:.4f}s -> {3:.4f}s\t{4}".format(name, timing, old_seconds, new_seconds, ratio))
+
+if __name__ == "__main__":
+    main()
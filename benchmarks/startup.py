@@ -0,0 +1,184 @@
+"""
+Time how long gitmit takes to start and to do nothing::
+
+    $ python -m benchmarks.startup --budget-ms 30
+
+This measures:
+
+import
+    The cumulative time ``python -X importtime`` says it takes to import
+    gitmit.executor, along with the modules that took the longest
+
+noop
+    The wall time of running ``python -m gitmit.executor`` in a generated
+    repository where the commit times have already been found, which is what
+    a build that calls gitmit over and over pays each time
+
+interpreter
+    The wall time of ``python -c pass`` so the noop time can be put in context
+
+If the import takes longer than ``--budget-ms`` we exit with a failure, so this
+can be used to keep start up fast. It also fails if importing gitmit.executor
+imports any of the modules that should only be imported when they're needed.
+"""
+from benchmarks.generate import generate_repo
+
+from collections import OrderedDict
+import subprocess
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that gitmit.executor shouldn't import until they are needed
+lazy_modules = ["dulwich", "gitmit.repo", "gitmit.git_log", "gitmit.cache", "gitmit.sqlite_cache", "gitmit.shared_cache", "gitmit.tree_cache", "gitmit.filters", "gitmit.apply", "gitmit.tar", "gitmit.trace", "concurrent.futures", "tarfile", "hashlib", "sqlite3"]
+
+def environment():
+    """Return the environment for running python with gitmit importable"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([here] + [path for path in [env.get("PYTHONPATH")] if path])
+    return env
+
+def parse_importtime(output):
+    """
+    Return {module: (self_us, cumulative_us)} from the stderr of
+    ``python -X importtime``
+    """
+    result = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        result[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return result
+
+def import_time(module, runs=5):
+    """
+    Return (best_cumulative_us, modules) for importing this module, where
+    modules is the result of parse_importtime from the best run.
+    """
+    best = None
+    for _ in range(runs):
+        p = subprocess.Popen([sys.executable, "-X", "importtime", "-c", "import {0}".format(module)], env=environment(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = p.communicate()
+        if p.returncode != 0:
+            raise Exception("Failed to import {0}\terror={1}".format(module, err.decode("utf-8", "replace")))
+
+        modules = parse_importtime(err.decode("utf-8", "replace"))
+        took = modules[module][1]
+        if best is None or took < best[0]:
+            best = (took, modules)
+    return best
+
+def imported_by(module):
+    """Return the modules in lazy_modules that importing this module imports"""
+    script = "import json, sys; import {0}; print(json.dumps(sorted(sys.modules)))".format(module)
+    output = subprocess.check_output([sys.executable, "-c", script], env=environment())
+    modules = json.loads(output.decode())
+    return [name for name in lazy_modules if name in modules]
+
+def wall_time(cmd, runs=5, cwd=None):
+    """Return the best wall time in seconds of running this command"""
+    best = None
+    with open(os.devnull, "w") as devnull:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call(cmd, cwd=cwd, env=environment(), stdout=devnull, stderr=devnull)
+            took = time.perf_counter() - start
+            if best is None or took < best:
+                best = took
+    return best
+
+def run(runs=5, files=1000, work_dir=None, top=10):
+    """Return the startup timings"""
+    took, modules = import_time("gitmit.executor", runs=runs)
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+
+    cleanup = work_dir is None
+    if cleanup:
+        work_dir = tempfile.mkdtemp(prefix="gitmit_startup")
+
+    try:
+        root_folder = os.path.join(work_dir, "repo")
+        if not os.path.exists(root_folder):
+            generate_repo(root_folder, files=files, commits=50)
+
+        cmd = [sys.executable, "-m", "gitmit.executor"]
+        # Find the commit times so the timed runs have nothing to do
+        wall_time(cmd, runs=1, cwd=root_folder)
+        noop = wall_time(cmd, runs=runs, cwd=root_folder)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir)
+
+    return OrderedDict([
+          ("import_us", took)
+        , ("slowest_imports", OrderedDict((name, self_us) for name, (self_us, _) in slowest))
+        , ("eager_imports", imported_by("gitmit.executor"))
+        , ("noop_seconds", noop)
+        , ("interpreter_seconds", wall_time([sys.executable, "-c", "pass"], runs=runs))
+        ])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time how long gitmit takes to start")
+
+    parser.add_argument("--runs"
+        , help = "How many times to run each timing"
+        , type = int
+        , default = 5
+        )
+
+    parser.add_argument("--files"
+        , help = "How many files the repository for the noop timing has"
+        , type = int
+        , default = 1000
+        )
+
+    parser.add_argument("--budget-ms"
+        , help = "Fail if importing gitmit.executor takes longer than this many milliseconds"
+        , type = float
+        )
+
+    parser.add_argument("--work-dir"
+        , help = "Where to make the repository. Defaults to a temporary folder that is removed afterwards"
+        )
+
+    parser.add_argument("--output"
+        , help = "Where to write the results as json"
+        )
+
+    args = parser.parse_args(argv)
+
+    results = run(runs=args.runs, files=args.files, work_dir=args.work_dir)
+
+    print("import gitmit.executor  {0:.1f}ms".format(results["import_us"] / 1000.0))
+    for name, self_us in results["slowest_imports"].items():
+        print("\t{0:<30} {1:.1f}ms".format(name, self_us / 1000.0))
+    print("noop run                {0:.1f}ms".format(results["noop_seconds"] * 1000))
+    print("python -c pass          {0:.1f}ms".format(results["interpreter_seconds"] * 1000))
+
+    if args.output:
+        with open(args.output, "w") as fle:
+            json.dump(results, fle, indent=2)
+
+    failed = False
+    if results["eager_imports"]:
+        print("gitmit.executor imports modules it should import lazily: {0}".format(", ".join(results["eager_imports"])))
+        failed = True
+
+    if args.budget_ms is not None and results["import_us"] / 1000.0 > args.budget_ms:
+        print("Importing gitmit.executor took longer than the budget of {0}ms".format(args.budget_ms))
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Set the modified times of files in the working tree to their commit times::
+
+    from gitmit.apply import apply_mtimes
+    from gitmit.mit import GitTimes
+
+    applied = apply_mtimes(root_folder, GitTimes(root_folder, ".").find_batches())
+    print(applied.changed, applied.unchanged, applied.missing, applied.failed)
+
+This is what ``gitmit --apply`` does.
+
+The stat and utime calls happen in a pool of threads, as the commit times
+come in from the walk. Files that already have the right modified time are
+left alone.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import logging
+import errno
+import os
+
+log = logging.getLogger("gitmit.apply")
+
+Applied = namedtuple("Applied", ["changed", "unchanged", "missing", "failed"])
+
+CHANGED, UNCHANGED, MISSING, FAILED = range(4)
+
+# Set the time of symlinks themselves, because git commits the symlink and not what it points to
+utime_kwargs = {}
+if os.utime in os.supports_follow_symlinks:
+    utime_kwargs["follow_symlinks"] = False
+
+def set_mtime(location, epoch):
+    """
+    Set the access and modified times of this location to epoch, unless the
+    modified time is already epoch.
+
+    Return one of CHANGED, UNCHANGED, MISSING or FAILED.
+    """
+    try:
+        if os.lstat(location).st_mtime == epoch:
+            return UNCHANGED
+        os.utime(location, (epoch, epoch), **utime_kwargs)
+        return CHANGED
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            return MISSING
+        log.warning("Failed to set modified time\tlocation=%s\terror=%s", location, error)
+        return FAILED
+
+def set_mtimes(folder, times):
+    """
+    Set the times for a list of (relpath, epoch) where relpath is relative to
+    folder, and return a list of how many of each result there were.
+    """
+    counts = [0, 0, 0, 0]
+    for relpath, epoch in times:
+        counts[set_mtime(os.path.join(folder, relpath), epoch)] += 1
+    return counts
+
+def apply_mtimes(folder, batches, workers=None, chunk_size=1000):
+    """
+    Set the modified times for each list of (relpath, epoch) in ``batches``,
+    where relpath is relative to ``folder``, and return an Applied of how many
+    files were changed, already had the right time, didn't exist or failed.
+
+    We give the threads ``chunk_size`` files at a time, so small batches are
+    put together before they are handed over.
+
+    ``workers`` is the number of threads to use, with None meaning the default
+    of ThreadPoolExecutor.
+    """
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for batch in batches:
+            pending.extend(batch)
+            if len(pending) >= chunk_size:
+                full = len(pending) - len(pending) % chunk_size
+                for start in range(0, full, chunk_size):
+                    futures.append(executor.submit(set_mtimes, folder, pending[start:start + chunk_size]))
+                pending = pending[full:]
+
+        if pending:
+            futures.append(executor.submit(set_mtimes, folder, pending))
+
+    totals = [0, 0, 0, 0]
+    for future in futures:
+        for index, count in enumerate(future.result()):
+            totals[index] += count
+
+    return Applied(*totals)
@@ -0,0 +1,61 @@
+"""
+Helpers for writing the files we keep under the .git folder when many gitmit
+processes might be using the same checkout at once::
+
+    with locked(location):
+        data = read_what_is_there(location)
+        write_atomically(location, change(data))
+
+write_atomically writes to a temporary file next to the location and renames
+it into place, so readers only ever see the old file or the new file and never
+a half written one.
+
+locked takes an exclusive advisory lock on ``<location>.lock`` so that only one
+process at a time reads, changes and writes the file, and the changes from one
+aren't lost when another writes. On platforms without fcntl there is no lock,
+but writes are still atomic.
+"""
+from contextlib import contextmanager
+import binascii
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def write_atomically(location, data):
+    """
+    Write these bytes to a temporary file in the same folder as location and
+    then rename it to location.
+
+    Raises the IOError or OSError if we can't, and the temporary file is
+    always removed.
+    """
+    tmp = "{0}.{1}.{2}.tmp".format(location, os.getpid(), binascii.hexlify(os.urandom(4)).decode())
+    try:
+        with open(tmp, "wb") as fle:
+            fle.write(data)
+        os.replace(tmp, location)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+@contextmanager
+def locked(location):
+    """
+    Hold an exclusive lock on ``<location>.lock`` for the duration of the block,
+    waiting for anyone else who has it.
+
+    Raises IOError or OSError if we can't open the lock file.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open("{0}.lock".format(location), "a") as fle:
+        fcntl.flock(fle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fle.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,78 @@
+"""
+gitmit can find commit times with different backends. Each backend is an
+object with:
+
+all_files()
+    Return a set of all the files under git control
+
+first_commit
+    The oid of HEAD
+
+is_ancestor(ancestor)
+    Whether the commit at ancestor is reachable from HEAD
+
+changed_since(ancestor, use_files_paths)
+    The set of use_files_paths that aren't the same at HEAD as they were at
+    the commit at ancestor
+
+file_commit_times(use_files_paths, debug=False, exclude=None, first_parent=False, max_commits=None, since=None, stats=None)
+    Yield (commit_oid, commit_time, paths) for the commits that changed the
+    files we care about, with each file only yielded once.
+
+    What the walk does is counted in stats, see gitmit.stats.
+
+    When the walk is bounded by max_commits or since, any files that weren't
+    found are yielded at the end as (None, oldest_commit_time, paths).
+
+The backends are:
+
+dulwich
+    gitmit.repo.Repo, which walks the git objects itself using dulwich.
+
+git
+    gitmit.git_log.GitLogRepo, which streams the output of ``git log`` from a
+    local git binary. If git can't be found, we fall back to dulwich.
+
+The cache of commit times also has backends, which are modules with
+get_cached_commit_times, set_cached_commit_times, get_all_cached_commit_times
+and export_cached_commit_times:
+
+file
+    gitmit.cache, which keeps the cache in one binary file
+
+sqlite
+    gitmit.sqlite_cache, which keeps the cache in a SQLite database
+"""
+import logging
+import shutil
+
+log = logging.getLogger("gitmit.backends")
+
+backends = ("dulwich", "git")
+cache_backends = ("file", "sqlite")
+
+def repo_for(root_folder, backend="dulwich", tree_cache=None):
+    """Return the repository object for this backend"""
+    if backend not in backends:
+        raise ValueError("Unknown backend {0}, choose from {1}".format(backend, ", ".join(backends)))
+
+    if backend == "git":
+        if shutil.which("git"):
+            from gitmit.git_log import GitLogRepo
+            return GitLogRepo(root_folder)
+        log.warning("Couldn't find a git binary, using the dulwich backend instead")
+
+    from gitmit.repo import Repo
+    return Repo(root_folder, tree_cache=tree_cache)
+
+def cache_for(cache_backend="file"):
+    """Return the module for this cache backend"""
+    if cache_backend not in cache_backends:
+        raise ValueError("Unknown cache backend {0}, choose from {1}".format(cache_backend, ", ".join(cache_backends)))
+
+    if cache_backend == "sqlite":
+        from gitmit import sqlite_cache
+        return sqlite_cache
+
+    from gitmit import cache
+    return cache
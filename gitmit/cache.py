@@ -1,97 +1,435 @@
 """
 This holds the functionality to write and read a cache of the modified times
 for a repository.
+
+The cache has an entry for each parent_dir, set of files and backend we were
+asked to find commit times for, keyed by
+cache_key(parent_dir, sorted_relpaths, backend). Each entry looks like::
+
+    { "parent_dir": <parent_dir>, "backend": <backend>, "commit": <oid of HEAD>
+    , "commit_times": {<path>: <epoch>, ...}
+    , "last_used": <epoch>, "size": <bytes>
+    }
+
+They are stored in a binary file so that we can memory map it and only read
+the entry we need rather than the whole cache::
+
+    header:  b"GMCT" + uint8 version + uint32 number of entries
+             + uint32 number of strings + uint64 offset of the strings
+    index:   for each entry, 20 byte key + float64 last_used
+             + uint32 parent_dir string + uint32 backend string
+             + uint32 commit string
+             + uint64 offset of the times + uint32 number of times
+             + uint64 size
+    offsets: uint64 for the start of each string, and one for the end
+    times:   for each entry, a uint32 string for each path and then an int64
+             epoch for each path
+    strings: utf-8 encoded strings
+
+Every path is only stored once in the strings, no matter how many entries it
+is in. Using an entry that wasn't the most recently used gives it a new
+last_used, see mark_used.
+
+When there are too many entries, or they take up too many bytes, we throw away
+the entries that were least recently used. The limits default to
+``default_max_entries`` and ``default_max_bytes``.
+
+The cache is replaced with a rename rather than written in place, and changes
+to it are made while holding a lock, see gitmit.atomic.
+
+export_cached_commit_times writes the cache as json for when you want to look
+at what is in it.
 """
 
+from gitmit.atomic import write_atomically, locked
+
+from array import array
+import binascii
+import hashlib
 import logging
+import struct
 import json
+import mmap
+import time
+import sys
 import os
 
 log = logging.getLogger("gitmit.cache")
 
+MAGIC = b"GMCT"
+VERSION = 4
+
+header_struct = struct.Struct(">4sBIIQ")
+index_struct = struct.Struct(">20sdIIIQIQ")
+offset_struct = struct.Struct(">Q")
+
+# Arbitrary numbers are arbitrary
+default_max_entries = 20
+default_max_bytes = 100 * 1024 * 1024
+
+class CacheFormatError(Exception):
+    pass
+
 def cache_location(root_folder):
     """
     Return us the location to the commit times cache
 
-    This is <root_folder>/.git/gitmit_cached_commit_times.json
+    This is <root_folder>/.git/gitmit_cached_commit_times.bin
     """
-    return os.path.join(root_folder, ".git", "gitmit_cached_commit_times.json")
+    return os.path.join(root_folder, ".git", "gitmit_cached_commit_times.bin")
 
-def get_all_cached_commit_times(root_folder):
+def cache_key(parent_dir, sorted_relpaths, backend="dulwich"):
+    """
+    Return the key for the entry for this parent_dir, sorted list of relpaths
+    and the backend that found their commit times
+    """
+    joined = "\0".join([backend, parent_dir] + list(sorted_relpaths))
+    return hashlib.sha1(joined.encode("utf-8", "surrogateescape")).hexdigest()
+
+def entry_size(commit_times):
+    """Roughly how many bytes an entry with these commit times takes up"""
+    return sum(len(path.encode("utf-8", "surrogateescape")) + 20 for path in commit_times)
+
+def encode_cache(entries):
+    """Return the bytes of the cache file for these entries"""
+    strings = {}
+    def string_for(value):
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    index = []
+    times = []
+    offset = 0
+    for key, item in entries.items():
+        commit_times = item["commit_times"]
+        paths = [string_for(path) for path in commit_times]
+        index.append((binascii.unhexlify(key), item["last_used"], string_for(item["parent_dir"]), string_for(item["backend"]), string_for(item["commit"]), offset, len(paths), item["size"]))
+        times.append(struct.pack(">{0}I{0}q".format(len(paths)), *(paths + [int(epoch) for epoch in commit_times.values()])))
+        offset += len(times[-1])
+
+    encoded = [string.encode("utf-8", "surrogateescape") for string in strings]
+    offsets = [0]
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+
+    times_start = header_struct.size + index_struct.size * len(index) + offset_struct.size * len(offsets)
+    strings_start = times_start + offset
+
+    chunks = [header_struct.pack(MAGIC, VERSION, len(index), len(encoded), strings_start)]
+    for key, last_used, parent_dir, backend, commit, offset, count, size in index:
+        chunks.append(index_struct.pack(key, last_used, parent_dir, backend, commit, times_start + offset, count, size))
+    chunks.append(struct.pack(">{0}Q".format(len(offsets)), *offsets))
+    chunks.extend(times)
+    chunks.extend(encoded)
+    return b"".join(chunks)
+
+class CacheFile(object):
     """
-    Find the gitmit cached commit_times and return them if they are the right shape.
+    Reads the cache from the bytes of the file, which is normally a memory map
+    so that we only read the parts of the file we look at.
 
-    This means the file is a list of dictionaries.
+    Raises CacheFormatError if the file isn't a version we understand.
+    """
+    def __init__(self, data):
+        self.data = data
+
+        if len(data) < header_struct.size:
+            raise CacheFormatError("File is too small")
+
+        magic, version, self.count, self.string_count, self.strings_start = header_struct.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise CacheFormatError("Not a version we understand")
+
+        self.offsets_start = header_struct.size + index_struct.size * self.count
+        if self.offsets_start + offset_struct.size * (self.string_count + 1) > len(data) or self.strings_start > len(data):
+            raise CacheFormatError("File is truncated")
+
+        self._offsets = None
+
+    def array(self, typecode, offset, count):
+        """Return an array of count big endian numbers at this offset"""
+        result = array(typecode)
+        result.frombytes(self.data[offset:offset + result.itemsize * count])
+        if len(result) != count:
+            raise CacheFormatError("File is truncated")
+        if sys.byteorder == "little":
+            result.byteswap()
+        return result
+
+    @property
+    def offsets(self):
+        """The offsets of the strings, which we only read when we first need them"""
+        if self._offsets is None:
+            self._offsets = self.array("Q", self.offsets_start, self.string_count + 1)
+            if self.strings_start + self._offsets[-1] > len(self.data):
+                raise CacheFormatError("File is truncated")
+        return self._offsets
+
+    def string(self, number):
+        """Return the string with this number"""
+        if number >= self.string_count:
+            raise CacheFormatError("No such string")
+        offsets = self.offsets
+        return self.data[self.strings_start + offsets[number]:self.strings_start + offsets[number + 1]].decode("utf-8", "surrogateescape")
+
+    def records(self):
+        """Yield (position, key, last_used, parent_dir, backend, commit, offset, count, size) for each entry"""
+        for number in range(self.count):
+            position = header_struct.size + index_struct.size * number
+            key, last_used, parent_dir, backend, commit, offset, count, size = index_struct.unpack_from(self.data, position)
+            yield position, binascii.hexlify(key).decode(), last_used, parent_dir, backend, commit, offset, count, size
+
+    def commit_times(self, offset, count):
+        """Return {path: epoch} from the times at this offset"""
+        if offset + count * 12 > self.strings_start:
+            raise CacheFormatError("Times are outside the file")
+
+        paths = self.array("I", offset, count)
+        epochs = self.array("q", offset + count * 4, count)
+        if paths and max(paths) >= self.string_count:
+            raise CacheFormatError("No such string")
+
+        data = self.data
+        start = self.strings_start
+        offsets = self.offsets
+        return dict(zip((data[start + offsets[number]:start + offsets[number + 1]].decode("utf-8", "surrogateescape") for number in paths), epochs))
 
-    If they aren't, issue a warning and return an empty list, it is just a cache
-    after all!
+    def entry(self, record):
+        """Return the entry as a dictionary for this record from self.records()"""
+        _, _, last_used, parent_dir, backend, commit, offset, count, size = record
+        return {"parent_dir": self.string(parent_dir), "backend": self.string(backend), "commit": self.string(commit), "commit_times": self.commit_times(offset, count), "last_used": last_used, "size": size}
+
+    def entries(self):
+        """Return {key: entry} for every entry"""
+        return dict((record[1], self.entry(record)) for record in self.records())
+
+def opened_cache(location):
+    """
+    Return (fle, mapped) for the cache at this location, or (None, None) if
+    there isn't one.
+
+    The cache is only ever mapped for reading, it is changed by replacing the
+    whole file.
+    """
+    if not os.path.exists(location):
+        return None, None
+
+    fle = open(location, "rb")
+    try:
+        mapped = mmap.mmap(fle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, EnvironmentError):
+        # Can't map an empty file
+        fle.close()
+        raise CacheFormatError("File is empty")
+
+    return fle, mapped
+
+def get_all_cached_commit_times(root_folder):
+    """
+    Find the gitmit cached commit_times and return all the entries if they are
+    the right shape.
+
+    If they aren't, issue a warning and return an empty dictionary, it is just
+    a cache after all!
     """
-    result = []
     location = cache_location(root_folder)
 
-    if os.path.exists(location):
+    try:
+        fle, mapped = opened_cache(location)
+        if fle is None:
+            return {}
         try:
-            result = json.load(open(location))
-        except (TypeError, ValueError) as error:
-            log.warning("Failed to open gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
-        else:
-            if type(result) is not list or not all(type(item) is dict for item in result):
-                log.warning("Gitmit cached commit_times needs to be a list of dictionaries\tlocation=%s\tgot=%s", location, type(result))
-                result = []
+            return CacheFile(mapped).entries()
+        finally:
+            mapped.close()
+            fle.close()
+    except (CacheFormatError, struct.error, UnicodeDecodeError, IOError, OSError) as error:
+        log.warning("Failed to open gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
+        return {}
+
+def write_cached_commit_times(root_folder, entries):
+    """
+    Write these entries to cache_location(root_folder) or issue a warning if we
+    can't.
+
+    The cache is written to a temporary file that is renamed into place, so
+    anyone reading it sees either the old cache or the new one.
+    """
+    location = cache_location(root_folder)
+    try:
+        log.info("Writing gitmit cached commit_times\tlocation=%s\tentries=%s", location, len(entries))
+        write_atomically(location, encode_cache(entries))
+    except (TypeError, ValueError, struct.error, IOError, OSError) as error:
+        log.warning("Failed to dump gitmit mtime cache\tlocation=%s\terror=%s", location, error)
 
-    return result
+def export_cached_commit_times(root_folder, fileobj):
+    """Write the cache as json to this file object"""
+    json.dump({"version": VERSION, "entries": get_all_cached_commit_times(root_folder)}, fileobj, indent=2, sort_keys=True)
 
-def get_cached_commit_times(root_folder, parent_dir, sorted_relpaths):
+def next_use(entries):
+    """Return a last_used for an entry that is after the last_used of every other entry"""
+    latest = max([0] + [item.get("last_used", 0) for item in entries.values()])
+    return max(time.time(), latest + 0.001)
+
+def evict(entries, keep, max_entries, max_bytes):
     """
-    Get the cached commit times for the combination of this parent_dir and relpaths
+    Remove the least recently used entries until there are no more than
+    max_entries and they take no more than max_bytes.
+
+    The entry under ``keep`` is never removed.
+    """
+    total = sum(item.get("size", 0) for item in entries.values())
+    by_use = sorted(entries, key=lambda key: entries[key].get("last_used", 0))
+    for key in by_use:
+        if len(entries) <= max_entries and total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        total -= entries.pop(key).get("size", 0)
+
+def get_cached_commit_times(root_folder, parent_dir, sorted_relpaths, backend="dulwich"):
+    """
+    Get the cached commit times for the combination of this parent_dir, relpaths
+    and backend
 
     Return the commit assigned to this combination and the actual times!
+
+    We only read the index and the entry we want. Using an entry makes it the
+    most recently used, so if it wasn't already we mark_used it once we've
+    finished reading.
     """
-    result = get_all_cached_commit_times(root_folder)
+    location = cache_location(root_folder)
+    key = cache_key(parent_dir, sorted_relpaths, backend)
+
+    try:
+        fle, mapped = opened_cache(location)
+        if fle is None:
+            return None, {}
+
+        try:
+            cache = CacheFile(mapped)
+
+            found = None
+            latest = 0
+            for record in cache.records():
+                if record[1] == key:
+                    found = record
+                else:
+                    latest = max(latest, record[2])
+
+            if found is None:
+                return None, {}
 
-    for item in result:
-        if sorted(item.get("sorted_relpaths", [])) == sorted_relpaths and item.get("parent_dir") == parent_dir:
-            return item.get("commit"), item.get("commit_times")
+            entry = cache.entry(found)
+            if entry["parent_dir"] != parent_dir or entry["backend"] != backend:
+                return None, {}
 
-    return None, {}
+        finally:
+            mapped.close()
+            fle.close()
+    except (CacheFormatError, struct.error, UnicodeDecodeError, IOError, OSError) as error:
+        log.warning("Failed to open gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
+        return None, {}
 
-def set_cached_commit_times(root_folder, parent_dir, first_commit, commit_times, sorted_relpaths):
+    if found[2] <= latest:
+        mark_used(root_folder, key)
+
+    return entry["commit"], entry["commit_times"]
+
+def mark_used(root_folder, key):
     """
-    Set the cached commit times in a json file at cache_location(root_folder)
+    Make the entry under this key the most recently used.
 
-    We first get what is currently in the cache and either modify the existing
-    entry for this combo of parent_dir and sorted_relpaths.
+    Like set_cached_commit_times, we do this while holding the lock and by
+    replacing the cache, so we don't lose what other processes are setting and
+    we never change the file underneath anyone reading it. If the entry has
+    been evicted since we read it, we leave the cache alone.
+    """
+    location = cache_location(root_folder)
 
-    Or add to the entries.
+    try:
+        with locked(location):
+            entries = get_all_cached_commit_times(root_folder)
+            if key in entries:
+                entries[key]["last_used"] = next_use(entries)
+                write_cached_commit_times(root_folder, entries)
+    except (IOError, OSError) as error:
+        log.warning("Failed to lock gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
 
-    We then ensure there's less than 5 entries to keep the cache from growing
-    too large (arbitrary number is arbitrary).
+def get_times_at_commit(root_folder, commit, paths, backend="dulwich"):
+    """
+    Return {path: epoch} for the paths we know the commit time of as of this
+    commit, from any entry found by this backend.
 
-    Finally, we write the cache or issue a warning if we can't.
+    The commit time of a path as of a commit doesn't depend on what other files
+    we were looking for, so this lets us answer one set of files from the
+    entries for other sets of files. We only read the entries for this commit
+    and stop once we've found every path.
     """
-    current = get_all_cached_commit_times(root_folder)
     location = cache_location(root_folder)
+    commit = str(commit)
+    wanted = set(paths)
 
-    found = False
-    for item in current:
-        if sorted(item.get("sorted_relpaths", [])) == sorted_relpaths and item.get("parent_dir") == parent_dir:
-            item["commit_times"] = commit_times
-            item["commit"] = str(first_commit)
-            found = True
-            break
+    try:
+        fle, mapped = opened_cache(location)
+        if fle is None:
+            return {}
+
+        try:
+            cache = CacheFile(mapped)
 
-    if not found:
-        current.append({"commit": str(first_commit), "parent_dir": parent_dir, "commit_times": commit_times, "sorted_relpaths": sorted_relpaths})
+            result = {}
+            for _, _, _, _, backend_string, commit_string, offset, count, _ in cache.records():
+                if len(result) == len(wanted):
+                    break
+                if cache.string(commit_string) != commit or cache.string(backend_string) != backend:
+                    continue
 
-    # Make sure it doesn't grow too big....
-    # Arbitrary number is arbitrary
-    while len(current) > 5:
-        current.pop(0)
+                for path, epoch in cache.commit_times(offset, count).items():
+                    if path in wanted:
+                        result[path] = epoch
+
+            return result
+        finally:
+            mapped.close()
+            fle.close()
+    except (CacheFormatError, struct.error, UnicodeDecodeError, IOError, OSError) as error:
+        log.warning("Failed to open gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
+        return {}
+
+def set_cached_commit_times(root_folder, parent_dir, first_commit, commit_times, sorted_relpaths, max_entries=None, max_bytes=None, backend="dulwich"):
+    """
+    Set the cached commit times in the file at cache_location(root_folder)
+
+    We first lock the cache so that other gitmit processes wait for us, and
+    then get what is currently in the cache and either replace the existing
+    entry for this combo of parent_dir, sorted_relpaths and backend or add a
+    new one.
+    Because we only read the cache once we have the lock, the entries other
+    processes set while we were finding our commit times are kept.
+
+    We then remove the least recently used entries until there are no more
+    than max_entries and they take up no more than max_bytes, which default to
+    default_max_entries and default_max_bytes. The entry we just set is always
+    kept.
+
+    Finally, we write the cache or issue a warning if we can't.
+    """
+    if max_entries is None:
+        max_entries = default_max_entries
+    if max_bytes is None:
+        max_bytes = default_max_bytes
+
+    location = cache_location(root_folder)
+    key = cache_key(parent_dir, sorted_relpaths, backend)
 
     try:
-        log.info("Writing gitmit cached commit_times\tlocation=%s", location)
-        with open(location, "w") as fle:
-            json.dump(current, fle)
-    except (TypeError, ValueError, IOError) as error:
-        log.warning("Failed to dump gitmit mtime cache\tlocation=%s\terror=%s", location, error)
+        with locked(location):
+            entries = get_all_cached_commit_times(root_folder)
+            entries[key] = {"commit": str(first_commit), "parent_dir": parent_dir, "backend": backend, "commit_times": commit_times, "last_used": next_use(entries), "size": entry_size(commit_times)}
 
+            evict(entries, key, max_entries, max_bytes)
+            write_cached_commit_times(root_folder, entries)
+    except (IOError, OSError) as error:
+        log.warning("Failed to lock gitmit cached commit_times\tlocation=%s\terror=%s", location, error)
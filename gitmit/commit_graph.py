@@ -0,0 +1,345 @@
+"""
+Git can keep the parents, tree and commit time of commits in a commit-graph
+file so that it doesn't need to inflate commit objects when it walks history.
+
+This module reads those files (both ``objects/info/commit-graph`` and split
+chains under ``objects/info/commit-graphs``) so we can do the same::
+
+    graph = CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects"))
+    if graph is not None:
+        found = graph.lookup(b"6c463ce367c5d7b26da45be6a67456536d944211")
+        if found is not None:
+            tree, parents, commit_time = found
+
+Note that the commit-graph doesn't hold the timezone of the commit, only the
+commit time in UTC.
+
+If the graph was written with ``--changed-paths`` it also has a Bloom filter
+for each commit of the paths (and the folders of those paths) that are
+different from the first parent of that commit::
+
+    bloom = graph.bloom_filter(b"6c463ce367c5d7b26da45be6a67456536d944211")
+    if bloom is not None and not bloom.contains(("path", "to", "file")):
+        # Definitely not changed in this commit
+
+The files are memory mapped, so we only read the parts of the file we need.
+"""
+from bisect import bisect_left
+import binascii
+import logging
+import struct
+import mmap
+import os
+
+log = logging.getLogger("gitmit.commit_graph")
+
+SIGNATURE = b"CGPH"
+HASH_LENGTH = 20
+
+NO_PARENT = 0x70000000
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+
+header_struct = struct.Struct(">4sBBBB")
+chunk_struct = struct.Struct(">4sQ")
+word_struct = struct.Struct(">I")
+commit_data_struct = struct.Struct(">{0}sIIII".format(HASH_LENGTH))
+bloom_header_struct = struct.Struct(">III")
+
+BLOOM_SEED_ONE = 0x293ae76f
+BLOOM_SEED_TWO = 0x7e646e2c
+BLOOM_VERSIONS = (1, 2)
+
+class CommitGraphError(Exception):
+    pass
+
+def murmur3_32(data, seed, signed=False):
+    """
+    The 32 bit murmur3 hash of some bytes, the same as git uses for Bloom
+    filters.
+
+    Version 1 of git's filters treats bytes as signed chars, which means bytes
+    over 127 are sign extended before they are mixed in. ``signed=True`` does
+    the same so we match what git wrote.
+    """
+    def byte(index):
+        value = data[index]
+        if signed and value > 127:
+            value |= 0xffffff00
+        return value
+
+    def mix(k):
+        k = (k * 0xcc9e2d51) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        return (k * 0x1b873593) & 0xffffffff
+
+    h = seed
+    length = len(data)
+    blocks = length // 4
+
+    for i in range(blocks):
+        start = i * 4
+        k = byte(start) | (byte(start + 1) << 8) | (byte(start + 2) << 16) | (byte(start + 3) << 24)
+        h ^= mix(k & 0xffffffff)
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+
+    tail = length & 3
+    if tail:
+        k = 0
+        start = blocks * 4
+        if tail == 3:
+            k ^= byte(start + 2) << 16
+        if tail >= 2:
+            k ^= byte(start + 1) << 8
+        k ^= byte(start)
+        h ^= mix(k & 0xffffffff)
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h
+
+class BloomFilter(object):
+    """
+    The changed paths Bloom filter for one commit.
+
+    ``key_hashes`` is a dictionary shared between filters so that we only hash
+    each path once for the whole walk.
+    """
+    def __init__(self, data, version, num_hashes, key_hashes):
+        self.data = data
+        self.version = version
+        self.num_hashes = num_hashes
+        self.key_hashes = key_hashes
+
+    def hashes(self, parts):
+        """Return the two murmur3 hashes git would have used for this path"""
+        key = (self.version, parts)
+        found = self.key_hashes.get(key)
+        if found is None:
+            path = "/".join(parts).encode("utf-8")
+            signed = self.version == 1
+            found = self.key_hashes[key] = (murmur3_32(path, BLOOM_SEED_ONE, signed), murmur3_32(path, BLOOM_SEED_TWO, signed))
+        return found
+
+    def contains(self, parts):
+        """
+        Say whether the path with these parts may have changed in this commit.
+
+        False means it definitely didn't change. An empty filter is what git
+        writes when it didn't compute one, so that may contain anything.
+        """
+        bits = len(self.data) * 8
+        if not bits:
+            return True
+
+        first, second = self.hashes(parts)
+        for i in range(self.num_hashes):
+            position = ((first + i * second) & 0xffffffff) % bits
+            if not self.data[position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+class OidList(object):
+    """A sequence over the OIDL chunk of a commit-graph file for use with bisect"""
+    def __init__(self, data, start, count):
+        self.data = data
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        offset = self.start + index * HASH_LENGTH
+        return self.data[offset:offset + HASH_LENGTH]
+
+class GraphFile(object):
+    """
+    A single commit-graph file.
+
+    ``base`` is the number of commits in the graphs that come before this one
+    in a chain, which is added to the positions in this file.
+    """
+    def __init__(self, location, base=0):
+        self.base = base
+        self.location = location
+
+        with open(location, "rb") as fle:
+            self.data = mmap.mmap(fle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < header_struct.size:
+            raise CommitGraphError("File is too small")
+
+        signature, version, hash_version, num_chunks, _ = header_struct.unpack_from(self.data, 0)
+        if signature != SIGNATURE:
+            raise CommitGraphError("Not a commit-graph file")
+        if version != 1 or hash_version != 1:
+            raise CommitGraphError("Unsupported version\tversion={0}\thash_version={1}".format(version, hash_version))
+
+        self.chunks = {}
+        offset = header_struct.size
+        for _ in range(num_chunks):
+            chunk_id, start = chunk_struct.unpack_from(self.data, offset)
+            self.chunks[chunk_id] = start
+            offset += chunk_struct.size
+
+        for required in (b"OIDF", b"OIDL", b"CDAT"):
+            if required not in self.chunks:
+                raise CommitGraphError("Missing the {0} chunk".format(required.decode()))
+
+        fanout = self.chunks[b"OIDF"]
+        self.fanout = struct.unpack_from(">256I", self.data, fanout)
+        self.count = self.fanout[-1]
+        self.oids = OidList(self.data, self.chunks[b"OIDL"], self.count)
+
+        self.bloom_version = None
+        if b"BIDX" in self.chunks and b"BDAT" in self.chunks:
+            version, num_hashes, _ = bloom_header_struct.unpack_from(self.data, self.chunks[b"BDAT"])
+            if version in BLOOM_VERSIONS:
+                self.bloom_version = version
+                self.bloom_num_hashes = num_hashes
+            else:
+                log.warning("Ignoring changed path filters we don't understand\tversion=%s", version)
+
+    def close(self):
+        self.data.close()
+
+    def find(self, raw_oid):
+        """Return the position of this 20 byte oid in the file or None"""
+        first = ord(raw_oid[0:1])
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+
+        index = bisect_left(self.oids, raw_oid, lo, hi)
+        if index < hi and self.oids[index] == raw_oid:
+            return index
+
+    def commit_data(self, index):
+        """Return (raw_tree_oid, first_parent, second_parent, commit_time) for the commit at this index"""
+        offset = self.chunks[b"CDAT"] + index * commit_data_struct.size
+        tree, parent1, parent2, generation, time_low = commit_data_struct.unpack_from(self.data, offset)
+        return tree, parent1, parent2, ((generation & 0x3) << 32) | time_low
+
+    def bloom_data(self, index):
+        """Return the bytes of the Bloom filter for the commit at this index"""
+        bidx = self.chunks[b"BIDX"]
+        start = word_struct.unpack_from(self.data, bidx + (index - 1) * 4)[0] if index else 0
+        end = word_struct.unpack_from(self.data, bidx + index * 4)[0]
+
+        offset = self.chunks[b"BDAT"] + bloom_header_struct.size
+        return self.data[offset + start:offset + end]
+
+    def extra_edges(self, start):
+        """Yield the positions in the EDGE chunk starting at ``start``"""
+        offset = self.chunks[b"EDGE"] + start * 4
+        while True:
+            position, = word_struct.unpack_from(self.data, offset)
+            yield position & ~LAST_EDGE
+            if position & LAST_EDGE:
+                break
+            offset += 4
+
+class CommitGraph(object):
+    """
+    The commit-graph for a repository, made of one or more GraphFile objects,
+    base graph first.
+    """
+    def __init__(self, files):
+        self.files = files
+        self.key_hashes = {}
+
+    @classmethod
+    def for_objects_dir(kls, objects_dir):
+        """
+        Return a CommitGraph for this objects folder or None if there isn't one
+        we can read.
+        """
+        info = os.path.join(objects_dir, "info")
+        single = os.path.join(info, "commit-graph")
+        chain = os.path.join(info, "commit-graphs", "commit-graph-chain")
+
+        try:
+            if os.path.exists(single):
+                return kls([GraphFile(single)])
+
+            if os.path.exists(chain):
+                files = []
+                base = 0
+                with open(chain) as fle:
+                    for line in fle:
+                        line = line.strip()
+                        if line:
+                            graph = GraphFile(os.path.join(info, "commit-graphs", "graph-{0}.graph".format(line)), base=base)
+                            base += graph.count
+                            files.append(graph)
+                return kls(files)
+        except (IOError, OSError, ValueError, struct.error, CommitGraphError) as error:
+            log.warning("Failed to read the commit-graph, not using it\terror=%s", error)
+
+    def close(self):
+        for graph in self.files:
+            graph.close()
+
+    def position(self, oid):
+        """Return (graph, index) for this hex oid or None if it isn't in the graph"""
+        raw_oid = binascii.unhexlify(oid)
+        for graph in self.files:
+            index = graph.find(raw_oid)
+            if index is not None:
+                return graph, index
+
+    def graph_for(self, position):
+        """Return the (graph, index) for a position in the whole chain"""
+        for graph in self.files:
+            if position < graph.base + graph.count:
+                return graph, position - graph.base
+        raise CommitGraphError("Position out of range\tposition={0}".format(position))
+
+    def oid_at(self, position):
+        """Return the hex oid at this position in the whole chain"""
+        graph, index = self.graph_for(position)
+        return binascii.hexlify(graph.oids[index])
+
+    def lookup(self, oid):
+        """
+        Return (tree, parents, commit_time) for this hex oid, or None if the
+        commit isn't in the graph.
+
+        tree and parents are hex oids and commit_time is in UTC.
+        """
+        found = self.position(oid)
+        if found is None:
+            return None
+
+        graph, index = found
+        tree, parent1, parent2, commit_time = graph.commit_data(index)
+
+        positions = []
+        if parent1 != NO_PARENT:
+            positions.append(parent1)
+            if parent2 & EXTRA_EDGES:
+                positions.extend(graph.extra_edges(parent2 & ~EXTRA_EDGES))
+            elif parent2 != NO_PARENT:
+                positions.append(parent2)
+
+        return binascii.hexlify(tree), [self.oid_at(position) for position in positions], commit_time
+
+    def bloom_filter(self, oid):
+        """
+        Return the BloomFilter of changed paths for this hex oid, or None if
+        we don't have one for it.
+        """
+        found = self.position(oid)
+        if found is None:
+            return None
+
+        graph, index = found
+        if graph.bloom_version is None:
+            return None
+
+        return BloomFilter(graph.bloom_data(index), graph.bloom_version, graph.bloom_num_hashes, self.key_hashes)
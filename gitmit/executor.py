@@ -8,9 +8,13 @@ command::
     <timestamp> <file>
     ...
 
+Files are printed as soon as their commit times are found, so the most
+recently changed files tend to come first.
+
 Run gitmit --help to see the options available.
 """
 
+from gitmit.backends import backends, cache_backends, cache_for
 from gitmit.mit import GitTimes
 
 import argparse
@@ -18,6 +22,8 @@ import logging
 import sys
 import os
 
+log = logging.getLogger("gitmit.executor")
+
 def setup_logging(debug=False):
     log = logging.getLogger()
     handler = logging.StreamHandler(stream=sys.stderr)
@@ -25,6 +31,17 @@ def setup_logging(debug=False):
     log.addHandler(handler)
     log.setLevel([logging.INFO, logging.DEBUG][debug])
 
+def fallback_time(value):
+    """Convert the value of --fallback-time into what GitTimes expects"""
+    if value == "oldest":
+        return value
+    if value == "none":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected oldest, none or an epoch, got {0}".format(value))
+
 def main(argv=None):
     parser = argparse.ArgumentParser(description="Tool for finding the commit times of all files under a git repository")
 
@@ -63,17 +80,155 @@ def main(argv=None):
         , action = "store_true"
         )
 
+    parser.add_argument("--cache-max-entries"
+        , help = "The most sets of files to keep commit times for in the cache before forgetting the least recently used"
+        , type = int
+        )
+
+    parser.add_argument("--cache-max-bytes"
+        , help = "Roughly how many bytes the cache can take up before we forget the least recently used commit times"
+        , type = int
+        )
+
+    parser.add_argument("--cache-backend"
+        , help = "Where to keep the cache of commit times, either in one file or in a SQLite database"
+        , choices = cache_backends
+        , default = "file"
+        )
+
+    parser.add_argument("--cache-dir"
+        , help = "A folder to share commit times between clones of the repository. Defaults to $XDG_CACHE_HOME/gitmit if no folder is given"
+        , nargs = "?"
+        , const = True
+        )
+
+    parser.add_argument("--cache-dir-max-bytes"
+        , help = "Roughly how many bytes the --cache-dir can take up before we forget the least recently used commit times. Defaults to 1GB"
+        , type = int
+        )
+
+    parser.add_argument("--evict-cache"
+        , help = "Remove the least recently used commit times from the --cache-dir until it takes up no more than --cache-dir-max-bytes and exit"
+        , action = "store_true"
+        )
+
+    parser.add_argument("--export-cache"
+        , help = "Write the cache of commit times as json to this file and exit. Use - for stdout"
+        )
+
+    parser.add_argument("--backend"
+        , help = "How to find commit times, either by walking the objects with dulwich or by reading the output of the git binary"
+        , choices = backends
+        , default = "dulwich"
+        )
+
+    parser.add_argument("--first-parent"
+        , help = "Only follow the first parent of merge commits"
+        , action = "store_true"
+        )
+
+    parser.add_argument("--max-commits"
+        , help = "The most commits to look at before giving up on the files we haven't found"
+        , type = int
+        )
+
+    parser.add_argument("--since"
+        , help = "An epoch to stop looking at commits older than"
+        , type = int
+        )
+
+    parser.add_argument("--fallback-time"
+        , help = "The time to give files not found because of --max-commits or --since. Either oldest for the time of the oldest commit we looked at, none to give them no time, or an epoch"
+        , type = fallback_time
+        , default = "oldest"
+        )
+
+    parser.add_argument("--apply"
+        , help = "Set the modified time of each file to its commit time instead of printing the times"
+        , action = "store_true"
+        )
+
+    parser.add_argument("--workers"
+        , help = "The number of threads to use with --apply"
+        , type = int
+        )
+
+    parser.add_argument("--stats"
+        , help = "Print counts of what we did and how long each part took to stderr when we're done"
+        , action = "store_true"
+        )
+
+    parser.add_argument("--trace"
+        , help = "Write a timeline of what we did to this file, which can be opened in chrome://tracing or https://ui.perfetto.dev"
+        )
+
+    parser.add_argument("--tar"
+        , help = "Write a tar archive of the files with their commit times as mtimes to this file instead of printing the times. Use - for stdout"
+        )
+
     args = parser.parse_args(argv)
     setup_logging(debug=args.debug)
 
+    cache_dir = args.cache_dir
+    if cache_dir is True or (args.evict_cache and cache_dir is None):
+        from gitmit.shared_cache import default_cache_dir
+        cache_dir = default_cache_dir()
+
+    if args.evict_cache:
+        from gitmit.shared_cache import evict_shared_cache
+        removed = evict_shared_cache(cache_dir, max_bytes=args.cache_dir_max_bytes)
+        log.info("Evicted shared cache\tcache_dir=%s\tremoved=%s", cache_dir, removed)
+        return
+
+    if args.export_cache:
+        cache = cache_for(args.cache_backend)
+        if args.export_cache == "-":
+            cache.export_cached_commit_times(args.root_folder, sys.stdout)
+        else:
+            with open(args.export_cache, "w") as fle:
+                cache.export_cached_commit_times(args.root_folder, fle)
+        return
+
     timestamps_for = args.timestamps_for
     if not timestamps_for:
         timestamps_for = True
 
-    commit_times = GitTimes(args.root_folder, args.consider, timestamps_for, args.include, args.exclude, with_cache=not args.no_cache, debug=args.debug)
-    results = commit_times.find()
-    for key, epoch in results:
-        print("{0} {1}".format(epoch, key))
+    tracer = None
+    if args.trace:
+        from gitmit.trace import Tracer
+        tracer = Tracer()
+
+    commit_times = GitTimes(args.root_folder, args.consider, timestamps_for, args.include, args.exclude, with_cache=not args.no_cache, debug=args.debug, backend=args.backend
+        , first_parent=args.first_parent, max_commits=args.max_commits, since=args.since, fallback_time=args.fallback_time
+        , tracer=tracer, cache_max_entries=args.cache_max_entries, cache_max_bytes=args.cache_max_bytes
+        , cache_backend=args.cache_backend, cache_dir=cache_dir, shared_cache_max_bytes=args.cache_dir_max_bytes
+        )
+
+    if args.apply:
+        applied = commit_times.apply(workers=args.workers)
+        log.info("Set modified times\tchanged=%s\tunchanged=%s\tmissing=%s\tfailed=%s", applied.changed, applied.unchanged, applied.missing, applied.failed)
+
+    elif args.tar:
+        if args.tar == "-":
+            count = commit_times.write_tar(getattr(sys.stdout, "buffer", sys.stdout))
+        else:
+            with open(args.tar, "wb") as fileobj:
+                count = commit_times.write_tar(fileobj)
+        log.info("Wrote tar\tlocation=%s\tmembers=%s", args.tar, count)
+
+    else:
+        # Print what we find as soon as we find it
+        for batch in commit_times.find_batches():
+            for key, epoch in batch:
+                print("{0} {1}".format(epoch, key))
+            sys.stdout.flush()
+
+    if args.stats:
+        sys.stderr.write(commit_times.stats.report())
+
+    if tracer is not None:
+        tracer.save(args.trace)
+        log.info("Wrote trace\tlocation=%s\tevents=%s", args.trace, len(tracer.events))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,175 @@
+"""
+A shortcut for when nothing has changed since we last found commit times.
+
+Finding commit times from the cache still means opening the repository with
+dulwich, reading every entry in the index, filtering them and looking for files
+under symlinked folders before we can even look in the cache. When gitmit is
+called many times in a row by a build, that start up cost is most of the time
+gitmit takes.
+
+So once we have found every commit time, we also remember the result under a
+key made from:
+
+* The oid of HEAD, read straight from ``.git/HEAD`` and the loose or packed ref
+  it points to
+* The size and modified time of ``.git/index``
+* The parent_dir, timestamps_for, include, exclude and backend we were given
+
+The next time we're asked for the same thing, we make that key again, which
+only needs a few small files to be read, and if it matches we give back what
+we remembered without importing dulwich or reading the index.
+
+Changing the files in the working tree doesn't change their commit times, and
+adding or removing files from git changes the index, so the key only changes
+when the result could.
+
+The results are stored in ``.git/gitmit_fast_path.json`` and only for the
+current HEAD and index. As soon as either changes, the results for the old
+ones are thrown away.
+"""
+from gitmit.atomic import write_atomically, locked
+
+import logging
+import json
+import os
+
+log = logging.getLogger("gitmit.fast_path")
+
+# Arbitrary number is arbitrary
+max_entries = 50
+
+def fast_path_location(root_folder):
+    """
+    Return us the location of the fast path results
+
+    This is <root_folder>/.git/gitmit_fast_path.json
+    """
+    return os.path.join(root_folder, ".git", "gitmit_fast_path.json")
+
+def read_ref(git_dir, ref):
+    """Return the oid this ref points at, looking at loose refs and then packed-refs"""
+    try:
+        with open(os.path.join(git_dir, ref)) as fle:
+            return fle.read().strip()
+    except (IOError, OSError):
+        pass
+
+    try:
+        with open(os.path.join(git_dir, "packed-refs")) as fle:
+            for line in fle:
+                if line.startswith(("#", "^")):
+                    continue
+                parts = line.strip().split(" ", 1)
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except (IOError, OSError):
+        pass
+
+    return None
+
+def read_head(git_dir):
+    """
+    Return the oid of HEAD without using dulwich, or None if we can't work it
+    out, for example for a branch with no commits yet.
+    """
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as fle:
+            head = fle.read().strip()
+    except (IOError, OSError):
+        return None
+
+    # Follow symbolic refs, but not forever
+    for _ in range(5):
+        if not head.startswith("ref: "):
+            break
+        head = read_ref(git_dir, head[5:].strip())
+        if head is None:
+            return None
+
+    if len(head) != 40:
+        return None
+    return head
+
+def fast_path_key(root_folder, parent_dir, timestamps_for, include, exclude, backend="dulwich"):
+    """
+    Return the key for finding commit times with these options in this
+    repository as it is right now, or None if we can't make one.
+    """
+    git_dir = os.path.join(root_folder, ".git")
+    if not os.path.isdir(git_dir):
+        return None
+
+    head = read_head(git_dir)
+    if head is None:
+        return None
+
+    try:
+        index = os.stat(os.path.join(git_dir, "index"))
+    except OSError:
+        return None
+
+    # We compare the options as json rather than a digest, so we don't need to import hashlib
+    options = json.dumps([parent_dir, timestamps_for, include, exclude, backend], sort_keys=True)
+    return {"head": head, "index": [index.st_size, index.st_mtime_ns], "options": options}
+
+def read_fast_path(root_folder):
+    """Return what is stored for the fast path, or None if there's nothing usable"""
+    location = fast_path_location(root_folder)
+    if not os.path.exists(location):
+        return None
+
+    try:
+        with open(location) as fle:
+            stored = json.load(fle)
+    except (TypeError, ValueError, IOError, OSError) as error:
+        log.warning("Failed to open gitmit fast path results\tlocation=%s\terror=%s", location, error)
+        return None
+
+    if type(stored) is not dict or type(stored.get("entries")) is not list:
+        log.warning("Gitmit fast path results need to be a dictionary with a list of entries\tlocation=%s", location)
+        return None
+
+    return stored
+
+def get_fast_path(root_folder, key):
+    """
+    Return the list of (relpath, epoch) stored for this key, or None if there
+    isn't one.
+    """
+    stored = read_fast_path(root_folder)
+    if stored is None or stored.get("head") != key["head"] or stored.get("index") != key["index"]:
+        return None
+
+    for entry in stored["entries"]:
+        if type(entry) is dict and entry.get("options") == key["options"]:
+            return [tuple(item) for item in entry.get("results", [])]
+
+    return None
+
+def set_fast_path(root_folder, key, results):
+    """
+    Store this list of (relpath, epoch) for this key.
+
+    Results for other options are kept if they were for the same HEAD and
+    index, and thrown away otherwise.
+
+    We hold a lock while we read, change and write the file so that gitmit
+    processes using different options at the same time keep each other's
+    results.
+    """
+    location = fast_path_location(root_folder)
+
+    try:
+        with locked(location):
+            entries = []
+            stored = read_fast_path(root_folder)
+            if stored is not None and stored.get("head") == key["head"] and stored.get("index") == key["index"]:
+                entries = [entry for entry in stored["entries"] if type(entry) is dict and entry.get("options") != key["options"]]
+
+            entries.append({"options": key["options"], "results": [list(item) for item in results]})
+            while len(entries) > max_entries:
+                entries.pop(0)
+
+            write_atomically(location, json.dumps({"head": key["head"], "index": key["index"], "entries": entries}).encode("utf-8"))
+    except (TypeError, ValueError, IOError, OSError) as error:
+        log.warning("Failed to write gitmit fast path results\tlocation=%s\terror=%s", location, error)
@@ -0,0 +1,180 @@
+"""
+The ``timestamps_for``, ``exclude`` and ``include`` globs compiled so we can
+check files against them quickly::
+
+    filters = Filters(timestamps_for=["src/*"], exclude=["*.pyc"], include=None)
+
+    filters.accepts("src/one.py") == True
+    filters.accepts("src/one.pyc") == False
+
+We can also ask about a whole folder at a time::
+
+    filters.folder_verdict("docs") == False
+    filters.folder_verdict("src") is None
+
+Where True means every file under the folder is accepted, False means no file
+under the folder is accepted, and None means we have to look at each file.
+
+The rules are the same as gitmit.mit.GitTimes#is_filtered always had:
+
+* A file must match timestamps_for if it is a list
+* Then anything matching exclude is removed
+* Then anything matching include is added back
+
+And if there is include but no exclude, only files matching include are
+accepted.
+
+Globs use the same rules as fnmatch, which means ``*`` also matches slashes.
+"""
+import fnmatch
+import re
+import os
+
+wildcards = re.compile(r"[*?\[]")
+
+def either(one, two):
+    """Or for True, False and None (for don't know)"""
+    if one is True or two is True:
+        return True
+    if one is False and two is False:
+        return False
+    return None
+
+def both(one, two):
+    """And for True, False and None (for don't know)"""
+    if one is False or two is False:
+        return False
+    if one is True and two is True:
+        return True
+    return None
+
+def negate(value):
+    """Not for True, False and None (for don't know)"""
+    if value is None:
+        return None
+    return not value
+
+class Globs(object):
+    """
+    A list of globs compiled into one regex.
+
+    We also remember the literal part of each glob before any wildcards, so
+    we can tell when a glob can't match anything in a folder, or when it must
+    match everything in a folder.
+    """
+    def __init__(self, globs):
+        self.globs = [os.path.normcase(glob) for glob in globs]
+        self.regex = None
+        if self.globs:
+            self.regex = re.compile("(?:{0})".format("|".join(fnmatch.translate(glob) for glob in self.globs)))
+
+        # (literal, is_exact, only_stars) for each glob
+        self.literals = []
+        for glob in self.globs:
+            found = wildcards.search(glob)
+            if found is None:
+                self.literals.append((glob, True, False))
+            else:
+                self.literals.append((glob[:found.start()], False, glob[found.start():].strip("*") == ""))
+
+    def __bool__(self):
+        return bool(self.globs)
+    __nonzero__ = __bool__
+
+    def matches(self, relpath):
+        """Say whether this relpath matches any of the globs"""
+        return self.regex is not None and self.regex.match(os.path.normcase(relpath)) is not None
+
+    def folder_verdict(self, folder):
+        """
+        Return True if every path under this folder matches, False if nothing
+        under this folder can match, or None if we don't know.
+
+        folder is relative and has no trailing slash, with "" for the top.
+        """
+        start = os.path.normcase(folder + "/") if folder else ""
+
+        verdict = False
+        for literal, is_exact, only_stars in self.literals:
+            if not is_exact and start.startswith(literal):
+                # The literal part is the folder or above it
+                if only_stars:
+                    return True
+                verdict = None
+            elif literal.startswith(start):
+                # The literal part is inside the folder
+                verdict = None
+
+        return verdict
+
+class Filters(object):
+    """
+    Holds the compiled timestamps_for, exclude and include globs.
+
+    timestamps_for is only used if it's a list, which is the same as
+    GitTimes always did.
+    """
+    def __init__(self, timestamps_for, exclude, include):
+        self.timestamps_for = None
+        if timestamps_for is not None and type(timestamps_for) is list:
+            self.timestamps_for = Globs(timestamps_for)
+
+        self.exclude = Globs(exclude or [])
+        self.include = Globs(include or [])
+
+        # Matched is true by default if
+        # * Have exclude
+        # * No exclude and no include
+        self.default = bool(self.exclude) or not any([self.exclude, self.include])
+
+        self.verdicts = {}
+
+    def accepts(self, relpath):
+        """Say whether we want this relpath"""
+        if relpath.startswith("../"):
+            return False
+
+        if self.timestamps_for is not None and not self.timestamps_for.matches(relpath):
+            return False
+
+        if self.include and self.include.matches(relpath):
+            return True
+
+        return self.default and not (self.exclude and self.exclude.matches(relpath))
+
+    def folder_verdict(self, folder):
+        """
+        Return True if every file under this folder is accepted, False if
+        none are, and None if we need to look at each file.
+
+        folder is relative and has no trailing slash, with "" for the top.
+
+        We remember the verdict for each folder, and a folder gets the verdict
+        of its parent folder if that parent has already been decided.
+        """
+        if folder == ".." or folder.startswith("../"):
+            return False
+
+        if folder in self.verdicts:
+            return self.verdicts[folder]
+
+        verdict = None
+        if folder:
+            verdict = self.folder_verdict(os.path.dirname(folder))
+
+        if verdict is None:
+            verdict = self.compute_folder_verdict(folder)
+
+        self.verdicts[folder] = verdict
+        return verdict
+
+    def compute_folder_verdict(self, folder):
+        """Work out folder_verdict for this folder from the globs"""
+        wanted = True
+        if self.timestamps_for is not None:
+            wanted = self.timestamps_for.folder_verdict(folder)
+
+        excluded = self.exclude.folder_verdict(folder) if self.exclude else False
+        included = self.include.folder_verdict(folder) if self.include else False
+
+        return both(wanted, either(included, both(self.default, negate(excluded))))
@@ -0,0 +1,353 @@
+"""
+A backend that gets commit times by reading the output of the git binary
+rather than by walking the objects ourselves.
+
+We stream the output of::
+
+    $ git log -m --raw -z --no-renames --pretty=raw HEAD
+
+and stop the process as soon as we have found all the files we care about.
+
+``-m`` means merge commits are shown once for each parent that they are
+different from, with the files that are different from that parent, and
+``--pretty=raw`` says which parent that is.
+
+Like the dulwich backend, and ``git log -- <file>`` for one file, we simplify
+history one file at a time. A file that is the same in a merge as it is in one
+of the parents is only looked for in the first such parent, and a merge is only
+where a file changed if it's different from all of the parents. We can't ask
+git to do this for us, because git simplifies history for all the files in
+the pathspec at once.
+
+When we only follow first parents we add ``--first-parent``, so merges are
+compared against just their first parent.
+"""
+from gitmit.stats import Stats
+
+import subprocess
+import logging
+import os
+
+log = logging.getLogger("gitmit.git_log")
+
+class GitError(Exception):
+    pass
+
+def timezone_offset(timezone):
+    """Return the number of seconds in a timezone like +1100"""
+    offset = int(timezone[1:3]) * 3600 + int(timezone[3:5]) * 60
+    if timezone.startswith(b"-"):
+        offset = -offset
+    return offset
+
+def parse_header(token):
+    """
+    Return (commit_oid, commit_time, parents, from_parent, raw) from the
+    header git log gives us for a commit with ``--pretty=raw``.
+
+    from_parent is the parent that the diff after the header is against, which
+    git only says for merges. raw is the first raw diff line, which comes in
+    the same token as the header when there is one.
+    """
+    lines = token.split(b"\n")
+    raw = lines.pop() if lines[-1].startswith(b":") else None
+
+    first = lines[0].split(b" ")
+    commit = first[1].decode()
+    from_parent = first[3].rstrip(b")").decode() if len(first) > 3 and first[2] == b"(from" else None
+
+    parents = []
+    commit_time = None
+    for line in lines[1:]:
+        if not line:
+            break
+
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode())
+        elif line.startswith(b"committer "):
+            epoch, timezone = line.rsplit(b" ", 2)[1:]
+            commit_time = int(epoch) - timezone_offset(timezone)
+
+    return commit, commit_time, parents, from_parent, raw
+
+def parse_log(chunks):
+    """
+    Yield (commit_oid, commit_time, parents, diffs) from chunks of bytes from
+    git log.
+
+    The output is a stream of null separated tokens. Each commit starts with a
+    header from ``--pretty=raw``, then pairs of a raw diff line (starting with
+    a colon) and the path it is for. Merges are shown once for each parent
+    they are different from.
+
+    diffs is a dictionary of the parent oid to the paths that are different
+    from that parent. When git doesn't say which parent the diff is against,
+    it is against the first parent, or None for a commit without parents.
+    Parents that aren't in diffs are the same as the commit.
+
+    Deleted paths aren't included in diffs.
+
+    commit_time takes the timezone into account in the same way as the dulwich
+    backend.
+    """
+    commit = None
+    commit_time = None
+    parents = []
+    diffs = {}
+    paths = None
+    deleted = False
+    state = "header"
+    remainder = b""
+
+    def start_diff(raw):
+        # The number of colons is the number of parents
+        # And the mode after the parent modes is the mode of the result
+        colons = len(raw) - len(raw.lstrip(b":"))
+        return raw[colons:].split(b" ")[colons] == b"000000"
+
+    for chunk in chunks:
+        tokens = (remainder + chunk).split(b"\0")
+        remainder = tokens.pop()
+
+        for token in tokens:
+            if state == "path":
+                if not deleted:
+                    paths.append(token.decode())
+                state = "body"
+                continue
+
+            token = token.lstrip(b"\n")
+            if not token:
+                continue
+
+            if state == "body" and token.startswith(b":"):
+                deleted = start_diff(token)
+                state = "path"
+                continue
+
+            found, found_time, found_parents, from_parent, raw = parse_header(token)
+            if found != commit:
+                if commit is not None:
+                    yield commit, commit_time, parents, diffs
+                commit, commit_time, parents, diffs = found, found_time, found_parents, {}
+
+            if from_parent is None:
+                from_parent = parents[0] if parents else None
+            paths = diffs.setdefault(from_parent, [])
+
+            state = "body"
+            if raw is not None:
+                deleted = start_diff(raw)
+                state = "path"
+
+    if commit is not None:
+        yield commit, commit_time, parents, diffs
+
+class GitLogRepo(object):
+    """
+    Knows the same things as gitmit.repo.Repo but uses the git binary to
+    find them:
+
+    * How to get all the files in the repository
+    * How to get the oid of HEAD
+    * How to get the commit times of the files we want commit times for
+    """
+    def __init__(self, root_folder, git="git"):
+        self.git = git
+        self.root_folder = root_folder
+
+    def run(self, *args):
+        """Run git with these arguments and return the output"""
+        process = subprocess.Popen((self.git, ) + args, cwd=self.root_folder, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode != 0:
+            raise GitError("Failed to run git {0}: {1}".format(" ".join(args), err.decode().strip()))
+        return out
+
+    def all_files(self):
+        """Return a set of all the files under git control"""
+        return set(path.decode() for path in self.run("ls-files", "-z").split(b"\0") if path)
+
+    @property
+    def first_commit(self):
+        """Return the oid of HEAD"""
+        return self.run("rev-parse", "HEAD").strip().decode()
+
+    def is_ancestor(self, ancestor):
+        """Say whether the commit at ``ancestor`` is reachable from HEAD"""
+        if isinstance(ancestor, bytes):
+            ancestor = ancestor.decode()
+
+        with open(os.devnull, "w") as devnull:
+            return subprocess.call([self.git, "merge-base", "--is-ancestor", ancestor, "HEAD"], cwd=self.root_folder, stdout=devnull, stderr=devnull) == 0
+
+    def changed_since(self, ancestor, use_files_paths):
+        """
+        Return the set of use_files_paths that aren't the same at HEAD as they
+        were at the commit ``ancestor``, including files that weren't there.
+        """
+        if isinstance(ancestor, bytes):
+            ancestor = ancestor.decode()
+
+        out = self.run("diff", "--name-only", "-z", "--no-renames", ancestor, "HEAD", "--")
+        return set(path.decode() for path in out.split(b"\0") if path) & set(use_files_paths)
+
+    def file_commit_times(self, use_files_paths, debug=False, exclude=None, first_parent=False, max_commits=None, since=None, stats=None):
+        """
+        Read the output of git log until we have found the commit times for all
+        the files we care about.
+
+        Yield (commit_oid, commit_time, paths) for the commits that changed
+        files we care about, with each file only yielded once.
+
+        We keep the files we are looking for against the commit we are looking
+        for them in, starting with HEAD. A commit that isn't a merge passes on
+        the files it didn't change to its parent, and a merge passes each file
+        to the first parent it is the same as. See split_merge.
+
+        git shows a commit once all of its children have been shown, unless
+        the commit times are out of order. If a file is passed on to a commit
+        git has already shown, we ask git for that file on its own at the end.
+
+        If ``exclude`` is a list of commit oids, then those commits and their
+        ancestors are not traversed.
+
+        ``first_parent``, ``max_commits`` and ``since`` are passed on to git
+        log. If the walk is bounded by max_commits or since and there are files
+        we didn't find, then finally we yield (None, commit_time, remaining_paths)
+        where commit_time is the time of the last commit git showed us.
+
+        If ``stats`` is a gitmit.stats.Stats then we count the commits git
+        showed us and how many files each one resolved in it. If the stats have
+        a tracer, we also add the batches of commits to the trace.
+        """
+        if stats is None:
+            stats = Stats()
+
+        tracer = stats.tracer
+        remaining = len(use_files_paths)
+
+        excludes = ["^{0}".format(oid.decode() if isinstance(oid, bytes) else oid) for oid in exclude or []]
+        options = []
+        if first_parent:
+            options.append("--first-parent")
+        if since is not None:
+            options.append("--since=@{0}".format(since))
+
+        cmd = [self.git, "log", "-m", "--raw", "-z", "--no-renames", "--pretty=raw", "--no-decorate", "--no-show-signature"] + options
+        if max_commits is not None:
+            cmd.append("--max-count={0}".format(max_commits))
+        cmd.extend(["HEAD"] + excludes + ["--"])
+
+        # The files we are looking for in each commit, and the commits git has shown us
+        pending = {}
+        shown = set()
+        lost = []
+
+        def route(parent, paths):
+            """Look for these paths in this parent"""
+            if not paths:
+                return
+
+            if parent in shown:
+                lost.append((parent, paths))
+                return
+
+            existing = pending.get(parent)
+            if existing is None:
+                pending[parent] = paths
+            elif len(existing) < len(paths):
+                paths.update(existing)
+                pending[parent] = paths
+            else:
+                existing.update(paths)
+
+        head = self.first_commit
+        pending[head] = set(use_files_paths)
+
+        process = subprocess.Popen(cmd, cwd=self.root_folder, stdout=subprocess.PIPE)
+        fileno = process.stdout.fileno()
+        oldest = None
+
+        try:
+            for commit, commit_time, parents, diffs in parse_log(iter(lambda: os.read(fileno, 65536), b"")):
+                oldest = commit_time
+                stats.commits_walked += 1
+                shown.add(commit)
+
+                difference = []
+                wanted = pending.pop(commit, None)
+                if wanted:
+                    if first_parent:
+                        parents = parents[:1]
+                    difference = self.split_merge(wanted, parents, diffs, route)
+
+                if tracer is not None:
+                    remaining -= len(difference)
+                    tracer.walked_commit(len(difference), remaining)
+
+                if difference:
+                    stats.resolved_files(len(difference))
+                    yield commit, commit_time, difference
+
+                # If nothing remains, then we don't need git log anymore
+                if not pending:
+                    break
+        finally:
+            if tracer is not None:
+                tracer.finish_batch(remaining)
+
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+        for parent, paths in lost:
+            for path in sorted(paths):
+                out = self.run(*(["log", "-1", "--no-show-signature", "--date=raw", "--format=%H%x00%cd"] + options + [parent] + excludes + ["--", path])).strip()
+                if out:
+                    found, date = out.split(b"\0")
+                    epoch, timezone = date.split(b" ")
+                    yield found.decode(), int(epoch) - timezone_offset(timezone), [path]
+                else:
+                    pending.setdefault(parent, set()).add(path)
+
+        left = sorted(path for paths in pending.values() for path in paths)
+        if left and (max_commits is not None or since is not None):
+            yield None, oldest, left
+
+    def split_merge(self, wanted, parents, diffs, route):
+        """
+        Return the files in ``wanted`` that are different in a commit from all
+        of its ``parents``, and route the rest of the files to the first parent
+        each one is the same as.
+
+        diffs is a dictionary of parent oid to the files that are different from
+        that parent, see parse_log. A commit without parents is different for
+        every file it has.
+        """
+        if not parents:
+            return [path for path in diffs.get(None, ()) if path in wanted]
+
+        first = [path for path in diffs.get(parents[0], ()) if path in wanted]
+        if len(parents) == 1:
+            wanted.difference_update(first)
+            route(parents[0], wanted)
+            return first
+
+        found = []
+        others = [set() for _ in parents]
+        changed = [set(diffs.get(parent, ())) for parent in parents]
+        for path in first:
+            wanted.discard(path)
+            for index in range(1, len(parents)):
+                if path not in changed[index]:
+                    others[index].add(path)
+                    break
+            else:
+                found.append(path)
+
+        route(parents[0], wanted)
+        for index in range(1, len(parents)):
+            route(parents[index], others[index])
+        return found
@@ -0,0 +1,53 @@
+"""
+A small bounded least recently used cache that counts hits and misses::
+
+    memo = LRU(2)
+    memo.set("one", 1)
+    memo.set("two", 2)
+
+    memo.get("one") == 1
+    memo.set("three", 3)
+
+    memo.get("two") is None
+
+    memo.hits == 1
+    memo.misses == 1
+"""
+from collections import OrderedDict
+
+class LRU(object):
+    """
+    Holds up to ``max_size`` items and forgets the least recently used item
+    when there are too many.
+
+    ``hits`` and ``misses`` count how many times ``get`` did and didn't find
+    what it was asked for.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        """Return the value for this key and mark it as recently used"""
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.items[key] = value
+        return value
+
+    def set(self, key, value):
+        """Remember this value and forget the oldest values if we have too many"""
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
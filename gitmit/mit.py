@@ -2,13 +2,16 @@
 Knows how to get the commit times for the files under a repository.
 
 Taking into account symlinkd files, includes, excludes and a cache.
+
+Only what the fast path needs is imported with this module. Everything else,
+including dulwich, is imported when it's first used so that calling gitmit
+when nothing has changed stays quick. See gitmit.fast_path.
 """
 
-from gitmit.cache import get_cached_commit_times, set_cached_commit_times
-from gitmit.repo import Repo
+from gitmit.fast_path import fast_path_key, get_fast_path, set_fast_path
+from gitmit.stats import Stats
 
-from collections import namedtuple
-import fnmatch
+from collections import namedtuple, defaultdict
 import logging
 import json
 import os
@@ -40,19 +43,73 @@ class GitTimes(object):
     times under the .git folder and use them instead of trying to find the
     commit times each time.
 
-    The cache is invalidated when the parent_dir and files to find change.
+    When the cache doesn't have an entry for our parent_dir and files at HEAD,
+    we use the commit times other filters found at HEAD and only walk for the
+    files they didn't have.
+
+    The cache keeps an entry for each parent_dir and set of files to find, and
+    throws away the least recently used entries when there are more than
+    ``cache_max_entries`` or they take up more than ``cache_max_bytes``. See
+    gitmit.cache for the defaults.
+
+    ``cache_dir`` is an optional folder that is shared between clones of the
+    repository. Commit times found in any clone are kept there by commit and
+    set of files, so a fresh clone at a commit we've seen before doesn't need
+    to walk. The least recently used files are removed when they take up more
+    than ``shared_cache_max_bytes``, which is separate from the budget of the
+    cache under the .git folder. Shallow clones don't use it. See
+    gitmit.shared_cache.
+
+    When HEAD, the git index and our filters are the same as the last time we
+    found every commit time, we skip straight to the answer without reading the
+    index or opening the repository. See gitmit.fast_path.
+
+    ``with_cache`` also means we keep the decoded entries of the trees we look
+    at under the .git folder, so they don't need to be decoded again.
+
+    ``backend`` is the name of the backend used to find commit times, and
+    ``cache_backend`` is the name of the backend for the cache of commit times,
+    see gitmit.backends for the options.
+
+    ``first_parent`` means we only follow the first parent of merges.
+
+    ``max_commits`` and ``since`` bound how far back we look, as a number of
+    commits and an epoch respectively. Files we don't find in a bounded walk
+    are given ``fallback_time``, which is either an epoch, "oldest" for the
+    time of the oldest commit we looked at, or None to give them no time.
+
+    Walks with any of these options don't use or change the cache of commit
+    times, because they can give different times than a full walk.
+
+    Each time we find commit times we start a new gitmit.stats.Stats in
+    ``self.stats`` that counts what we did and how long each part took.
+
+    ``tracer`` is an optional gitmit.trace.Tracer that we add a timeline of
+    what we did to.
     """
-    def __init__(self, root_folder, parent_dir, timestamps_for=None, include=None, exclude=None, silent=False, with_cache=True, debug=False):
+    def __init__(self, root_folder, parent_dir, timestamps_for=None, include=None, exclude=None, silent=False, with_cache=True, debug=False, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None):
         self.debug = debug
+        self.since = since
         self.silent = silent
+        self.backend = backend
         self.include = include
         self.exclude = exclude
         self.with_cache = with_cache
         self.parent_dir = parent_dir
+        self.max_commits = max_commits
         self.root_folder = root_folder
+        self.first_parent = first_parent
+        self.fallback_time = fallback_time
         self.timestamps_for = timestamps_for
+        self.tracer = tracer
+        self.cache_dir = cache_dir
+        self.shared_cache_max_bytes = shared_cache_max_bytes
+        self.cache_backend = cache_backend
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_max_entries = cache_max_entries
 
         self.relpath_cache = {}
+        self.stats = Stats(tracer=tracer)
 
     def relpath_for(self, path):
         """Find the relative path from here from the parent_dir"""
@@ -76,19 +133,109 @@ class GitTimes(object):
         Find all the files we want to find commit times for, and any extra files
         under symlinks.
 
-        Then find the commit times for those files and return a dictionary of
-        {relative_path: commit_time_as_epoch}
+        Then find the commit times for those files and yield
+        (relative_path, commit_time_as_epoch) as we find them.
+        """
+        for batch in self.find_batches():
+            for relpath, commit_time in batch:
+                yield relpath, commit_time
+
+    def find_batches(self):
+        """
+        Like find, but yield lists of (relative_path, commit_time_as_epoch),
+        one list for each commit that we find commit times from.
+        """
+        key = self.fast_path_key()
+        if key is not None:
+            results = get_fast_path(self.root_folder, key)
+            if results is not None:
+                if not self.silent:
+                    log.info("Using commit times from the fast path\thead=%s\tfiles=%s", key["head"], len(results))
+                self.stats = Stats(tracer=self.tracer)
+                self.stats.cache = "fast"
+                return self.stats.consumed("output", [results] if results else [])
+
+        git, use_files = self.files_to_find()
+        batches = self.commit_time_batches_for(git, use_files)
+        if key is not None:
+            batches = self.remember_fast_path(key, batches)
+        return self.stats.consumed("output", batches)
+
+    def fast_path_key(self):
+        """
+        Return the key for the fast path if we can use it, which is only when
+        we're using the cache and not doing a bounded walk.
+        """
+        if not self.with_cache or any([self.first_parent, self.max_commits is not None, self.since is not None]):
+            return None
+        return fast_path_key(self.root_folder, self.parent_dir, self.timestamps_for, self.include, self.exclude, self.backend)
+
+    def remember_fast_path(self, key, batches):
+        """Yield the batches and remember all of them for the fast path once they're all found"""
+        results = []
+        for batch in batches:
+            results.extend(batch)
+            yield batch
+
+        with self.stats.timing("cache"):
+            set_fast_path(self.root_folder, key, results)
+
+    def apply(self, workers=None):
+        """
+        Set the modified time of each file we find to its commit time and
+        return a gitmit.apply.Applied saying how many files were changed,
+        already had the right time, didn't exist or failed.
+
+        ``workers`` is the number of threads used to set the times.
+        """
+        from gitmit.apply import apply_mtimes
+        folder = os.path.join(self.root_folder, self.parent_dir)
+        return apply_mtimes(folder, self.find_batches(), workers=workers)
+
+    def write_tar(self, fileobj):
         """
-        mtimes = {}
+        Write a tar archive of the files we find to fileobj, with the mtime of
+        each file set to its commit time, and return how many members were
+        written. See gitmit.tar.
+
+        The order we find commit times in depends on whether they came from a
+        cache or a walk, so we find all of them first and write the members in
+        order of their path. That way the archive has the same bytes no matter
+        how the commit times were found.
+        """
+        from gitmit.tar import write_tar
+        folder = os.path.join(self.root_folder, self.parent_dir)
+        return write_tar(folder, sorted(self.find()), fileobj)
+
+    def files_to_find(self):
+        """
+        Return (git, use_files) where git is the backend for our repository and
+        use_files is the Path and SymlinkdPath objects we want commit times for.
+
+        This is the start of finding commit times, so we also start a new
+        self.stats here.
+        """
+        from gitmit.tree_cache import TreeEntryCache
+        from gitmit.backends import repo_for
+
+        self.stats = Stats(tracer=self.tracer)
+
+        with self.stats.timing("index"):
+            tree_cache = None
+            if self.with_cache:
+                tree_cache = TreeEntryCache(self.root_folder)
 
-        git = Repo(self.root_folder)
-        all_files = git.all_files()
-        use_files = set(self.find_files_for_use(all_files))
+            git = repo_for(self.root_folder, self.backend, tree_cache=tree_cache)
+            all_files = git.all_files()
+
+        with self.stats.timing("filtering"):
+            use_files = set(self.find_files_for_use(all_files))
 
         # the git index won't find the files under a symlink :(
         # And we include files under a symlink as seperate copies of the files
         # So we still want to generate modified times for those files
-        extras = set(self.extra_symlinked_files(use_files))
+        with self.stats.timing("symlinks"):
+            extras = set(self.extra_symlinked_files(use_files))
 
         # Combine use_files and extras
         use_files.update(extras)
@@ -97,58 +244,218 @@ class GitTimes(object):
         if not self.silent:
             log.info("Finding modified times for %s/%s git controlled files in %s", len(use_files), len(all_files), self.root_folder)
 
-        # Finally get the dates from git!
-        return self.commit_times_for(git, use_files)
+        return git, use_files
 
     def commit_times_for(self, git, use_files):
         """
-        Return commit times for the use_files specified.
+        Yield (relpath, epoch) pairs for the use_files specified, as soon as
+        we find them.
+
+        Where path is relative to self.parent_dir and epoch is the commit time
+        in UTC for that path.
+        """
+        for batch in self.stats.consumed("output", self.commit_time_batches_for(git, use_files)):
+            for relpath, commit_time in batch:
+                yield relpath, commit_time
+
+    def commit_time_batches_for(self, git, use_files):
+        """
+        Yield lists of (relpath, epoch) for the use_files specified, a list at a
+        time as we find them.
 
         We will use a cache of commit times if self.with_cache is Truthy.
 
-        Finally, we yield (relpath: epoch) pairs where path is relative
-        to self.parent_dir and epoch is the commit time in UTC for that path.
+        Files we get from the cache all come in one list. When we walk the
+        commits, we yield a list for each commit as soon as we find it, with
+        all the copies of the files that are under symlinks.
         """
+        from gitmit.backends import cache_for
+        cache = cache_for(self.cache_backend)
+
         # Use real_relpath if it exists (SymlinkdPath) and default to just the path
         # This is because we _want_ to compare the commits to the _real paths_
         # As git only cares about the symlink itself, rather than files under it
         # We also want to make sure that the symlink targets are included in use_files
         # If they've been excluded by the filters
-        use_files_paths = set([getattr(p, "real_relpath", p.path) for p in use_files if p.relpath])
+        by_path = defaultdict(list)
+        for key in use_files:
+            if key.relpath:
+                by_path[getattr(key, "real_relpath", key.path)].append(key)
+        use_files_paths = set(by_path)
+
+        def batch_for(times):
+            """Return (relpath, commit_time) for every key for each (path, commit_time)"""
+            return [(key.relpath, commit_time) for path, commit_time in times for key in by_path.get(path, ())]
 
         # Find us the first commit to consider
         first_commit = str(git.first_commit)
 
+        # Bounded walks give different times, so they don't get to use the cache
+        walk_options = dict(first_parent=self.first_parent, max_commits=self.max_commits, since=self.since)
+        with_cache = self.with_cache and not any([self.first_parent, self.max_commits is not None, self.since is not None])
+
+        stats = self.stats
+        stats.cache = "miss" if with_cache else "bypassed" if self.with_cache else "disabled"
+
+        # A shallow clone gives files older than its history the wrong times
+        cache_dir = None
+        if with_cache and self.cache_dir:
+            from gitmit.shared_cache import is_shallow
+            if is_shallow(self.root_folder):
+                if not self.silent:
+                    log.info("Not using the shared cache for a shallow clone\tcache_dir=%s", self.cache_dir)
+            else:
+                cache_dir = self.cache_dir
+
+        def remember(commit_times):
+            """Put these commit times as of first_commit in the cache"""
+            with stats.timing("cache"):
+                cache.set_cached_commit_times(self.root_folder, self.parent_dir, first_commit, commit_times, sorted_relpaths, max_entries=self.cache_max_entries, max_bytes=self.cache_max_bytes, backend=self.backend)
+                if cache_dir:
+                    from gitmit.shared_cache import set_shared_commit_times
+                    set_shared_commit_times(cache_dir, self.parent_dir, first_commit, commit_times, sorted_relpaths, max_bytes=self.shared_cache_max_bytes, backend=self.backend)
+
         # Try and get our cached commit times
         # If we get a commit then it means we have a match for this parent/sorted_relpaths
         commit_times = {}
+        walk_paths = None
         cached_commit, cached_commit_times = None, {}
-        if self.with_cache:
-            sorted_relpaths = sorted([p.relpath for p in use_files])
-            cached_commit, cached_commit_times = get_cached_commit_times(self.root_folder, self.parent_dir, sorted_relpaths)
+        if with_cache:
+            with stats.timing("cache"):
+                sorted_relpaths = sorted([p.relpath for p in use_files])
+                cached_commit, cached_commit_times = cache.get_cached_commit_times(self.root_folder, self.parent_dir, sorted_relpaths, backend=self.backend)
+
+            # Another clone may have already found these commit times
+            shared = None
+            if cached_commit != first_commit and cache_dir:
+                from gitmit.shared_cache import get_shared_commit_times
+                with stats.timing("cache"):
+                    shared = get_shared_commit_times(cache_dir, self.parent_dir, first_commit, sorted_relpaths, backend=self.backend)
+
+            known = {}
+            if cached_commit != first_commit and shared is None:
+                # Other filters may have already found the times of these files at HEAD
+                with stats.timing("cache"):
+                    known = cache.get_times_at_commit(self.root_folder, first_commit, use_files_paths, backend=self.backend)
 
             if cached_commit == first_commit:
+                stats.cache = "hit"
                 commit_times = cached_commit_times
+                batch = batch_for(commit_times.items())
+                if batch:
+                    yield batch
+
+            elif shared is not None:
+                if not self.silent:
+                    log.info("Using commit times from the shared cache\tcache_dir=%s\tcommit=%s", cache_dir, first_commit)
+
+                stats.cache = "shared"
+                commit_times = shared
+                batch = batch_for(commit_times.items())
+                if batch:
+                    yield batch
+
+                with stats.timing("cache"):
+                    cache.set_cached_commit_times(self.root_folder, self.parent_dir, first_commit, commit_times, sorted_relpaths, max_entries=self.cache_max_entries, max_bytes=self.cache_max_bytes, backend=self.backend)
+
+            elif known and len(known) == len(use_files_paths):
+                stats.cache = "superset"
+                commit_times = known
+                yield batch_for(commit_times.items())
+                remember(commit_times)
+
+            # If HEAD has moved forward from the cached commit, then we only
+            # need to look at the commits between the two
+            elif cached_commit and cached_commit_times and git.is_ancestor(cached_commit):
+                if not self.silent:
+                    log.info("Refreshing cached commit times\tfrom=%s\tto=%s", cached_commit, first_commit)
+
+                stats.cache = "refresh"
+                commit_times = dict(cached_commit_times)
+
+                # A merge can take an older version of a file than the one at
+                # the cached commit, and the commit that made that version is
+                # behind the cached commit. So files that aren't the same as
+                # they were at the cached commit are found by walking all of
+                # history, and only the rest are found in the new commits
+                with stats.timing("walk"):
+                    changed = git.changed_since(cached_commit, use_files_paths)
+                for path in changed:
+                    commit_times.pop(path, None)
+
+                walks = []
+                if len(changed) < len(use_files_paths):
+                    walks.append(git.file_commit_times(use_files_paths - changed, debug=self.debug, exclude=[cached_commit], stats=stats))
+                if changed:
+                    walks.append(git.file_commit_times(changed, debug=self.debug, stats=stats))
+
+                found = set()
+                for walk in walks:
+                    for commit_id, commit_time, different_paths in stats.timed("walk", walk):
+                        for path in different_paths:
+                            commit_times[path] = commit_time
+                        found.update(different_paths)
+                        yield batch_for((path, commit_time) for path in different_paths)
+
+                # Everything else is the same as it was in the cache
+                batch = batch_for((path, commit_time) for path, commit_time in commit_times.items() if path not in found)
+                if batch:
+                    yield batch
+
+                remember(commit_times)
+
+            # Otherwise we only need to walk for the files other filters didn't find
+            elif known:
+                if not self.silent:
+                    log.info("Using commit times found for other filters\tknown=%s\tmissing=%s", len(known), len(use_files_paths) - len(known))
+
+                stats.cache = "superset"
+                commit_times = dict(known)
+                walk_paths = use_files_paths - set(known)
+                yield batch_for(commit_times.items())
 
         # If we couldn't find cached commit times, we have to do some work
         if not commit_times:
-            for commit_id, commit_time, different_paths in git.file_commit_times(use_files_paths, debug=self.debug):
+            walk_paths = use_files_paths
+
+        if walk_paths:
+            walk = git.file_commit_times(walk_paths, debug=self.debug, stats=stats, **walk_options)
+            for commit_id, commit_time, different_paths in stats.timed("walk", walk):
+                # The files a bounded walk didn't find
+                if commit_id is None:
+                    commit_time = self.fallback_for(commit_time, different_paths)
+                    if commit_time is None:
+                        continue
+
                 for path in different_paths:
                     commit_times[path] = commit_time
+                yield batch_for((path, commit_time) for path in different_paths)
 
-            if self.with_cache:
-                set_cached_commit_times(self.root_folder, self.parent_dir, first_commit, commit_times, sorted_relpaths)
+            if with_cache:
+                remember(commit_times)
 
-        # Finally, yield the (relpath, commit_time) for all the files we care about.
-        for key in use_files:
-            if key.relpath:
-                path = getattr(key, "real_relpath", key.path)
-                relpath = getattr(key, "real_relpath", key.relpath)
-                if path in commit_times:
-                    yield key.relpath, commit_times[path]
-                else:
+        # Finally, complain about the files we couldn't find
+        for path, keys in by_path.items():
+            if path not in commit_times:
+                for key in keys:
+                    relpath = getattr(key, "real_relpath", key.relpath)
                     log.warning("Couldn't find commit time for {0}".format(relpath))
 
+    def fallback_for(self, oldest_commit_time, paths):
+        """
+        Return the time to give the paths a bounded walk didn't find, given the
+        time of the oldest commit the walk looked at.
+        """
+        if self.fallback_time == "oldest":
+            commit_time = oldest_commit_time
+        else:
+            commit_time = self.fallback_time
+
+        if commit_time is not None and not self.silent:
+            log.info("Using a fallback time for files not found in the bounded walk\tcommit_time=%s\tfiles=%s", commit_time, len(paths))
+
+        return commit_time
+
     def extra_symlinked_files(self, potential_symlinks):
         """
         Find any symlinkd folders and yield SymlinkdPath objects for each file
@@ -180,56 +487,64 @@ class GitTimes(object):
                         # and path relative to root for the target
                         yield SymlinkdPath(symlinkd_path, symlinkd_relpath, real_relpath)
 
+    @property
+    def filters(self):
+        """
+        The Filters for our timestamps_for, exclude and include globs.
+
+        These are compiled again if any of those globs have changed.
+        """
+        source = tuple(tuple(globs) if type(globs) is list else globs for globs in (self.timestamps_for, self.exclude, self.include))
+        if getattr(self, "_filters_source", None) != source:
+            from gitmit.filters import Filters
+            self._filters = Filters(self.timestamps_for, self.exclude, self.include)
+            self._filters_source = source
+        return self._filters
+
+    def relfolder_for(self, folder):
+        """Find the relative path of a folder from the parent_dir, with "" for the parent_dir itself"""
+        if self.parent_dir in (".", ""):
+            return folder
+
+        relfolder = os.path.relpath(folder or ".", self.parent_dir)
+        if relfolder == ".":
+            return ""
+        return relfolder
+
     def find_files_for_use(self, all_files):
         """
         Given a list of all the files to consider, only yield Path objects
         for those we care about, given our filters
+
+        We group the files by folder so that we only find the relative path
+        of each folder once. Folders where our filters accept or reject
+        everything don't need us to look at each file.
         """
+        filters = self.filters
+
+        by_folder = defaultdict(list)
         for path in all_files:
-            # Find the path relative to the parent dir
-            relpath = self.relpath_for(path)
+            if path == self.parent_dir:
+                if filters.accepts(""):
+                    yield Path(path, "")
+                continue
+
+            folder, _, name = path.rpartition("/")
+            by_folder[folder].append(name)
 
-            # Don't care about the ./
-            if relpath.startswith("./"):
-                relpath = relpath[2:]
+        for folder, names in by_folder.items():
+            relfolder = self.relfolder_for(folder)
 
-            # Only care about paths that aren't filtered
-            if not self.is_filtered(relpath):
-                yield Path(path, relpath)
+            verdict = filters.folder_verdict(relfolder)
+            if verdict is False:
+                continue
+
+            for name in names:
+                path = "{0}/{1}".format(folder, name) if folder else name
+                relpath = "{0}/{1}".format(relfolder, name) if relfolder else name
+                if verdict or filters.accepts(relpath):
+                    yield Path(path, relpath)
 
     def is_filtered(self, relpath):
         """Say whether this relpath is filtered out"""
-        # Only include files under the parent_dir
-        if relpath.startswith("../"):
-            return True
-
-        # Ignore files that we don't want timestamps from
-        if self.timestamps_for is not None and type(self.timestamps_for) is list:
-            match = False
-            for line in self.timestamps_for:
-                if fnmatch.fnmatch(relpath, line):
-                    match = True
-                    break
-            if not match:
-                return True
-
-        # Matched is true by default if
-        # * Have exclude
-        # * No exclude and no include
-        matched = self.exclude or not any([self.exclude, self.include])
-
-        # Anything not matching exclude gets included
-        if self.exclude:
-            for line in self.exclude:
-                if fnmatch.fnmatch(relpath, line):
-                    matched = False
-
-        # Anything matching include gets included
-        if self.include:
-            for line in self.include:
-                if fnmatch.fnmatch(relpath, line):
-                    matched = True
-                    break
-
-        return not matched
-
+        return not self.filters.accepts(relpath)
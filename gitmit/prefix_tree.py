@@ -49,6 +49,10 @@ class PrefixTree(object):
         return bool(self.cache)
     __nonzero__ = __bool__
 
+    def __len__(self):
+        """Return how many files are left in the tree"""
+        return sum(len(tree.files) for tree in self.cache.values())
+
     def __contains__(self, prefix):
         """
         Determine if we have this prefix in the tree where prefix is a tuple of
@@ -56,6 +60,19 @@ class PrefixTree(object):
         """
         return prefix in self.cache
 
+    def folder(self, prefix):
+        """
+        Return the TreeItem for this prefix, or None if there is nothing left
+        under that folder.
+        """
+        return self.cache.get(prefix)
+
+    def paths(self):
+        """Yield the parts of every file that is left in the tree as a tuple"""
+        for prefix, tree in self.cache.items():
+            for name in tree.files:
+                yield prefix + (name, )
+
     def fill(self, paths):
         """
         Initialise the tree.
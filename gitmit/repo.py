@@ -13,21 +13,25 @@ For example, compare the speed of::
 and::
 
     $ time gitmit --no-cache > /dev/null
+
+If that difference matters, then ``gitmit --backend git`` uses the output of
+git log instead, see gitmit.git_log.
 """
+from gitmit.commit_graph import CommitGraph
 from gitmit.prefix_tree import PrefixTree
+from gitmit.stats import Stats
+from gitmit.lru import LRU
 
 from dulwich.repo import Repo as Repository
-from collections import defaultdict
+from collections import namedtuple, deque
 import logging
-import fnmatch
-import time
+import heapq
 import stat
-import os
-
-empty = frozenset()
 
 log = logging.getLogger("gitmit.repo")
 
+CommitInfo = namedtuple("CommitInfo", ["oid", "tree", "parents", "commit_time", "commit_timezone"])
+
 class Repo(object):
     """
     Wrapper around a libgit Repository that knows:
@@ -38,9 +42,36 @@ class Repo(object):
 
     It's written with speed in mind, given the constraints of making
     performant code in python!
+
+    If ``tree_cache`` is provided then it is used to remember the entries of
+    the trees we decode, so they don't need to be decoded again in the future.
+
+    During a walk we also hold onto up to ``memo_size`` of the most recently
+    used trees, so that the parent trees of one commit don't need to be
+    decoded again as the current trees of the next commit.
+
+    When the repository has a commit-graph and ``use_commit_graph`` is True,
+    we use it to find the parents, tree and time of commits rather than
+    parsing each commit object. If the commit-graph has changed path Bloom
+    filters, we also use those to skip commits that can't have changed any of
+    the files we are still looking for.
+
+    Like ``git log -- <file>``, when a merge is the same as one of its parents
+    for a file, we only follow that parent for that file. Each file is
+    simplified on its own, so the commit time of a file doesn't depend on what
+    other files we are looking for. Set ``full_history`` to True to follow
+    every parent of every merge.
+
+    What we do is counted in ``self.stats``, which is a gitmit.stats.Stats.
     """
-    def __init__(self, root_folder):
+    def __init__(self, root_folder, tree_cache=None, memo_size=10000, use_commit_graph=True, full_history=False):
         self.git = Repository(root_folder)
+        self.memo_size = memo_size
+        self.full_history = full_history
+        self.use_commit_graph = use_commit_graph
+        self.tree_cache = tree_cache
+        self.memo = LRU(memo_size)
+        self.stats = Stats()
 
     def all_files(self):
         """Return a set of all the files under git control"""
@@ -51,126 +82,588 @@ class Repo(object):
         """Return the oid of HEAD"""
         return self.git.head().decode()
 
-    def file_commit_times(self, use_files_paths, debug=False):
+    def is_ancestor(self, ancestor):
+        """
+        Say whether the commit at ``ancestor`` is reachable from HEAD
+
+        We walk the commits that are reachable from HEAD but not from
+        ``ancestor``. If ancestor is reachable from HEAD then one of those
+        commits must have it as a parent.
+
+        This means when it is an ancestor we only look at the commits between
+        the two.
+        """
+        ancestor = ancestor.encode() if not isinstance(ancestor, bytes) else ancestor
+        head = self.git.head()
+
+        if ancestor == head:
+            return True
+
+        try:
+            self.git.get_object(ancestor)
+        except KeyError:
+            return False
+
+        for info, _ in self.walk_commits(exclude=[ancestor]):
+            if ancestor in info.parents:
+                return True
+
+        return False
+
+    def changed_since(self, ancestor, use_files_paths):
+        """
+        Return the set of use_files_paths that aren't the same at HEAD as they
+        were at the commit ``ancestor``, including files that weren't there.
+        """
+        ancestor = ancestor.encode() if not isinstance(ancestor, bytes) else ancestor
+        head = self.commit_info(self.git.head())
+        before = self.commit_info(ancestor)
+
+        prefixes = PrefixTree()
+        prefixes.fill(use_files_paths)
+        return set("/".join(path) for path in self.differences_between(head.tree, [before.tree], prefixes))
+
+    def file_commit_times(self, use_files_paths, debug=False, exclude=None, first_parent=False, max_commits=None, since=None, stats=None):
         """
         Traverse the commits in the repository, starting from HEAD until we have
         found the commit times for all the files we care about.
 
         Yield each file once, only when it is found to be changed in some commit.
 
+        If ``exclude`` is a list of commit oids, then those commits and their
+        ancestors are not traversed.
+
+        If ``first_parent`` is True then we only follow the first parent of
+        merges, and merges are compared against only their first parent.
+
+        The walk can be bounded by ``max_commits``, the most commits to look at,
+        and ``since``, an epoch that we don't look at commits older than. If
+        the walk is bounded and there are files we didn't find, then finally we
+        yield (None, commit_time, remaining_paths) where commit_time is the time
+        of the last, and oldest, commit we looked at. If we didn't look at any
+        commits, then that commit_time is None.
+
+        If ``stats`` is a gitmit.stats.Stats then we count what we do in it,
+        otherwise we count in a new one. Either way it becomes self.stats. If
+        the stats have a tracer, we also add the batches of commits we walk and
+        the expensive diffs to the trace.
+
         If self.debug is true, also output log.debug for the speed we are going
         through commits (output commits/second every 1000 commits and every
         100000 commits)
         """
+        if stats is None:
+            stats = Stats()
+        self.stats = stats
+
         prefixes = PrefixTree()
         prefixes.fill(use_files_paths)
 
-        for entry in self.git.get_walker():
-            # Commit time taking into account the timezone
-            commit_time = entry.commit.commit_time - entry.commit.commit_timezone
-
-            # Get us the two different tree structures between parents and current
-            cf_and_pf, changes = self.tree_structures_for(()
-                , entry.commit.tree
-                , [self.git.get_object(oid).tree for oid in entry.commit.parents]
-                , prefixes
-                )
-
-            # Deep dive into any differences
-            difference = []
-            if changes:
-                cfs_and_pfs = [(cf_and_pf, changes)]
-                while cfs_and_pfs:
-                    nxt, changes = cfs_and_pfs.pop(0)
-                    for thing, changes, is_path in self.differences_between(nxt[0], nxt[1], changes, prefixes):
-                        if is_path:
-                            found = prefixes.remove(thing[:-1], thing[-1])
-                            if found:
-                                difference.append('/'.join(thing))
-                        else:
-                            cfs_and_pfs.append((thing, changes))
-
-            # Only yield if there was a difference
-            if difference:
-                yield entry.commit.sha().hexdigest(), commit_time, difference
-
-            # If nothing remains, then break!
-            if not prefixes:
-                break
+        # Entries are memoized for the length of this walk
+        self.memo = LRU(self.memo_size)
+
+        if exclude:
+            exclude = [oid.encode() if not isinstance(oid, bytes) else oid for oid in exclude]
+
+        skipped = 0
+        visited = 0
+        simplified = 0
+        oldest = None
+        commit_graph = self.commit_graph
+        simplify = not self.full_history and not first_parent
+
+        # When we simplify history, each file follows its own line through the
+        # commits, so we keep the files we're still looking for along each line
+        # in pending under the commit that is next on that line
+        pending = {}
+        requeue = []
+        processed = set()
+        lost = []
+        if simplify:
+            pending[self.git.head()] = prefixes
+
+        def route(parent, wanted):
+            """Send these files on to this parent, returning whether there were any"""
+            if not wanted:
+                return False
+
+            existing = pending.get(parent.oid)
+            if existing is None:
+                pending[parent.oid] = wanted
+                if parent.oid in processed:
+                    # Only possible when a child is older than its parent
+                    requeue.append(parent.oid)
+            else:
+                if len(existing) < len(wanted):
+                    existing, wanted = wanted, existing
+                    pending[parent.oid] = existing
+                existing.fill("/".join(path) for path in wanted.paths())
+            return True
+
+        tracer = stats.tracer
+        if tracer is not None:
+            remaining = len(use_files_paths)
 
-    def entries_in_tree_oid(self, prefix, tree_oid):
-        """Find the tree at this oid and return entries prefixed with ``prefix``"""
         try:
-            tree = self.git.get_object(tree_oid)
-        except KeyError:
-            log.warning("Couldn't find object {0}".format(tree_oid))
-            return empty
-        else:
-            return frozenset(self.entries_in_tree(prefix, tree))
+            for info, parents in self.walk_commits(exclude=exclude, requeue=requeue):
+                if since is not None and info.commit_time < since:
+                    break
+
+                if max_commits is not None and visited >= max_commits:
+                    break
+
+                wanted = prefixes
+                if simplify:
+                    wanted = pending.pop(info.oid, None)
+                    processed.add(info.oid)
+                    if not wanted:
+                        del parents[:]
+                        continue
+
+                visited += 1
+                oldest = info
+
+                stats.commits_walked += 1
+                if len(info.parents) > 1:
+                    stats.merge_commits += 1
+
+                if first_parent:
+                    del parents[1:]
+
+                if tracer is not None:
+                    started = tracer.now()
+
+                # The filter is against the first parent, which is enough to know
+                # nothing is different from all the parents of a merge
+                if commit_graph is not None:
+                    bloom = commit_graph.bloom_filter(info.oid)
+                    if bloom is not None and not self.maybe_changed(bloom, wanted):
+                        skipped += 1
+                        if simplify:
+                            if len(parents) > 1:
+                                simplified += 1
+                                del parents[1:]
+                            if parents:
+                                route(parents[0], wanted)
+                            else:
+                                lost.append(wanted)
+                        if tracer is not None:
+                            tracer.walked_commit(0, remaining)
+                        continue
+
+                # A merge that is the same as one parent for everything we care about
+                # gets everything from that parent, so the other parents can't help
+                if len(parents) > 1 and simplify:
+                    same = self.treesame_parent(info, parents, wanted)
+                    if same is not None:
+                        simplified += 1
+                        parents[:] = [same]
+                        route(same, wanted)
+                        if tracer is not None:
+                            tracer.add("treesame", "diff", started, tracer.now(), {"commit": info.oid.decode()})
+                            tracer.walked_commit(0, remaining)
+                        continue
+
+                parent_trees = [parent.tree for parent in parents]
+
+                # Find the files we care about that are different from all the parents
+                difference = []
+                if len(parents) > 1 and simplify:
+                    before = len(parents)
+                    difference = self.split_merge(info, parents, wanted, route)
+                    if len(parents) < before:
+                        simplified += 1
+                else:
+                    for path in self.differences_between(info.tree, parent_trees, wanted):
+                        if wanted.remove(path[:-1], path[-1]):
+                            difference.append('/'.join(path))
+
+                    if simplify:
+                        if parents:
+                            route(parents[0], wanted)
+                        elif wanted:
+                            # Files that aren't in a commit without parents are never found
+                            lost.append(wanted)
+
+                if tracer is not None:
+                    remaining -= len(difference)
+                    tracer.add("diff", "diff", started, tracer.now(), {"commit": info.oid.decode(), "parents": len(parents), "found": len(difference)})
+                    tracer.walked_commit(len(difference), remaining)
+
+                # Only yield if there was a difference
+                if difference:
+                    stats.resolved_files(len(difference))
+
+                    # Commit time taking into account the timezone
+                    commit_time = info.commit_time - self.commit_timezone(info)
+                    yield info.oid.decode(), commit_time, difference
+
+                # If nothing remains, then break!
+                if not (pending if simplify else prefixes):
+                    break
+
+            left = [prefixes]
+            if simplify:
+                left = list(pending.values()) + lost
+
+            if any(left) and (max_commits is not None or since is not None):
+                commit_time = None
+                if oldest is not None:
+                    commit_time = oldest.commit_time - self.commit_timezone(oldest)
+                yield None, commit_time, sorted(set("/".join(path) for wanted in left for path in wanted.paths()))
+        finally:
+            if tracer is not None:
+                tracer.finish_batch(remaining)
+
+            if debug:
+                log.debug("Tree entries memo\thits=%s\tmisses=%s", self.memo.hits, self.memo.misses)
+                log.debug("Bloom filters\tskipped_commits=%s", skipped)
+                log.debug("History simplification\tsimplified_merges=%s", simplified)
+
+            # Remember any trees we decoded for next time
+            if self.tree_cache is not None:
+                self.tree_cache.save()
+
+    @property
+    def commit_graph(self):
+        """
+        The CommitGraph for this repository, or None if there isn't one or
+        self.use_commit_graph is False.
+        """
+        if not hasattr(self, "_commit_graph"):
+            self._commit_graph = None
+            if self.use_commit_graph:
+                self._commit_graph = CommitGraph.for_objects_dir(self.git.object_store.path)
+        return self._commit_graph
 
-    def entries_in_tree(self, prefix, tree):
+    def treesame_parent(self, info, parents, prefixes):
+        """
+        Return the first of ``parents`` that is the same as the commit at
+        ``info`` for all the files left in ``prefixes``, or None if there
+        isn't one.
         """
-        Traverse the entries in this tree and yield (prefix, is_tree, oid)
+        for parent in parents:
+            for _ in self.differences_between(info.tree, [parent.tree], prefixes):
+                break
+            else:
+                return parent
 
-        Where prefix is a tuple of the given prefix and the name of the entry.
+    def split_merge(self, info, parents, wanted, route):
+        """
+        Return the files in ``wanted`` that are different in the merge at
+        ``info`` from all of its ``parents``, and route the rest of the files
+        to the first parent each one is the same as.
+
+        This is what git does for one file at a time, so doing it for each file
+        means the commit time of a file doesn't depend on what other files we
+        are looking for. ``parents`` is changed to only the parents that were
+        given any files.
         """
-        for entry in tree.items():
-            if prefix:
-                new_prefix = prefix + (entry.path.decode(), )
+        differs = [set(self.differences_between(info.tree, [parent.tree], wanted)) for parent in parents]
+        found = set.intersection(*differs)
+
+        # Anything not different from the first parent stays in wanted
+        others = [[] for _ in parents]
+        for path in differs[0]:
+            wanted.remove(path[:-1], path[-1])
+            if path not in found:
+                for index in range(1, len(parents)):
+                    if path not in differs[index]:
+                        others[index].append("/".join(path))
+                        break
+
+        keep = []
+        for index, parent in enumerate(parents):
+            if index == 0:
+                routed = wanted
             else:
-                new_prefix = (entry.path.decode(), )
+                routed = PrefixTree()
+                routed.fill(others[index])
+            if route(parent, routed):
+                keep.append(parent)
 
-            yield (new_prefix, stat.S_ISDIR(entry.mode), entry.sha)
+        parents[:] = keep
+        return ["/".join(path) for path in found]
 
-    def tree_structures_for(self, prefix, current_oid, parent_oids, prefixes):
+    def maybe_changed(self, bloom, prefixes, budget=256):
         """
-        Return the entries for this commit, the entries of the parent commits,
-        and the difference between the two (current_files - parent_files)
+        Say whether the commit with this BloomFilter may have changed any of
+        the files left in ``prefixes``.
+
+        Git puts the folders of every changed path in the filter as well, so we
+        only look inside a folder when the folder itself may have changed.
+
+        Checking a path is much cheaper than diffing trees, but not free, so
+        after ``budget`` checks we give up and say it may have changed.
         """
-        if prefix and prefixes and prefix not in prefixes:
-            return empty, empty
+        stack = [prefixes.tree]
+        while stack:
+            folder = stack.pop()
+
+            for name, child in folder.folders.items():
+                budget -= 1
+                if budget < 0:
+                    return True
+                if bloom.contains(child.name):
+                    stack.append(child)
 
-        parent_files = set()
-        for oid in parent_oids:
-            parent_files.update(self.entries_in_tree_oid(prefix, oid))
+            for name in folder.files:
+                budget -= 1
+                if budget < 0 or bloom.contains(folder.name + (name, )):
+                    return True
 
-        current_files = self.entries_in_tree_oid(prefix, current_oid)
-        return (current_files, parent_files), (current_files - parent_files)
+        return False
 
-    def differences_between(self, current_files, parent_files, changes, prefixes):
+    def commit_info(self, oid):
         """
-        yield (thing, changes, is_path)
+        Return a CommitInfo for the commit at this oid.
 
-        If is_path is true, changes is None and thing is the path as a tuple.
+        We get this from the commit-graph if we can and parse the commit
+        object if we can't. The commit-graph doesn't know the timezone, so
+        commit_timezone is None when it comes from there.
+        """
+        commit_graph = self.commit_graph
+        if commit_graph is not None:
+            found = commit_graph.lookup(oid)
+            if found is not None:
+                tree, parents, commit_time = found
+                return CommitInfo(oid, tree, parents, commit_time, None)
+
+        tracer = self.stats.tracer
+        if tracer is None:
+            commit = self.git.get_object(oid)
+        else:
+            with tracer.span("load commit", "objects", always=False, commit=oid.decode()):
+                commit = self.git.get_object(oid)
+
+        return CommitInfo(oid, commit.tree, commit.parents, commit.commit_time, commit.commit_timezone)
+
+    def commit_timezone(self, info):
+        """Return the timezone of this commit, parsing the commit if we need to"""
+        if info.commit_timezone is not None:
+            return info.commit_timezone
+        return self.git.get_object(info.oid).commit_timezone
+
+    def walk_commits(self, exclude=None, requeue=None):
+        """
+        Yield (info, parents) for each commit reachable from HEAD, newest first,
+        where info is a CommitInfo for the commit and parents is a list of
+        CommitInfo for its parents.
 
-        If is_path is false, thing is the current_files and parent_files for
-        that changed treeentry and changes is the difference between current_files
-        and parent_files.
+        If ``exclude`` is a list of commit oids, then those commits and their
+        ancestors are not yielded. Like git, we do this by walking those commits
+        alongside the others and marking everything we find from them as
+        uninteresting. We stop once there is nothing interesting left to walk.
 
-        The code here is written to squeeze as much performance as possible out
-        of this operation.
+        The parents of a commit are only followed after the next commit is
+        asked for, so removing parents from the list we yield means those
+        parents are not followed from this commit.
+
+        If ``requeue`` is a list, then any oids added to it are walked again,
+        even if we have already yielded them.
         """
-        parent_oid = None
+        heap = []
+        seen = set()
+        queued = set()
+        loaded = {}
+        uninteresting = set(exclude or [])
+        interesting = 0
+
+        def load(oid):
+            info = loaded.get(oid)
+            if info is None:
+                info = self.commit_info(oid)
+                if oid not in seen:
+                    loaded[oid] = info
+            return info
+
+        for oid in [self.git.head()] + list(uninteresting):
+            if oid not in seen:
+                info = load(oid)
+                seen.add(oid)
+                queued.add(oid)
+                heapq.heappush(heap, (-info.commit_time, oid))
+                if oid not in uninteresting:
+                    interesting += 1
+
+        while True:
+            while requeue:
+                oid = requeue.pop()
+                if oid not in uninteresting and oid not in queued:
+                    loaded[oid] = self.commit_info(oid)
+                    queued.add(oid)
+                    heapq.heappush(heap, (-loaded[oid].commit_time, oid))
+                    interesting += 1
+
+            if not interesting:
+                break
 
-        if any(is_tree for _, is_tree, _ in changes):
-            if len(changes) == 1:
-                wanted_path = list(changes)[0][0]
-                parent_oid = frozenset([oid for path, is_tree, oid in parent_files if path == wanted_path and is_tree])
+            _, oid = heapq.heappop(heap)
+            queued.discard(oid)
+            info = loaded.pop(oid)
+
+            parents = []
+            for parent in info.parents:
+                try:
+                    parents.append(load(parent))
+                except KeyError:
+                    log.warning("Couldn't find commit {0}".format(parent))
+
+            if oid in uninteresting:
+                for parent in parents:
+                    if parent.oid not in uninteresting:
+                        uninteresting.add(parent.oid)
+                        if parent.oid in queued:
+                            interesting -= 1
             else:
-                parent_values = defaultdict(set)
-                parent_changes = parent_files - current_files
-                for path, is_tree, oid in parent_changes:
-                    if is_tree:
-                        parent_values[path].add(oid)
-
-        for path, is_tree, oid in changes:
-            if is_tree and path not in prefixes:
+                interesting -= 1
+                yield info, parents
+
+            for parent in parents:
+                if parent.oid not in seen:
+                    seen.add(parent.oid)
+                    queued.add(parent.oid)
+                    heapq.heappush(heap, (-parent.commit_time, parent.oid))
+                    if parent.oid not in uninteresting:
+                        interesting += 1
+
+    def tree_entries(self, tree_oid):
+        """
+        Return a tuple of (name, is_tree, oid) for the entries in this tree
+
+        We use self.tree_cache if we have one, otherwise we decode the tree
+        ourselves. Raises KeyError if the tree can't be found.
+        """
+        if self.tree_cache is not None:
+            entries = self.tree_cache.get(tree_oid)
+            if entries is not None:
+                self.stats.tree_cache_hits += 1
+                return entries
+
+        tracer = self.stats.tracer
+        if tracer is None:
+            tree = self.git.get_object(tree_oid)
+            entries = tuple((entry.path.decode(), stat.S_ISDIR(entry.mode), entry.sha) for entry in tree.items())
+        else:
+            with tracer.span("load tree", "objects", always=False, tree=tree_oid.decode()):
+                tree = self.git.get_object(tree_oid)
+            with tracer.span("decode tree", "objects", always=False, tree=tree_oid.decode()) as args:
+                entries = tuple((entry.path.decode(), stat.S_ISDIR(entry.mode), entry.sha) for entry in tree.items())
+                args["entries"] = len(entries)
+
+        self.stats.trees_decoded += 1
+
+        if self.tree_cache is not None:
+            self.tree_cache.add(tree_oid, entries)
+
+        return entries
+
+    def sorted_entries(self, tree_oid):
+        """
+        Return a tuple of (key, name, is_tree, oid) for the entries in this tree
+        sorted by key.
+
+        The key is the name of the entry with a trailing slash for trees, which
+        is the order git itself stores entries in. This means a file and a
+        folder with the same name are different entries.
+
+        We remember the result in self.memo so we only do this once per walk
+        for each tree.
+        """
+        result = self.memo.get(tree_oid)
+        if result is not None:
+            return result
+
+        try:
+            entries = self.tree_entries(tree_oid)
+        except KeyError:
+            log.warning("Couldn't find object {0}".format(tree_oid))
+            return ()
+
+        result = tuple(sorted((name + "/" if is_tree else name, name, is_tree, oid) for name, is_tree, oid in entries))
+        self.memo.set(tree_oid, result)
+        return result
+
+    def differences_between(self, current_oid, parent_oids, prefixes):
+        """
+        Yield the path, as a tuple, of every file we still care about that is
+        different in the tree at ``current_oid`` from all the trees at
+        ``parent_oids``.
+
+        We go through the trees one folder at a time, only looking at entries
+        that ``prefixes`` says we still care about. Subtrees that are the same
+        as a parent are never decoded, and neither are subtrees that hold
+        nothing we still care about.
+
+        If the stats have a tracer, we add a span for comparing each folder
+        that has at least ``tracer.min_entries`` entries, so the trace shows
+        which folders the time goes to.
+        """
+        if current_oid in parent_oids:
+            return
+
+        tracer = self.stats.tracer
+
+        queue = deque([((), current_oid, parent_oids)])
+        while queue:
+            prefix, current_oid, parent_oids = queue.popleft()
+
+            # We may have found everything under here since this was queued
+            wanted = prefixes.folder(prefix)
+            if wanted is None:
                 continue
 
-            if not is_tree:
-                yield path, None, True
-            else:
-                parent_oids = parent_oid if parent_oid is not None else parent_values.get(path, empty)
-                cf_and_pf, changes = self.tree_structures_for(path, oid, parent_oids, prefixes)
-                if changes:
-                    yield cf_and_pf, changes, False
+            if tracer is not None:
+                started = tracer.now()
+
+            folders, files = wanted.folders, wanted.files
+            entries = self.sorted_entries(current_oid)
+            changes = [(entry, []) for entry in entries if entry[1] in (folders if entry[2] else files)]
+
+            for parent_oid in parent_oids:
+                if not changes:
+                    break
+                changes = self.changed_entries(changes, self.sorted_entries(parent_oid))
+
+            if tracer is not None and len(entries) >= tracer.min_entries:
+                args = {"folder": "/".join(prefix) or ".", "entries": len(entries), "parents": len(parent_oids), "changed": len(changes)}
+                tracer.add("subtree", "subtree", started, tracer.now(), args)
+
+            for (_, name, is_tree, oid), parent_trees in changes:
+                if is_tree:
+                    queue.append((prefix + (name, ), oid, parent_trees))
+                else:
+                    yield prefix + (name, )
+
+    def changed_entries(self, changes, parent_entries):
+        """
+        Return the ``changes`` that aren't the same in ``parent_entries``
+
+        Where changes is a list of ((key, name, is_tree, oid), parent_trees)
+        and parent_entries is a tuple of (key, name, is_tree, oid).
+
+        Both are sorted by key, so we walk them side by side like git's own
+        tree diff does. When a tree is in both but with a different oid, we add
+        the oid of the parent's tree to parent_trees for that change.
+        """
+        result = []
+        index = 0
+        length = len(parent_entries)
+        self.stats.entries_compared += len(changes)
+
+        for change in changes:
+            key = change[0][0]
+            while index < length and parent_entries[index][0] < key:
+                index += 1
+
+            if index < length and parent_entries[index][0] == key:
+                parent_oid = parent_entries[index][3]
+                if parent_oid == change[0][3]:
+                    continue
+
+                if change[0][2]:
+                    change[1].append(parent_oid)
+
+            result.append(change)
+
+        return result
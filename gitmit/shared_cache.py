@@ -0,0 +1,162 @@
+"""
+A cache of commit times that can be shared between clones of a repository.
+
+The cache in gitmit.cache lives under the .git folder of each clone, so a fresh
+clone always starts without one. The commit time of a file as of a commit only
+depends on the history behind that commit, so commit times found in one clone
+are just as true in any other clone at the same commit.
+
+Except for shallow clones, which don't have all of that history. A file that
+was last changed before the history of a shallow clone starts gets the time of
+the oldest commit it has, so shallow clones don't read or write the shared
+cache. See is_shallow.
+
+So if we're given a ``cache_dir`` we also keep a file for each commit, set of
+files and backend under ``<cache_dir>/commit_times``, named after the oid of
+the commit and gitmit.cache.cache_key(parent_dir, sorted_relpaths, backend)::
+
+    <cache_dir>/commit_times/<commit>-<key>.bin
+
+Each file holds the one entry in the same format as gitmit.cache. Files are
+written with gitmit.atomic.write_atomically so many clones can share the folder
+at once, and the modified time of a file is updated each time it is used.
+
+When the files take up more than ``max_bytes`` (``default_max_bytes`` by
+default) we remove the least recently used files until they don't, which can
+also be done with ``gitmit --evict-cache``.
+
+The folder defaults to ``$XDG_CACHE_HOME/gitmit``, or ``~/.cache/gitmit`` if
+XDG_CACHE_HOME isn't set.
+"""
+from gitmit.cache import CacheFile, CacheFormatError, cache_key, encode_cache, entry_size, opened_cache
+from gitmit.atomic import write_atomically
+
+import logging
+import struct
+import time
+import os
+
+log = logging.getLogger("gitmit.shared_cache")
+
+# Arbitrary number is arbitrary
+default_max_bytes = 1024 * 1024 * 1024
+
+def default_cache_dir():
+    """Return $XDG_CACHE_HOME/gitmit or ~/.cache/gitmit"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "gitmit")
+
+def is_shallow(root_folder):
+    """Say whether the repository at root_folder is a shallow clone"""
+    return os.path.exists(os.path.join(root_folder, ".git", "shallow"))
+
+def entry_location(cache_dir, commit, key):
+    """Return the location of the file for this commit and cache key"""
+    return os.path.join(cache_dir, "commit_times", "{0}-{1}.bin".format(commit, key))
+
+def get_shared_commit_times(cache_dir, parent_dir, commit, sorted_relpaths, backend="dulwich"):
+    """
+    Return the commit times for this parent_dir, sorted_relpaths and backend as
+    of this commit, or None if we don't have them.
+
+    Using a file makes it the most recently used. If we can't read the file we
+    issue a warning and return None, it is just a cache after all!
+    """
+    key = cache_key(parent_dir, sorted_relpaths, backend)
+    location = entry_location(cache_dir, commit, key)
+
+    try:
+        fle, mapped = opened_cache(location)
+        if fle is None:
+            return None
+
+        try:
+            entry = CacheFile(mapped).entries().get(key)
+        finally:
+            mapped.close()
+            fle.close()
+
+        if entry is None or entry["parent_dir"] != parent_dir or entry["backend"] != backend or entry["commit"] != commit:
+            return None
+
+        try:
+            os.utime(location, None)
+        except (IOError, OSError):
+            # Someone else may have just evicted it
+            pass
+
+        return entry["commit_times"]
+    except (CacheFormatError, struct.error, UnicodeDecodeError, IOError, OSError) as error:
+        log.warning("Failed to open gitmit shared commit times\tlocation=%s\terror=%s", location, error)
+        return None
+
+def set_shared_commit_times(cache_dir, parent_dir, commit, commit_times, sorted_relpaths, max_bytes=None, backend="dulwich"):
+    """
+    Write the commit times for this parent_dir, sorted_relpaths and backend as
+    of this commit and then evict the least recently used files if they take up more
+    than max_bytes.
+
+    If we can't, we issue a warning.
+    """
+    commit = str(commit)
+    key = cache_key(parent_dir, sorted_relpaths, backend)
+    location = entry_location(cache_dir, commit, key)
+
+    try:
+        if not os.path.exists(os.path.dirname(location)):
+            os.makedirs(os.path.dirname(location))
+
+        entry = {"commit": commit, "parent_dir": parent_dir, "backend": backend, "commit_times": commit_times, "last_used": time.time(), "size": entry_size(commit_times)}
+        write_atomically(location, encode_cache({key: entry}))
+    except (TypeError, ValueError, struct.error, IOError, OSError) as error:
+        log.warning("Failed to write gitmit shared commit times\tlocation=%s\terror=%s", location, error)
+        return
+
+    evict_shared_cache(cache_dir, max_bytes=max_bytes, keep=location)
+
+def evict_shared_cache(cache_dir, max_bytes=None, keep=None):
+    """
+    Remove the least recently used files until they take up no more than
+    max_bytes, which defaults to default_max_bytes, and return how many we
+    removed.
+
+    The file at ``keep`` is never removed.
+    """
+    if max_bytes is None:
+        max_bytes = default_max_bytes
+
+    folder = os.path.join(cache_dir, "commit_times")
+    if not os.path.isdir(folder):
+        return 0
+
+    files = []
+    total = 0
+    for entry in os.scandir(folder):
+        if not entry.name.endswith(".bin"):
+            continue
+        try:
+            stat = entry.stat()
+        except (IOError, OSError):
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    removed = 0
+    for _, size, location in sorted(files):
+        if total <= max_bytes:
+            break
+        if location == keep:
+            continue
+
+        try:
+            os.remove(location)
+        except (IOError, OSError):
+            # Most likely someone else removed it first
+            pass
+        else:
+            removed += 1
+        total -= size
+
+    if removed:
+        log.debug("Evicted gitmit shared commit times\tcache_dir=%s\tremoved=%s\tremaining_bytes=%s", cache_dir, removed, total)
+    return removed
@@ -0,0 +1,300 @@
+"""
+A cache of commit times in a SQLite database, as an alternative to the file
+in gitmit.cache. Use it with ``GitTimes(cache_backend="sqlite")`` or
+``gitmit --cache-backend sqlite``.
+
+The database has the same get_cached_commit_times and set_cached_commit_times
+as gitmit.cache, but stores things differently:
+
+commits
+    One row for each commit and the backend that found commit times as of that
+    commit.
+
+times
+    One row for each of those commits and each path, with the commit time of
+    that path as of that commit. This never changes for a commit and path, so
+    every set of files shares the same rows for the same HEAD and backend, and
+    setting commit times only adds the rows that aren't already there.
+
+filters
+    One row for each parent_dir, set of files and backend, keyed by
+    gitmit.cache.cache_key, pointing at the commit it was last found for,
+    along with when it was last used and roughly how big it is.
+
+members
+    Which paths belong to which set of files.
+
+Paths, commits and sets of files are referred to by ids that are never reused,
+so a row left behind can never be mistaken for a different path or commit.
+
+The database uses write ahead logging, so readers don't block each other or a
+writer, and writers wait for each other rather than failing.
+
+The least recently used sets of files are removed in the same way as
+gitmit.cache, along with any rows for commits and paths that nothing refers to
+anymore.
+"""
+from gitmit.cache import cache_key, entry_size, default_max_entries, default_max_bytes
+
+import logging
+import sqlite3
+import json
+import time
+import os
+
+log = logging.getLogger("gitmit.sqlite_cache")
+
+VERSION = 2
+
+tables = ("commits", "paths", "times", "filters", "members")
+
+schema = [
+      "CREATE TABLE IF NOT EXISTS commits (id INTEGER PRIMARY KEY AUTOINCREMENT, oid TEXT NOT NULL, backend TEXT NOT NULL, UNIQUE (oid, backend))"
+    , "CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL UNIQUE)"
+    , "CREATE TABLE IF NOT EXISTS times (commit_id INTEGER NOT NULL, path_id INTEGER NOT NULL, epoch INTEGER NOT NULL, PRIMARY KEY (commit_id, path_id)) WITHOUT ROWID"
+    , "CREATE TABLE IF NOT EXISTS filters (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, parent_dir TEXT NOT NULL, commit_id INTEGER NOT NULL, last_used REAL NOT NULL, size INTEGER NOT NULL)"
+    , "CREATE TABLE IF NOT EXISTS members (filter_id INTEGER NOT NULL, path_id INTEGER NOT NULL, PRIMARY KEY (filter_id, path_id)) WITHOUT ROWID"
+    ]
+
+def sqlite_cache_location(root_folder):
+    """
+    Return us the location to the commit times database
+
+    This is <root_folder>/.git/gitmit_cached_commit_times.sqlite
+    """
+    return os.path.join(root_folder, ".git", "gitmit_cached_commit_times.sqlite")
+
+def connect(root_folder):
+    """
+    Return a connection to the database with our tables in it.
+
+    If the database is from a different version of gitmit, we start it afresh.
+    """
+    location = sqlite_cache_location(root_folder)
+    if not os.path.isdir(os.path.dirname(location)):
+        raise sqlite3.OperationalError("No .git folder at {0}".format(root_folder))
+
+    connection = sqlite3.connect(location, timeout=30)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != VERSION:
+            with connection:
+                if version != 0:
+                    log.info("Starting the gitmit commit times database afresh\tlocation=%s\tversion=%s", location, version)
+                    for table in tables:
+                        connection.execute("DROP TABLE IF EXISTS {0}".format(table))
+                for statement in schema:
+                    connection.execute(statement)
+                connection.execute("PRAGMA user_version={0}".format(VERSION))
+    except sqlite3.Error:
+        connection.close()
+        raise
+
+    return connection
+
+def next_use(connection):
+    """Return a last_used that is after the last_used of every set of files"""
+    latest = connection.execute("SELECT MAX(last_used) FROM filters").fetchone()[0]
+    return max(time.time(), (latest or 0) + 0.001)
+
+def remove_unused(connection):
+    """Remove the rows for commits and paths that nothing refers to"""
+    connection.execute("DELETE FROM times WHERE commit_id NOT IN (SELECT commit_id FROM filters)")
+    connection.execute("DELETE FROM commits WHERE id NOT IN (SELECT commit_id FROM filters)")
+    connection.execute("DELETE FROM paths WHERE id NOT IN (SELECT path_id FROM members) AND id NOT IN (SELECT path_id FROM times)")
+
+def evict(connection, keep, max_entries, max_bytes):
+    """
+    Remove the least recently used sets of files until there are no more than
+    max_entries and they take no more than max_bytes, and then remove the rows
+    that nothing refers to anymore.
+
+    The set of files with the id ``keep`` is never removed.
+    """
+    rows = connection.execute("SELECT id, size FROM filters ORDER BY last_used").fetchall()
+    count = len(rows)
+    total = sum(size for _, size in rows)
+
+    removed = []
+    for filter_id, size in rows:
+        if count <= max_entries and total <= max_bytes:
+            break
+        if filter_id == keep:
+            continue
+        removed.append(filter_id)
+        count -= 1
+        total -= size
+
+    if not removed:
+        return
+
+    for filter_id in removed:
+        connection.execute("DELETE FROM filters WHERE id = ?", (filter_id, ))
+        connection.execute("DELETE FROM members WHERE filter_id = ?", (filter_id, ))
+
+    remove_unused(connection)
+
+def commit_times_for(connection, filter_id, commit_id):
+    """Return {path: epoch} for the paths of this set of files as of this commit"""
+    query = """
+        SELECT paths.path, times.epoch FROM members
+        JOIN paths ON paths.id = members.path_id
+        JOIN times ON times.commit_id = ? AND times.path_id = members.path_id
+        WHERE members.filter_id = ?
+    """
+    return dict(connection.execute(query, (commit_id, filter_id)))
+
+def get_all_cached_commit_times(root_folder):
+    """
+    Return {key: entry} for every set of files in the database, in the same
+    shape as gitmit.cache.get_all_cached_commit_times.
+
+    If we can't read the database, issue a warning and return an empty
+    dictionary, it is just a cache after all!
+    """
+    try:
+        connection = connect(root_folder)
+        try:
+            query = "SELECT filters.id, filters.key, filters.parent_dir, filters.commit_id, commits.oid, commits.backend, filters.last_used, filters.size FROM filters JOIN commits ON commits.id = filters.commit_id"
+            result = {}
+            for filter_id, key, parent_dir, commit_id, oid, backend, last_used, size in connection.execute(query).fetchall():
+                result[key] = {"parent_dir": parent_dir, "backend": backend, "commit": oid, "commit_times": commit_times_for(connection, filter_id, commit_id), "last_used": last_used, "size": size}
+            return result
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        log.warning("Failed to read gitmit commit times database\tlocation=%s\terror=%s", sqlite_cache_location(root_folder), error)
+        return {}
+
+def export_cached_commit_times(root_folder, fileobj):
+    """Write the database as json to this file object"""
+    json.dump({"version": VERSION, "entries": get_all_cached_commit_times(root_folder)}, fileobj, indent=2, sort_keys=True)
+
+def get_cached_commit_times(root_folder, parent_dir, sorted_relpaths, backend="dulwich"):
+    """
+    Get the cached commit times for the combination of this parent_dir, relpaths
+    and backend
+
+    Return the commit assigned to this combination and the actual times!
+    """
+    key = cache_key(parent_dir, sorted_relpaths, backend)
+
+    try:
+        connection = connect(root_folder)
+        try:
+            query = "SELECT filters.id, filters.parent_dir, commits.backend, filters.commit_id, commits.oid, filters.last_used FROM filters JOIN commits ON commits.id = filters.commit_id WHERE filters.key = ?"
+            found = connection.execute(query, (key, )).fetchone()
+            if found is None or found[1] != parent_dir or found[2] != backend:
+                return None, {}
+
+            filter_id, _, _, commit_id, oid, last_used = found
+            commit_times = commit_times_for(connection, filter_id, commit_id)
+
+            # Only take the write lock if this isn't already the most recently used
+            if connection.execute("SELECT 1 FROM filters WHERE id != ? AND last_used >= ? LIMIT 1", (filter_id, last_used)).fetchone():
+                with connection:
+                    connection.execute("UPDATE filters SET last_used = ? WHERE id = ?", (next_use(connection), filter_id))
+
+            return oid, commit_times
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        log.warning("Failed to read gitmit commit times database\tlocation=%s\terror=%s", sqlite_cache_location(root_folder), error)
+        return None, {}
+
+def get_times_at_commit(root_folder, commit, paths, backend="dulwich"):
+    """
+    Return {path: epoch} for the paths we know the commit time of as of this
+    commit, from any set of files found by this backend.
+
+    Because the times rows are shared between sets of files, this is just a
+    lookup of the rows for this commit.
+    """
+    try:
+        connection = connect(root_folder)
+        try:
+            found = connection.execute("SELECT id FROM commits WHERE oid = ? AND backend = ?", (str(commit), backend)).fetchone()
+            if found is None:
+                return {}
+
+            with connection:
+                connection.execute("CREATE TEMP TABLE wanted (path TEXT PRIMARY KEY) WITHOUT ROWID")
+                connection.executemany("INSERT OR IGNORE INTO wanted (path) VALUES (?)", ((path, ) for path in sorted(paths)))
+                query = """
+                    SELECT paths.path, times.epoch FROM wanted
+                    JOIN paths ON paths.path = wanted.path
+                    JOIN times ON times.commit_id = ? AND times.path_id = paths.id
+                """
+                result = dict(connection.execute(query, (found[0], )))
+                connection.execute("DROP TABLE wanted")
+            return result
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        log.warning("Failed to read gitmit commit times database\tlocation=%s\terror=%s", sqlite_cache_location(root_folder), error)
+        return {}
+
+def set_cached_commit_times(root_folder, parent_dir, first_commit, commit_times, sorted_relpaths, max_entries=None, max_bytes=None, backend="dulwich"):
+    """
+    Set the cached commit times for this parent_dir, sorted_relpaths and
+    backend as of first_commit.
+
+    The commit times go into a temporary table first so that adding the paths,
+    times and members that aren't already there is done by sqlite rather than
+    a row at a time from python.
+
+    We then remove the least recently used sets of files until there are no
+    more than max_entries and they take up no more than max_bytes, which
+    default to the same as gitmit.cache. The set we just set is always kept.
+    """
+    if max_entries is None:
+        max_entries = default_max_entries
+    if max_bytes is None:
+        max_bytes = default_max_bytes
+
+    key = cache_key(parent_dir, sorted_relpaths, backend)
+    first_commit = str(first_commit)
+
+    try:
+        connection = connect(root_folder)
+        try:
+            with connection:
+                connection.execute("CREATE TEMP TABLE incoming (path TEXT PRIMARY KEY, epoch INTEGER NOT NULL) WITHOUT ROWID")
+                connection.executemany("INSERT INTO incoming (path, epoch) VALUES (?, ?)", sorted((path, int(epoch)) for path, epoch in commit_times.items()))
+
+                connection.execute("INSERT OR IGNORE INTO commits (oid, backend) VALUES (?, ?)", (first_commit, backend))
+                commit_id = connection.execute("SELECT id FROM commits WHERE oid = ? AND backend = ?", (first_commit, backend)).fetchone()[0]
+
+                connection.execute("INSERT OR IGNORE INTO paths (path) SELECT path FROM incoming")
+                connection.execute("INSERT OR IGNORE INTO times (commit_id, path_id, epoch) SELECT ?, paths.id, incoming.epoch FROM incoming JOIN paths ON paths.path = incoming.path", (commit_id, ))
+
+                last_used = next_use(connection)
+                previous = connection.execute("SELECT id, commit_id FROM filters WHERE key = ?", (key, )).fetchone()
+                if previous is None:
+                    cursor = connection.execute("INSERT INTO filters (key, parent_dir, commit_id, last_used, size) VALUES (?, ?, ?, ?, ?)"
+                        , (key, parent_dir, commit_id, last_used, entry_size(commit_times))
+                        )
+                    filter_id = cursor.lastrowid
+                else:
+                    filter_id = previous[0]
+                    connection.execute("UPDATE filters SET parent_dir = ?, commit_id = ?, last_used = ?, size = ? WHERE id = ?"
+                        , (parent_dir, commit_id, last_used, entry_size(commit_times), filter_id)
+                        )
+
+                removed = connection.execute("DELETE FROM members WHERE filter_id = ? AND path_id NOT IN (SELECT paths.id FROM incoming JOIN paths ON paths.path = incoming.path)", (filter_id, )).rowcount
+                connection.execute("INSERT OR IGNORE INTO members (filter_id, path_id) SELECT ?, paths.id FROM incoming JOIN paths ON paths.path = incoming.path", (filter_id, ))
+
+                connection.execute("DROP TABLE incoming")
+
+                # Forget the commit we had before if nothing else uses it
+                if (previous is not None and previous[1] != commit_id) or removed:
+                    remove_unused(connection)
+
+                evict(connection, filter_id, max_entries, max_bytes)
+        finally:
+            connection.close()
+    except sqlite3.Error as error:
+        log.warning("Failed to write gitmit commit times database\tlocation=%s\terror=%s", sqlite_cache_location(root_folder), error)
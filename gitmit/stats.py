@@ -0,0 +1,144 @@
+"""
+Counts and timings of what happened while we found commit times::
+
+    gittimes = GitTimes(root_folder, ".")
+    for relpath, epoch in gittimes.find():
+        pass
+
+    print(gittimes.stats.report())
+
+``gitmit --stats`` prints the same report to stderr when it is done.
+
+The counts are:
+
+commits_walked
+    How many commits the walk looked at
+
+merge_commits
+    How many of those commits had more than one parent
+
+trees_decoded
+    How many tree objects were decoded
+
+tree_cache_hits
+    How many trees we got from the tree entries cache instead of decoding them
+
+entries_compared
+    How many tree entries were compared against the entries of a parent tree
+
+resolved
+    How many commits found the commit time for how many files, in buckets of
+    1, 2-9, 10-99, 100-999 and 1000+ files
+
+cache
+    What happened with the cache of commit times. One of "fast" when we used
+    gitmit.fast_path, "hit", "shared" when we used gitmit.shared_cache,
+    "superset" when we used the commit times other filters found, "refresh",
+    "miss", "bypassed" for walks that can't use the cache, or "disabled"
+
+The git backend only knows about commits_walked and resolved, because git
+itself does the rest.
+
+Phases are the wall time in seconds spent on each part of finding commit times:
+reading the index, filtering the files, expanding symlinked folders, the cache,
+the walk and the output. Because we yield commit times as we find them, the
+walk and the output take turns, and output is the time spent by whatever is
+using what we yield.
+
+If Stats is given a gitmit.trace.Tracer then the phases are also added to the
+trace as they happen.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+buckets = [(1, "1"), (9, "2-9"), (99, "10-99"), (999, "100-999")]
+
+def bucket_for(count):
+    """Return the name of the bucket for this many resolved files"""
+    for upto, name in buckets:
+        if count <= upto:
+            return name
+    return "1000+"
+
+class Stats(object):
+    """Holds the counts and phase timings for one search for commit times"""
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self.commits_walked = 0
+        self.merge_commits = 0
+        self.trees_decoded = 0
+        self.tree_cache_hits = 0
+        self.entries_compared = 0
+        self.resolved = OrderedDict((name, 0) for name in [name for _, name in buckets] + ["1000+"])
+        self.cache = None
+        self.phases = OrderedDict()
+
+    def resolved_files(self, count):
+        """Record that a commit found the commit time of count files"""
+        self.resolved[bucket_for(count)] += 1
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    @contextmanager
+    def timing(self, name, always=True):
+        """
+        Add the time spent in this context to the phase called name, and to
+        the trace if we have a tracer. See Tracer.add for what always means.
+        """
+        start = time.time()
+        traced = self.tracer.now() if self.tracer is not None else None
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+            if traced is not None:
+                self.tracer.add(name, "phase", traced, self.tracer.now(), always=always)
+
+    def timed(self, name, iterable):
+        """Yield from iterable and add the time spent making each item to the phase called name"""
+        iterator = iter(iterable)
+        while True:
+            with self.timing(name, always=False):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def consumed(self, name, iterable):
+        """Yield from iterable and add the time until the next item is asked for to the phase called name"""
+        for item in iterable:
+            with self.timing(name, always=False):
+                yield item
+
+    def as_dict(self):
+        """Return the stats as a dictionary"""
+        return OrderedDict([
+              ("commits_walked", self.commits_walked)
+            , ("merge_commits", self.merge_commits)
+            , ("trees_decoded", self.trees_decoded)
+            , ("tree_cache_hits", self.tree_cache_hits)
+            , ("entries_compared", self.entries_compared)
+            , ("resolved", OrderedDict(self.resolved))
+            , ("cache", self.cache)
+            , ("phases", OrderedDict(self.phases))
+            ])
+
+    def report(self):
+        """Return the stats as lines of text"""
+        lines = []
+        for name, value in self.as_dict().items():
+            if name == "resolved":
+                value = " ".join("{0}={1}".format(files, commits) for files, commits in value.items())
+                name = "commits resolving files"
+            elif name == "phases":
+                continue
+            lines.append("{0:<24} {1}".format(name.replace("_", " "), value))
+
+        for name, seconds in self.phases.items():
+            lines.append("{0:<24} {1:.3f}s".format("phase {0}".format(name), seconds))
+        lines.append("{0:<24} {1:.3f}s".format("phase total", sum(self.phases.values())))
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,162 @@
+"""
+Write a tar archive of the files we found commit times for, with the mtime of
+each member set to its commit time::
+
+    from gitmit.tar import write_tar
+    from gitmit.mit import GitTimes
+
+    with open("context.tar", "wb") as fileobj:
+        write_tar(root_folder, sorted(GitTimes(root_folder, ".").find()), fileobj)
+
+This is what ``gitmit --tar`` does, and is useful for making a docker context
+that has the same mtimes no matter when the repository was cloned.
+
+Files under symlinked folders are written as normal files in a folder, the
+same as GitTimes gives them commit times as separate copies. Symlinks to files
+are written as symlinks.
+
+Members are written in the order of ``times``. GitTimes.write_tar holds on to
+every commit time until the walk is finished and gives them to us sorted by
+path, so nothing is written until all of them are found, but the archive is
+reproducible.
+
+We write the tar headers ourselves. If ``fileobj`` has a real file descriptor
+we use ``os.sendfile`` to copy the contents of each file, otherwise we copy
+them with large reads.
+"""
+import tarfile
+import logging
+import stat
+import os
+
+log = logging.getLogger("gitmit.tar")
+
+def tarinfo_for(relpath, location, epoch):
+    """
+    Return a TarInfo for this file, or None if it doesn't exist.
+
+    Members have the commit time as their mtime and no owner, so the archive
+    is the same no matter who made it or when.
+    """
+    try:
+        st = os.lstat(location)
+    except OSError as error:
+        log.warning("Couldn't add file to the tar\tlocation=%s\terror=%s", location, error)
+        return None
+
+    info = tarfile.TarInfo(relpath)
+    info.mtime = epoch
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+
+    if stat.S_ISLNK(st.st_mode):
+        if os.path.isdir(location):
+            # The files under here are given to us separately
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+        else:
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(location)
+    elif stat.S_ISREG(st.st_mode):
+        info.size = st.st_size
+    else:
+        log.warning("Not adding something that isn't a file to the tar\tlocation=%s", location)
+        return None
+
+    return info
+
+class TarWriter(object):
+    """
+    Writes tar members to ``fileobj`` one at a time.
+
+    We copy file contents with os.sendfile while we can, and fall back to
+    reading ``buffer_size`` bytes at a time when we can't.
+    """
+    def __init__(self, fileobj, buffer_size=1024 * 1024):
+        self.fileobj = fileobj
+        self.buffer_size = buffer_size
+        self.written = 0
+
+        self.fileno = None
+        if hasattr(os, "sendfile"):
+            try:
+                self.fileno = fileobj.fileno()
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.written += len(data)
+
+    def add(self, info, location):
+        """Write the header for this TarInfo and the contents of location"""
+        self.write(info.tobuf(tarfile.DEFAULT_FORMAT, "utf-8", "surrogateescape"))
+        if not info.isreg():
+            return
+
+        with open(location, "rb") as fle:
+            copied = self.copy(fle, info.size)
+
+        # The file got smaller since we looked at it, so pad it to the size we said it was
+        if copied < info.size:
+            log.warning("File changed while adding it to the tar\tlocation=%s", location)
+            self.write(b"\0" * (info.size - copied))
+
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            self.write(b"\0" * (tarfile.BLOCKSIZE - remainder))
+
+    def copy(self, fle, size):
+        """Copy up to size bytes from fle and return how many we copied"""
+        copied = 0
+
+        if self.fileno is not None:
+            self.fileobj.flush()
+            try:
+                while copied < size:
+                    sent = os.sendfile(self.fileno, fle.fileno(), copied, size - copied)
+                    if not sent:
+                        break
+                    copied += sent
+                self.written += copied
+                return copied
+            except OSError as error:
+                log.debug("Can't use sendfile, copying instead\terror=%s", error)
+                self.fileno = None
+                self.written += copied
+                fle.seek(copied)
+
+        while copied < size:
+            data = fle.read(min(self.buffer_size, size - copied))
+            if not data:
+                break
+            self.write(data)
+            copied += len(data)
+
+        return copied
+
+    def close(self):
+        """Write the end of archive marker and pad to a whole record like tarfile does"""
+        self.write(b"\0" * (tarfile.BLOCKSIZE * 2))
+        remainder = self.written % tarfile.RECORDSIZE
+        if remainder:
+            self.write(b"\0" * (tarfile.RECORDSIZE - remainder))
+        self.fileobj.flush()
+
+def write_tar(folder, times, fileobj, buffer_size=1024 * 1024):
+    """
+    Write a tar archive of the (relpath, epoch) in ``times`` to ``fileobj``,
+    where relpath is relative to ``folder``. Return how many members were
+    written.
+    """
+    count = 0
+    writer = TarWriter(fileobj, buffer_size=buffer_size)
+    for relpath, epoch in times:
+        location = os.path.join(folder, relpath)
+        info = tarinfo_for(relpath, location, epoch)
+        if info is not None:
+            writer.add(info, location)
+            count += 1
+    writer.close()
+    return count
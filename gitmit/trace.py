@@ -0,0 +1,130 @@
+"""
+Record what gitmit does as a timeline that can be opened in chrome://tracing
+or https://ui.perfetto.dev::
+
+    tracer = Tracer()
+    list(GitTimes(root_folder, ".", tracer=tracer).find())
+    tracer.save("trace.json")
+
+``gitmit --trace trace.json`` does the same thing.
+
+The timeline has:
+
+* A span for each phase of finding commit times, see gitmit.stats
+* A span for each ``batch_size`` commits of the walk, with how many files
+  those commits found, and a counter of how many files are left to find
+* A span for each commit whose diff took longer than ``min_duration`` seconds
+* A span for comparing each folder with at least ``min_entries`` entries that
+  took longer than ``min_duration`` seconds, so big diffs can be pinned on the
+  folders they spent their time in
+* Spans for loading and decoding commits and trees that took longer than
+  ``min_duration`` seconds
+
+Spans shorter than ``min_duration`` are left out so that the trace of a big
+repository stays a reasonable size, except for the phases which are always
+there.
+
+The output is the json format of the Trace Event Format, with times in
+microseconds since the Tracer was made.
+"""
+from gitmit import VERSION
+
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+class Tracer(object):
+    """Collects trace events"""
+    def __init__(self, min_duration=0.001, batch_size=100, min_entries=100):
+        self.events = []
+        self.pid = os.getpid()
+        self.batch_size = batch_size
+        self.min_entries = min_entries
+        self.min_duration = min_duration
+
+        self.start = time.perf_counter()
+        self.batch = None
+        self.walked = 0
+
+    def now(self):
+        return time.perf_counter()
+
+    def microseconds(self, when):
+        return (when - self.start) * 1000000
+
+    def add(self, name, cat, start, end, args=None, always=False):
+        """
+        Add a span from start to end, which are times from self.now()
+
+        The span is only added if it's at least self.min_duration long, or if
+        ``always`` is True.
+        """
+        if not always and end - start < self.min_duration:
+            return
+
+        event = {
+              "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": threading.get_ident()
+            , "ts": self.microseconds(start), "dur": self.microseconds(end) - self.microseconds(start)
+            }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    @contextmanager
+    def span(self, name, cat, always=True, **args):
+        """
+        Add a span for the time spent in this context.
+
+        We yield the dictionary of args for the span so more can be added to it
+        before the span ends.
+        """
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.add(name, cat, start, self.now(), args, always=always)
+
+    def counter(self, name, **values):
+        """Add the current value of a counter"""
+        self.events.append({"name": name, "ph": "C", "pid": self.pid, "ts": self.microseconds(self.now()), "args": values})
+
+    def walked_commit(self, found, remaining):
+        """
+        Record that the walk looked at another commit, which found the commit
+        times of ``found`` files and left ``remaining`` files to find.
+
+        Every self.batch_size commits we add a span for those commits.
+        """
+        if self.batch is None:
+            self.batch = [self.now(), self.walked, 0]
+
+        self.walked += 1
+        self.batch[2] += found
+
+        if self.walked - self.batch[1] >= self.batch_size:
+            self.finish_batch(remaining)
+
+    def finish_batch(self, remaining):
+        """Add the span for the commits we've walked since the last batch"""
+        if self.batch is None:
+            return
+
+        start, first, found = self.batch
+        self.batch = None
+        self.add("commits {0}-{1}".format(first, self.walked - 1), "walk", start, self.now(), {"found": found, "remaining": remaining}, always=True)
+        self.counter("remaining files", remaining=remaining)
+
+    def as_dict(self):
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "gitmit"}}]
+        return {"traceEvents": metadata + self.events, "displayTimeUnit": "ms", "otherData": {"gitmit": VERSION}}
+
+    def write(self, fileobj):
+        """Write the trace as json to this file object"""
+        json.dump(self.as_dict(), fileobj)
+
+    def save(self, location):
+        """Write the trace as json to this location"""
+        with open(location, "w") as fle:
+            self.write(fle)
@@ -0,0 +1,218 @@
+"""
+This holds a persistent store of the entries in tree objects.
+
+Tree objects never change, so once we have decoded a tree we can keep the
+result under the .git folder keyed by the oid of that tree and never decode
+it again.
+
+The file is a compact binary format::
+
+    header: b"GMTE" + uint8 version
+    record: 20 byte tree oid + uint32 length of entries + entries
+    entry:  uint8 is_tree + 20 byte oid + uint16 length of name + name
+
+Records are written in most recently used order and we stop writing records
+once we reach ``max_bytes``, so the least recently used trees fall off the end.
+
+Saving holds the lock from gitmit.atomic and reads the file again before
+replacing it, so the trees other processes saved since we loaded it are kept.
+"""
+
+from gitmit.atomic import write_atomically, locked
+
+from collections import OrderedDict
+import binascii
+import logging
+import struct
+import os
+
+log = logging.getLogger("gitmit.tree_cache")
+
+MAGIC = b"GMTE"
+VERSION = 1
+
+header_struct = struct.Struct(">4sB")
+record_struct = struct.Struct(">20sI")
+entry_struct = struct.Struct(">B20sH")
+
+def tree_cache_location(root_folder):
+    """
+    Return us the location to the tree entries cache
+
+    This is <root_folder>/.git/gitmit_tree_entries.bin
+    """
+    return os.path.join(root_folder, ".git", "gitmit_tree_entries.bin")
+
+def encode_entries(entries):
+    """Return the bytes representing these (name, is_tree, oid) entries"""
+    result = []
+    for name, is_tree, oid in entries:
+        name = name.encode("utf-8")
+        result.append(entry_struct.pack(1 if is_tree else 0, binascii.unhexlify(oid), len(name)))
+        result.append(name)
+    return b"".join(result)
+
+def decode_entries(data):
+    """
+    Return a tuple of (name, is_tree, oid) from the bytes of encoded entries
+
+    Raises struct.error, UnicodeDecodeError or ValueError if the bytes aren't
+    valid entries.
+    """
+    result = []
+    offset = 0
+    end = len(data)
+    while offset < end:
+        is_tree, oid, length = entry_struct.unpack_from(data, offset)
+        offset += entry_struct.size
+        if offset + length > end:
+            raise ValueError("Entry name is truncated")
+        name = bytes(data[offset:offset + length]).decode("utf-8")
+        offset += length
+        result.append((name, bool(is_tree), binascii.hexlify(oid)))
+    return tuple(result)
+
+def read_records(location):
+    """
+    Return an ordered dictionary of {oid: encoded_entries} from the file at
+    this location
+
+    If the file is invalid then we issue a warning and return what we could
+    read, it is just a cache after all!
+    """
+    records = OrderedDict()
+    if not os.path.exists(location):
+        return records
+
+    try:
+        with open(location, "rb") as fle:
+            data = fle.read()
+    except (IOError, OSError) as error:
+        log.warning("Failed to read gitmit tree cache\tlocation=%s\terror=%s", location, error)
+        return records
+
+    if len(data) < header_struct.size or header_struct.unpack_from(data, 0) != (MAGIC, VERSION):
+        log.warning("Gitmit tree cache is not a version we understand\tlocation=%s", location)
+        return records
+
+    view = memoryview(data)
+    offset = header_struct.size
+    while offset < len(data):
+        if offset + record_struct.size > len(data):
+            log.warning("Gitmit tree cache is truncated\tlocation=%s", location)
+            break
+
+        oid, length = record_struct.unpack_from(data, offset)
+        offset += record_struct.size
+        if offset + length > len(data):
+            log.warning("Gitmit tree cache is truncated\tlocation=%s", location)
+            break
+
+        records[binascii.hexlify(oid)] = view[offset:offset + length]
+        offset += length
+
+    return records
+
+class TreeEntryCache(object):
+    """
+    Knows how to get and store the entries of tree objects on disk.
+
+    The file is only read the first time we ask for a tree, and is only
+    written when ``save`` is called and we found trees that weren't already
+    in the file.
+    """
+    def __init__(self, root_folder, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.root_folder = root_folder
+
+        self.added = False
+        self.records = None
+        self.used = OrderedDict()
+
+    @property
+    def location(self):
+        return tree_cache_location(self.root_folder)
+
+    def load(self):
+        """Read the records from disk into a dictionary of {oid: encoded_entries}"""
+        self.records = read_records(self.location)
+
+    def get(self, tree_oid):
+        """
+        Return the entries for this tree_oid or None if we don't have them
+
+        If the record for this tree is invalid then we issue a warning, forget
+        it and return None.
+        """
+        if self.records is None:
+            self.load()
+
+        data = self.records.get(tree_oid)
+        if data is None:
+            return None
+
+        try:
+            entries = decode_entries(data)
+        except (struct.error, UnicodeDecodeError, ValueError) as error:
+            log.warning("Gitmit tree cache has an invalid record\tlocation=%s\ttree=%s\terror=%s", self.location, tree_oid, error)
+            del self.records[tree_oid]
+            self.used.pop(tree_oid, None)
+            return None
+
+        self.used.pop(tree_oid, None)
+        self.used[tree_oid] = data
+        return entries
+
+    def add(self, tree_oid, entries):
+        """Remember the (name, is_tree, oid) entries for this tree_oid"""
+        if self.records is None:
+            self.load()
+
+        data = self.records[tree_oid] = encode_entries(entries)
+        self.used.pop(tree_oid, None)
+        self.used[tree_oid] = data
+        self.added = True
+
+    def save(self):
+        """
+        Write the records to disk if we have added any.
+
+        We hold the lock while we read what is on disk now and write it back
+        with our records, so trees other processes saved since we loaded the
+        file aren't lost.
+
+        The trees used since we loaded the file are written first, most
+        recently used first, followed by what is on disk now in the order it
+        already had, and then the rest of ours. We stop once we get to
+        max_bytes.
+        """
+        if not self.added:
+            return
+
+        def ordered(on_disk):
+            for oid in reversed(self.used):
+                yield oid, self.used[oid]
+            for oid, data in on_disk.items():
+                if oid not in self.used:
+                    yield oid, data
+            for oid, data in self.records.items():
+                if oid not in self.used and oid not in on_disk:
+                    yield oid, data
+
+        try:
+            with locked(self.location):
+                size = header_struct.size
+                chunks = [header_struct.pack(MAGIC, VERSION)]
+                for oid, data in ordered(read_records(self.location)):
+                    size += record_struct.size + len(data)
+                    if size > self.max_bytes:
+                        break
+                    chunks.append(record_struct.pack(binascii.unhexlify(oid), len(data)))
+                    chunks.append(bytes(data))
+
+                log.debug("Writing gitmit tree cache\tlocation=%s", self.location)
+                write_atomically(self.location, b"".join(chunks))
+        except (IOError, OSError) as error:
+            log.warning("Failed to write gitmit tree cache\tlocation=%s\terror=%s", self.location, error)
+        else:
+            self.added = False
@@ -6,6 +6,7 @@ setup(
     , version = VERSION
     , packages = ['gitmit'] + ['gitmit.%s' % pkg for pkg in find_packages('gitmit')]
     , include_package_data = True
+    , python_requires = ">=3.5"
 
     , install_requires =
       [ "dulwich==0.19.6"
@@ -34,5 +35,12 @@ setup(
     , long_description = open("README.rst").read()
     , license = "MIT"
     , keywords = "git,commit,mtime"
+    , classifiers =
+      [ "Programming Language :: Python :: 3"
+      , "Programming Language :: Python :: 3 :: Only"
+      , "Programming Language :: Python :: 3.5"
+      , "Programming Language :: Python :: 3.6"
+      , "Programming Language :: Python :: 3.7"
+      ]
     )
 
@@ -0,0 +1,62 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.apply import apply_mtimes, set_mtime, Applied, CHANGED, UNCHANGED, MISSING, FAILED
+
+import errno
+import mock
+import os
+
+describe TestCase, "set_mtime":
+    it "sets the modified time unless it's already right":
+        with self.a_temp_file("stuff") as location:
+            self.assertEqual(set_mtime(location, 1459034839), CHANGED)
+            self.assertEqual(os.stat(location).st_mtime, 1459034839)
+            self.assertEqual(os.stat(location).st_atime, 1459034839)
+
+            with mock.patch("os.utime") as utime:
+                self.assertEqual(set_mtime(location, 1459034839), UNCHANGED)
+            self.assertEqual(len(utime.mock_calls), 0)
+
+    it "says when the file is missing":
+        with self.a_temp_dir() as folder:
+            self.assertEqual(set_mtime(os.path.join(folder, "nope"), 1459034839), MISSING)
+
+    it "says when it fails":
+        with self.a_temp_file("stuff") as location:
+            with mock.patch("os.utime", side_effect=OSError(errno.EPERM, "nope")):
+                self.assertEqual(set_mtime(location, 1459034839), FAILED)
+
+    it "sets the time of symlinks rather than what they point to":
+        if os.utime not in os.supports_follow_symlinks:
+            return
+
+        with self.a_temp_dir() as folder:
+            self.touch_file(folder, "target")
+            os.utime(os.path.join(folder, "target"), (1000, 1000))
+            os.symlink("target", os.path.join(folder, "link"))
+
+            self.assertEqual(set_mtime(os.path.join(folder, "link"), 1459034839), CHANGED)
+            self.assertEqual(os.lstat(os.path.join(folder, "link")).st_mtime, 1459034839)
+            self.assertEqual(os.stat(os.path.join(folder, "target")).st_mtime, 1000)
+
+describe TestCase, "apply_mtimes":
+    it "sets the times of all the files in all the batches and counts what happened":
+        with self.a_temp_dir() as folder:
+            os.mkdir(os.path.join(folder, "sub"))
+            names = ["one", "two", "sub/three", "sub/four", "sub/five"]
+            for name in names:
+                self.touch_file(folder, name)
+            os.utime(os.path.join(folder, "two"), (20, 20))
+
+            batches = [[("one", 10), ("two", 20)], [("sub/three", 30)], [("sub/four", 40), ("sub/five", 50), ("gone", 60)]]
+            for chunk_size in (1, 2, 1000):
+                applied = apply_mtimes(folder, iter(batches), workers=3, chunk_size=chunk_size)
+                if chunk_size == 1:
+                    self.assertEqual(applied, Applied(changed=4, unchanged=1, missing=1, failed=0))
+                else:
+                    self.assertEqual(applied, Applied(changed=0, unchanged=5, missing=1, failed=0))
+
+                for name, expected in zip(names, [10, 20, 30, 40, 50]):
+                    self.assertEqual(os.stat(os.path.join(folder, name)).st_mtime, expected)
@@ -0,0 +1,57 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.atomic import write_atomically, locked
+
+import threading
+import mock
+import time
+import os
+
+describe TestCase, "write_atomically":
+    it "replaces the file without leaving anything behind":
+        with self.a_temp_dir() as dirname:
+            location = os.path.join(dirname, "thing")
+            write_atomically(location, b"one")
+            write_atomically(location, b"two")
+
+            with open(location, "rb") as fle:
+                self.assertEqual(fle.read(), b"two")
+            self.assertEqual(os.listdir(dirname), ["thing"])
+
+    it "leaves the old file alone and removes the temporary file if it can't rename":
+        with self.a_temp_dir() as dirname:
+            location = os.path.join(dirname, "thing")
+            write_atomically(location, b"one")
+
+            with mock.patch("os.replace", side_effect=OSError("nope")):
+                with self.assertRaises(OSError):
+                    write_atomically(location, b"two")
+
+            with open(location, "rb") as fle:
+                self.assertEqual(fle.read(), b"one")
+            self.assertEqual(os.listdir(dirname), ["thing"])
+
+describe TestCase, "locked":
+    it "only lets one holder in at a time":
+        with self.a_temp_dir() as dirname:
+            location = os.path.join(dirname, "thing")
+            happened = []
+
+            def hold(name):
+                with locked(location):
+                    happened.append(("start", name))
+                    time.sleep(0.05)
+                    happened.append(("end", name))
+
+            threads = [threading.Thread(target=hold, args=(name, )) for name in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(happened), 8)
+            for index in range(0, 8, 2):
+                self.assertEqual(happened[index][0], "start")
+                self.assertEqual(happened[index + 1], ("end", happened[index][1]))
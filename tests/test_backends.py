@@ -0,0 +1,42 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.backends import repo_for, cache_for
+from gitmit import cache, sqlite_cache
+from gitmit.git_log import GitLogRepo
+from gitmit.repo import Repo
+
+import mock
+
+describe TestCase, "repo_for":
+    it "returns the repository for the backend":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            tree_cache = mock.Mock(name="tree_cache")
+
+            repo = repo_for(root_folder, tree_cache=tree_cache)
+            self.assertIs(type(repo), Repo)
+            self.assertIs(repo.tree_cache, tree_cache)
+
+            repo = repo_for(root_folder, "git", tree_cache=tree_cache)
+            self.assertIs(type(repo), GitLogRepo)
+            self.assertEqual(repo.root_folder, root_folder)
+
+    it "falls back to dulwich if there is no git binary":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            with mock.patch("shutil.which", mock.Mock(name="which", return_value=None)):
+                self.assertIs(type(repo_for(root_folder, "git")), Repo)
+
+    it "complains about unknown backends":
+        with self.assertRaises(ValueError):
+            repo_for("root_folder", "svn")
+
+describe TestCase, "cache_for":
+    it "returns the module for the cache backend":
+        self.assertIs(cache_for(), cache)
+        self.assertIs(cache_for("file"), cache)
+        self.assertIs(cache_for("sqlite"), sqlite_cache)
+
+    it "complains about unknown cache backends":
+        with self.assertRaises(ValueError):
+            cache_for("redis")
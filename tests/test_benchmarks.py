@@ -0,0 +1,116 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from benchmarks.generate import generate_repo, paths_for
+from benchmarks.scaling import Case, cases_for, compare, run_case
+from benchmarks import micro, startup
+from gitmit.fast_path import get_fast_path
+from gitmit.mit import GitTimes
+
+import mock
+import os
+
+describe TestCase, "generate_repo":
+    it "spreads the files over folders of the right depth":
+        paths = paths_for(100, 2, per_folder=10)
+        self.assertEqual(len(set(paths)), 100)
+        self.assertEqual(set(path.count("/") for path in paths), set([2]))
+        self.assertEqual(len(set(os.path.dirname(path) for path in paths)), 10)
+
+        self.assertEqual(paths_for(3, 0), ["file0.txt", "file1.txt", "file2.txt"])
+
+    it "makes a repository with the shape we ask for":
+        with self.a_temp_dir() as root_folder:
+            location = os.path.join(root_folder, "repo")
+            generated = generate_repo(location, files=60, depth=2, commits=12, merge_every=4, symlinks=2, per_folder=10)
+            self.assertEqual((generated.files, generated.commits, generated.merges, generated.symlinks), (60, 12, 2, 2))
+
+            # The side commits of each merge are there too
+            self.assertEqual(self.do_git_cmd(location, "rev-list", "--count", "HEAD").strip(), b"14")
+            self.assertEqual(self.do_git_cmd(location, "rev-list", "--count", "--merges", "HEAD").strip(), b"2")
+            assert os.path.islink(os.path.join(location, "link0"))
+
+            found = dict(GitTimes(location, ".", silent=True, with_cache=False).find())
+            self.assertEqual(len([path for path in found if path.startswith("d")]), 60)
+            self.assertEqual(len([path for path in found if path.startswith("link")]), 2 + 60)
+            self.assertEqual(dict(GitTimes(location, ".", silent=True, with_cache=False, backend="git").find()), found)
+
+            assert all(1500000000 <= epoch < 1500000000 + 14 * 60 for epoch in found.values())
+
+    it "makes the same repository each time":
+        with self.a_temp_dir() as root_folder:
+            heads = []
+            for name in ("one", "two"):
+                generate_repo(os.path.join(root_folder, name), files=30, depth=1, commits=5, merge_every=2)
+                heads.append(self.do_git_cmd(os.path.join(root_folder, name), "rev-parse", "HEAD"))
+            self.assertEqual(heads[0], heads[1])
+
+describe TestCase, "scaling":
+    it "changes one axis of the base case at a time":
+        names = [case.name for case in cases_for("small")]
+        self.assertEqual(names[0], "base")
+        self.assertEqual(names[1:3], ["files=2000", "files=8000"])
+        self.assertEqual([case.name for case in cases_for("small", only=["depth"])], ["base", "depth=1", "depth=6"])
+
+    it "compares timings that are in both results":
+        old = {"cases": [{"case": {"name": "base"}, "timings": {"no_cache": {"best": 2.0}, "gone": {"best": 1.0}}}]}
+        new = {"cases":
+            [ {"case": {"name": "base"}, "timings": {"no_cache": {"best": 1.0}, "new": {"best": 1.0}}}
+            , {"case": {"name": "other"}, "timings": {"no_cache": {"best": 1.0}}}
+            ]
+          }
+        self.assertEqual(list(compare(old, new)), [("base", "no_cache", 2.0, 1.0, 0.5)])
+
+    it "only uses the fast path in the fast_path timing":
+        found = []
+        def recording(*args, **kwargs):
+            result = get_fast_path(*args, **kwargs)
+            found.append(result is not None)
+            return result
+
+        with self.a_temp_dir() as work_dir:
+            case = Case("base", files=30, depth=1, commits=5, merge_every=0, symlinks=0)
+            with mock.patch("gitmit.mit.get_fast_path", recording):
+                result = run_case(case, os.path.join(work_dir, "base"), repeat=2)
+
+        self.assertEqual(list(result["timings"]), ["no_cache", "cold_cache", "warm_cache", "fast_path", "git_backend", "whatchanged"])
+        self.assertEqual(set(timing["result"] for name, timing in result["timings"].items() if name != "whatchanged"), set([30]))
+        self.assertEqual(found, [False, False, False, False, True, True])
+
+describe TestCase, "micro":
+    it "reports ops per second and peak memory for each benchmark":
+        with self.a_temp_dir() as work_dir:
+            reported = []
+            results = micro.run(60, 20, 5, repeat=1, work_dir=work_dir, report=reported.append)
+
+        self.assertEqual([result["name"] for result in results["results"]]
+            , [ "prefix_tree.fill", "prefix_tree.contains", "prefix_tree.remove", "is_filtered", "relpath_for"
+              , "differences_between.wide", "differences_between.deep"
+              ]
+            )
+        self.assertEqual(reported, results["results"])
+
+        for result in results["results"]:
+            assert result["ops_per_sec"] > 0, result
+            assert result["peak_bytes"] >= 0, result
+        self.assertEqual(results["results"][-1]["ops"], 4)
+
+    it "only runs the benchmarks we ask for":
+        with self.a_temp_dir() as work_dir:
+            results = micro.run(60, 20, 5, repeat=1, only=["prefix_tree.f", "is_"], work_dir=work_dir)
+            self.assertEqual(os.listdir(work_dir), [])
+        self.assertEqual([result["name"] for result in results["results"]], ["prefix_tree.fill", "is_filtered"])
+
+describe TestCase, "startup":
+    it "parses the output of python -X importtime":
+        output = "\n".join([
+              "import time: self [us] | cumulative | imported package"
+            , "import time:       120 |        120 |   gitmit"
+            , "import time:      1500 |       2000 | gitmit.executor"
+            , "something else"
+            ])
+        self.assertEqual(startup.parse_importtime(output), {"gitmit": (120, 120), "gitmit.executor": (1500, 2000)})
+
+    it "knows gitmit.executor doesn't import the heavy modules":
+        self.assertEqual(startup.imported_by("gitmit.executor"), [])
@@ -5,59 +5,106 @@ from tests.helpers import TestCase
 from gitmit import cache
 
 from noseOfYeti.tokeniser.support import noy_sup_setUp
+import threading
 import json
 import uuid
+import mock
 import os
 
 describe TestCase, "cache_location":
-    it "joins the .git folder with gitmit_cached_commit_times.json":
+    it "joins the .git folder with gitmit_cached_commit_times.bin":
         with self.a_temp_dir() as dirname:
-            self.assertEqual(cache.cache_location(dirname), "{0}/.git/gitmit_cached_commit_times.json".format(dirname))
+            self.assertEqual(cache.cache_location(dirname), "{0}/.git/gitmit_cached_commit_times.bin".format(dirname))
+
+describe TestCase, "cache_key":
+    it "is the same for the same parent_dir and relpaths":
+        self.assertEqual(cache.cache_key("one", ["three", "two"]), cache.cache_key("one", ["three", "two"]))
+        self.assertEqual(len(cache.cache_key("one", ["three", "two"])), 40)
+
+    it "is different when the parent_dir, relpaths or backend are different":
+        key = cache.cache_key("one", ["three", "two"])
+        self.assertEqual(cache.cache_key("one", ["three", "two"], "dulwich"), key)
+        self.assertNotEqual(cache.cache_key("one", ["three", "two"], "git"), key)
+        self.assertNotEqual(cache.cache_key("two", ["three", "two"]), key)
+        self.assertNotEqual(cache.cache_key("one", ["three"]), key)
+        self.assertNotEqual(cache.cache_key("one", ["threetwo"]), key)
+        self.assertNotEqual(cache.cache_key("one", ["three", "two", "four"]), key)
+
+describe TestCase, "encode_cache":
+    it "can be read back with CacheFile":
+        entries = {
+              cache.cache_key("one", ["two"]): {"parent_dir": "one", "backend": "dulwich", "commit": "abc", "commit_times": {"one/two": 1, "one/fé": 2}, "last_used": 3.5, "size": 40}
+            , cache.cache_key(".", ["two"]): {"parent_dir": ".", "backend": "dulwich", "commit": "abc", "commit_times": {"one/two": 1500000000}, "last_used": 4.5, "size": 20}
+            , cache.cache_key("", []): {"parent_dir": "", "backend": "dulwich", "commit": "def", "commit_times": {}, "last_used": 5.5, "size": 0}
+            }
+        self.assertEqual(cache.CacheFile(cache.encode_cache(entries)).entries(), entries)
+        self.assertEqual(cache.CacheFile(cache.encode_cache({})).entries(), {})
+
+    it "only stores each path once":
+        commit_times = dict(("folder/file{0}".format(i), i) for i in range(100))
+        one = cache.encode_cache({cache.cache_key("a", []): {"parent_dir": "a", "backend": "dulwich", "commit": "abc", "commit_times": commit_times, "last_used": 1, "size": 1}})
+
+        entries = dict((cache.cache_key(str(i), []), {"parent_dir": "a", "backend": "dulwich", "commit": "abc", "commit_times": commit_times, "last_used": 1, "size": 1}) for i in range(2))
+        two = cache.encode_cache(entries)
+
+        # The second entry only adds an index record and the times
+        self.assertEqual(len(two) - len(one), cache.index_struct.size + 100 * 12)
+
+    it "complains about data that isn't a cache":
+        with self.assertRaises(cache.CacheFormatError):
+            cache.CacheFile(b"GMCT")
+        with self.assertRaises(cache.CacheFormatError):
+            cache.CacheFile(b"not a gitmit cache at all")
+        with self.assertRaises(cache.CacheFormatError):
+            cache.CacheFile(cache.encode_cache({cache.cache_key("", []): {"parent_dir": "", "backend": "dulwich", "commit": "a", "commit_times": {"b": 1}, "last_used": 1, "size": 1}})[:-3]).entries()
 
 describe TestCase, "get_all_cached_commit_times":
-    it "returns an empty array if the cache doesn't exist":
-        with self.a_temp_dir() as dirname:
-            self.assertEqual(cache.get_all_cached_commit_times(dirname), [])
-
-    it "returns an empty array if the cache isn't valid json":
-        with self.a_temp_dir() as dirname:
-            git_folder = os.path.join(dirname, ".git")
+    def write_cache(self, dirname, content):
+        git_folder = os.path.join(dirname, ".git")
+        if not os.path.exists(git_folder):
             os.mkdir(git_folder)
 
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write("[")
+        with open(cache.cache_location(dirname), "wb") as fle:
+            fle.write(content)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname), [])
-
-    it "returns an empty array if the cache isn't a list of dictionaries":
+    it "returns an empty dictionary if the cache doesn't exist":
         with self.a_temp_dir() as dirname:
-            git_folder = os.path.join(dirname, ".git")
-            os.mkdir(git_folder)
+            self.assertEqual(cache.get_all_cached_commit_times(dirname), {})
 
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write("[1, 2]")
-
-            self.assertEqual(cache.get_all_cached_commit_times(dirname), [])
-
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write('{"1":2}')
+    it "returns an empty dictionary if the cache isn't valid":
+        with self.a_temp_dir() as dirname:
+            for content in (b"", b"[", b'{"version": 2, "entries": {}}'):
+                self.write_cache(dirname, content)
+                with mock.patch("gitmit.cache.log") as log:
+                    self.assertEqual(cache.get_all_cached_commit_times(dirname), {})
+                self.assertEqual(len(log.warning.mock_calls), 1)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname), [])
+    it "returns the entries":
+        with self.a_temp_dir() as dirname:
+            entries = {cache.cache_key("a", []): {"parent_dir": "a", "backend": "dulwich", "commit": "b", "commit_times": {"c": 1}, "last_used": 2, "size": 3}}
+            self.write_cache(dirname, cache.encode_cache(entries))
+            self.assertEqual(cache.get_all_cached_commit_times(dirname), entries)
 
-    it "returns the result if it's a list of dictionaries":
+describe TestCase, "export_cached_commit_times":
+    it "writes the entries as json":
         with self.a_temp_dir() as dirname:
-            git_folder = os.path.join(dirname, ".git")
-            os.mkdir(git_folder)
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, "one", "abc", {"one/two": 1}, ["two"])
 
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write('[{"1":2}, {"3":4}]')
+            with self.a_temp_file() as filename:
+                with open(filename, "w") as fle:
+                    cache.export_cached_commit_times(dirname, fle)
+                with open(filename) as fle:
+                    exported = json.load(fle)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname), [{"1":2}, {"3":4}])
+            self.assertEqual(exported["version"], cache.VERSION)
+            self.assertEqual(exported["entries"], cache.get_all_cached_commit_times(dirname))
+            self.assertEqual(exported["entries"][cache.cache_key("one", ["two"])]["commit_times"], {"one/two": 1})
 
 describe TestCase, "get_cached_commit_times":
     before_each:
         self.commit = str(uuid.uuid1())
-        self.commit_times = str(uuid.uuid1())
+        self.commit_times = {"one": 1, "two": 2}
         self.parent_dir = str(uuid.uuid1())
         self.relpath1 = str(uuid.uuid1())
         self.relpath2 = str(uuid.uuid1())
@@ -65,129 +112,203 @@ describe TestCase, "get_cached_commit_times":
 
     it "returns None, {} if it can't match to parent_dir and sorted_relpaths":
         with self.a_temp_dir() as dirname:
-            git_folder = os.path.join(dirname, ".git")
-            os.mkdir(git_folder)
-
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write('[{"1":2}, {"3":4}]')
+            os.mkdir(os.path.join(dirname, ".git"))
+            self.assertEqual(cache.get_cached_commit_times(dirname, self.parent_dir, self.sorted_relpaths), (None, {}))
 
+            cache.set_cached_commit_times(dirname, self.parent_dir, self.commit, self.commit_times, [self.relpath1])
             self.assertEqual(cache.get_cached_commit_times(dirname, self.parent_dir, self.sorted_relpaths), (None, {}))
 
     it "returns the commit id and the commit_times if parent_dir, sorted_relpaths combination can be found":
         with self.a_temp_dir() as dirname:
-            git_folder = os.path.join(dirname, ".git")
-            os.mkdir(git_folder)
-
-            with open(cache.cache_location(dirname), "w") as fle:
-                fle.write(json.dumps(
-                    [{"parent_dir": self.parent_dir, "sorted_relpaths": self.sorted_relpaths, "commit": self.commit, "commit_times": self.commit_times}]
-                ))
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, self.parent_dir, self.commit, self.commit_times, self.sorted_relpaths)
             self.assertEqual(cache.get_cached_commit_times(dirname, self.parent_dir, self.sorted_relpaths), (self.commit, self.commit_times))
 
+    it "makes the entry the most recently used":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, "one", self.commit, self.commit_times, self.sorted_relpaths)
+            cache.set_cached_commit_times(dirname, "two", self.commit, self.commit_times, self.sorted_relpaths)
+
+            key = cache.cache_key("one", self.sorted_relpaths)
+            entries = cache.get_all_cached_commit_times(dirname)
+            self.assertEqual(min(entries, key=lambda k: entries[k]["last_used"]), key)
+
+            self.assertEqual(cache.get_cached_commit_times(dirname, "one", self.sorted_relpaths), (self.commit, self.commit_times))
+            entries = cache.get_all_cached_commit_times(dirname)
+            self.assertEqual(max(entries, key=lambda k: entries[k]["last_used"]), key)
+
+    it "changes last_used by replacing the cache while holding the lock":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, "one", self.commit, self.commit_times, self.sorted_relpaths)
+            cache.set_cached_commit_times(dirname, "two", self.commit, self.commit_times, self.sorted_relpaths)
+            location = cache.cache_location(dirname)
+            before = os.stat(location).st_ino
+
+            with mock.patch("gitmit.cache.locked", wraps=cache.locked) as locked:
+                self.assertEqual(cache.get_cached_commit_times(dirname, "one", self.sorted_relpaths), (self.commit, self.commit_times))
+            locked.assert_called_once_with(location)
+            self.assertNotEqual(os.stat(location).st_ino, before)
+
+            entries = cache.get_all_cached_commit_times(dirname)
+            self.assertEqual(max(entries, key=lambda k: entries[k]["last_used"]), cache.cache_key("one", self.sorted_relpaths))
+
+    it "keeps the entries set by other processes while it changes last_used":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, "used", self.commit, self.commit_times, self.sorted_relpaths)
+
+            def set_entry(number):
+                cache.set_cached_commit_times(dirname, str(number), self.commit, self.commit_times, self.sorted_relpaths)
+
+            def use_entry():
+                for _ in range(8):
+                    cache.get_cached_commit_times(dirname, "used", self.sorted_relpaths)
+
+            threads = [threading.Thread(target=set_entry, args=(number, )) for number in range(8)] + [threading.Thread(target=use_entry)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            entries = cache.get_all_cached_commit_times(dirname).values()
+            self.assertEqual(sorted(entry["parent_dir"] for entry in entries), sorted([str(number) for number in range(8)] + ["used"]))
+
+    it "doesn't write the cache if the entry was already the most recently used":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, "one", self.commit, self.commit_times, self.sorted_relpaths)
+            cache.set_cached_commit_times(dirname, "two", self.commit, self.commit_times, self.sorted_relpaths)
+
+            with mock.patch("gitmit.cache.write_cached_commit_times") as write_cached_commit_times:
+                self.assertEqual(cache.get_cached_commit_times(dirname, "two", self.sorted_relpaths), (self.commit, self.commit_times))
+            self.assertEqual(len(write_cached_commit_times.mock_calls), 0)
+
+describe TestCase, "get_times_at_commit":
+    it "returns an empty dictionary if there is no cache":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            self.assertEqual(cache.get_times_at_commit(dirname, "abc", ["one"]), {})
+
+    it "finds the paths from any entry for the commit":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"])
+            cache.set_cached_commit_times(dirname, "sub", "abc", {"sub/three": 3}, ["three"])
+            cache.set_cached_commit_times(dirname, "other", "def", {"four": 4}, ["four"])
+
+            self.assertEqual(cache.get_times_at_commit(dirname, "abc", ["two", "sub/three", "four", "five"]), {"two": 2, "sub/three": 3})
+            self.assertEqual(cache.get_times_at_commit(dirname, "def", ["one", "four"]), {"four": 4})
+            self.assertEqual(cache.get_times_at_commit(dirname, "ghi", ["one"]), {})
+
+    it "only uses the entries found by the same backend":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache.set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"], backend="git")
+            cache.set_cached_commit_times(dirname, "sub", "abc", {"sub/three": 3}, ["three"])
+
+            self.assertEqual(cache.get_times_at_commit(dirname, "abc", ["one", "sub/three"]), {"sub/three": 3})
+            self.assertEqual(cache.get_times_at_commit(dirname, "abc", ["one", "sub/three"], backend="git"), {"one": 1})
+            self.assertEqual(cache.get_cached_commit_times(dirname, ".", ["one", "two"]), (None, {}))
+            self.assertEqual(cache.get_cached_commit_times(dirname, ".", ["one", "two"], backend="git"), ("abc", {"one": 1, "two": 2}))
+
 describe TestCase, "set_cached_commit_times":
     before_each:
         self.first_commit = str(uuid.uuid1())
-        self.commit_times = str(uuid.uuid1())
+        self.commit_times = {"one": 1, "two": 2}
         self.parent_dir = str(uuid.uuid1())
         self.relpath1 = str(uuid.uuid1())
         self.relpath2 = str(uuid.uuid1())
         self.sorted_relpaths = sorted([self.relpath1, self.relpath2])
 
+    def parent_dirs(self, dirname):
+        """Return the parent_dir of each entry from least to most recently used"""
+        entries = cache.get_all_cached_commit_times(dirname).values()
+        return [entry["parent_dir"] for entry in sorted(entries, key=lambda entry: entry["last_used"])]
+
     it "doesn't complain if it can't write to the cache location":
         with self.a_temp_dir() as dirname:
             assert not os.path.exists(os.path.join(dirname, ".git"))
             cache.set_cached_commit_times(dirname, self.parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths)
             assert not os.path.exists(cache.cache_location(dirname))
 
+    it "keeps the entries set by other processes at the same time":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+
+            def set_entry(number):
+                cache.set_cached_commit_times(dirname, str(number), self.first_commit, {"{0}/one".format(number): number}, ["one"])
+
+            threads = [threading.Thread(target=set_entry, args=(number, )) for number in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(sorted(self.parent_dirs(dirname)), [str(number) for number in range(8)])
+            self.assertEqual(sorted(os.listdir(os.path.join(dirname, ".git"))), ["gitmit_cached_commit_times.bin", "gitmit_cached_commit_times.bin.lock"])
+
     it "adds to the current cache":
         with self.a_temp_dir() as dirname:
             os.mkdir(os.path.join(dirname, ".git"))
             cache.set_cached_commit_times(dirname, self.parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [{"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}]
-                )
+            entries = cache.get_all_cached_commit_times(dirname)
+            key = cache.cache_key(self.parent_dir, self.sorted_relpaths)
+            self.assertEqual(list(entries), [key])
+            self.assertEqual(sorted(entries[key]), ["backend", "commit", "commit_times", "last_used", "parent_dir", "size"])
+            self.assertEqual((entries[key]["parent_dir"], entries[key]["commit"], entries[key]["commit_times"]), (self.parent_dir, self.first_commit, self.commit_times))
+            self.assertEqual(entries[key]["size"], cache.entry_size(self.commit_times))
 
             parent_dir2 = str(uuid.uuid1())
             cache.set_cached_commit_times(dirname, parent_dir2, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
+            self.assertEqual(self.parent_dirs(dirname), [self.parent_dir, parent_dir2])
 
-    it "removes the oldest item if there is already 5 in the list":
+    it "removes the least recently used entries when there are more than max_entries":
         with self.a_temp_dir() as dirname:
             os.mkdir(os.path.join(dirname, ".git"))
-            cache.set_cached_commit_times(dirname, self.parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths)
+            parent_dirs = [str(uuid.uuid1()) for _ in range(4)]
+            for parent_dir in parent_dirs:
+                cache.set_cached_commit_times(dirname, parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths, max_entries=3)
+            self.assertEqual(self.parent_dirs(dirname), parent_dirs[1:])
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [{"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}]
-                )
+            # Using an entry means it isn't the next one to go
+            cache.get_cached_commit_times(dirname, parent_dirs[1], self.sorted_relpaths)
+            cache.set_cached_commit_times(dirname, parent_dirs[0], self.first_commit, self.commit_times, self.sorted_relpaths, max_entries=3)
+            self.assertEqual(self.parent_dirs(dirname), [parent_dirs[3], parent_dirs[1], parent_dirs[0]])
 
-            parent_dir2 = str(uuid.uuid1())
-            cache.set_cached_commit_times(dirname, parent_dir2, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
-
-            parent_dir3 = str(uuid.uuid1())
-            cache.set_cached_commit_times(dirname, parent_dir3, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir3, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
-
-            parent_dir4 = str(uuid.uuid1())
-            cache.set_cached_commit_times(dirname, parent_dir4, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir3, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir4, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
-
-            parent_dir5 = str(uuid.uuid1())
-            cache.set_cached_commit_times(dirname, parent_dir5, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir3, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir4, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir5, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
-
-            parent_dir6 = str(uuid.uuid1())
-            cache.set_cached_commit_times(dirname, parent_dir6, self.first_commit, self.commit_times, self.sorted_relpaths)
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [ {"parent_dir": parent_dir2, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir3, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir4, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir5, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  , {"parent_dir": parent_dir6, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}
-                  ]
-                )
+    it "defaults to default_max_entries":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            parent_dirs = [str(uuid.uuid1()) for _ in range(4)]
+            with mock.patch("gitmit.cache.default_max_entries", 2):
+                for parent_dir in parent_dirs:
+                    cache.set_cached_commit_times(dirname, parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths)
+            self.assertEqual(self.parent_dirs(dirname), parent_dirs[2:])
+
+    it "removes the least recently used entries when they take up more than max_bytes":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            size = cache.entry_size(self.commit_times)
+
+            parent_dirs = [str(uuid.uuid1()) for _ in range(4)]
+            for parent_dir in parent_dirs:
+                cache.set_cached_commit_times(dirname, parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths, max_bytes=size * 2)
+            self.assertEqual(self.parent_dirs(dirname), parent_dirs[2:])
+
+            # The entry we just set is kept even if it's too big by itself
+            cache.set_cached_commit_times(dirname, "big", self.first_commit, self.commit_times, self.sorted_relpaths, max_bytes=size - 1)
+            self.assertEqual(self.parent_dirs(dirname), ["big"])
 
     it "alters the entry if it has the same parent_dir and sorted_relpaths":
         with self.a_temp_dir() as dirname:
             os.mkdir(os.path.join(dirname, ".git"))
             cache.set_cached_commit_times(dirname, self.parent_dir, self.first_commit, self.commit_times, self.sorted_relpaths)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [{"parent_dir": self.parent_dir, "commit": self.first_commit, "commit_times": self.commit_times, "sorted_relpaths": self.sorted_relpaths}]
-                )
-
-            commit_times2 = str(uuid.uuid1())
+            commit_times2 = {"three": 3}
             commit2 = str(uuid.uuid1())
             cache.set_cached_commit_times(dirname, self.parent_dir, commit2, commit_times2, self.sorted_relpaths)
 
-            self.assertEqual(cache.get_all_cached_commit_times(dirname)
-                , [{"parent_dir": self.parent_dir, "commit": commit2, "commit_times": commit_times2, "sorted_relpaths": self.sorted_relpaths}]
-                )
-
+            self.assertEqual(len(cache.get_all_cached_commit_times(dirname)), 1)
+            self.assertEqual(cache.get_cached_commit_times(dirname, self.parent_dir, self.sorted_relpaths), (commit2, commit_times2))
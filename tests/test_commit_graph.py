@@ -0,0 +1,122 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.commit_graph import CommitGraph, murmur3_32
+
+from dulwich.repo import Repo as Repository
+import os
+
+describe TestCase, "murmur3_32":
+    it "matches the reference implementation":
+        self.assertEqual(murmur3_32(b"", 0), 0)
+        self.assertEqual(murmur3_32(b"", 1), 0x514e28b7)
+        self.assertEqual(murmur3_32(b"Hello, world!", 1234), 0xfaf6cdb3)
+        self.assertEqual(murmur3_32(b"The quick brown fox jumps over the lazy dog", 0x9747b28c), 0x2fa826cd)
+
+    it "can sign extend bytes like version 1 of git's filters":
+        self.assertEqual(murmur3_32(b"abc", 0, signed=True), murmur3_32(b"abc", 0))
+        self.assertNotEqual(murmur3_32("caf\xe9".encode("utf-8"), 0, signed=True), murmur3_32("caf\xe9".encode("utf-8"), 0))
+
+describe TestCase, "CommitGraph":
+    def assertGraphMatches(self, root_folder):
+        git = Repository(root_folder)
+        graph = CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects"))
+        assert graph is not None
+
+        try:
+            for entry in git.get_walker():
+                commit = entry.commit
+                self.assertEqual(graph.lookup(commit.id), (commit.tree, commit.parents, commit.commit_time))
+
+            self.assertIs(graph.lookup(b"9fc25f91ffb9dc693f999a8983954c777f8cb2f6"), None)
+        finally:
+            graph.close()
+
+    it "returns None if there is no commit-graph":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            self.assertIs(CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects")), None)
+
+    it "returns None if the commit-graph is invalid":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            with open(os.path.join(root_folder, ".git", "objects", "info", "commit-graph"), "wb") as fle:
+                fle.write(b"CGPH\x02\x01\x00\x00")
+            self.assertIs(CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects")), None)
+
+    it "finds the tree, parents and commit time of commits":
+        for name in ("paths", "merge_with_changes", "merge_with_no_changes"):
+            with self.cloned_repo(name) as (root_folder, commit_times):
+                # The clone is a detached HEAD, so give --reachable something to find
+                self.do_git_cmd(root_folder, "branch", "graphed")
+                self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable")
+                self.assertGraphMatches(root_folder)
+
+    it "understands split commit-graph chains":
+        with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+            self.do_git_cmd(root_folder, "branch", "graphed", "2ccdbff3f86df69695a532232f0d78be844d7ed9")
+            self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--split")
+            self.do_git_cmd(root_folder, "branch", "-f", "graphed", "5ad69c29c0c4b003e10ed0355cf598b22f314c7d")
+            self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--split=no-merge")
+
+            chain = os.path.join(root_folder, ".git", "objects", "info", "commit-graphs", "commit-graph-chain")
+            self.assertEqual(len(open(chain).read().split()), 2)
+            self.assertGraphMatches(root_folder)
+
+    describe "bloom filters":
+        def changed_paths(self, root_folder, commit):
+            """Return every path and folder git says changed against the first parent"""
+            against = [commit.parents[0].decode()] if commit.parents else ["--root"]
+            args = ["diff-tree", "-r", "-z", "--no-commit-id", "--name-only"] + against + [commit.id.decode()]
+            output = self.do_git_cmd(root_folder, *args)
+            paths = set()
+            for path in output.decode("utf-8").split("\0"):
+                parts = tuple(path.split("/"))
+                for i in range(1, len(parts) + 1):
+                    if parts[:i] != ("", ):
+                        paths.add(parts[:i])
+            return paths
+
+        it "returns None without changed path filters":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                self.do_git_cmd(root_folder, "branch", "graphed")
+                self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable")
+                graph = CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects"))
+                self.assertIs(graph.bloom_filter(Repository(root_folder).head()), None)
+
+        it "never says a changed path is missing":
+            for name in ("paths", "merge_with_changes"):
+                with self.cloned_repo(name) as (root_folder, commit_times):
+                    self.do_git_cmd(root_folder, "branch", "graphed")
+                    self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--changed-paths")
+                    graph = CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects"))
+
+                    everything = set()
+                    for entry in Repository(root_folder).get_walker():
+                        everything |= self.changed_paths(root_folder, entry.commit)
+
+                    for entry in Repository(root_folder).get_walker():
+                        bloom = graph.bloom_filter(entry.commit.id)
+                        assert bloom is not None
+
+                        changed = self.changed_paths(root_folder, entry.commit)
+                        for parts in changed:
+                            assert bloom.contains(parts), parts
+
+                        # These repositories are small enough to have no false positives
+                        for parts in everything - changed:
+                            assert not bloom.contains(parts), parts
+
+        it "hashes paths that aren't ascii the same way git does":
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                os.makedirs(os.path.join(root_folder, "caf\xe9"))
+                self.touch_file(root_folder, os.path.join("caf\xe9", "na\xefve"))
+                self.do_git_cmd(root_folder, "add", ".")
+                self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "commit", "-q", "-m", "first")
+                self.do_git_cmd(root_folder, "branch", "graphed")
+                self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--changed-paths")
+
+                graph = CommitGraph.for_objects_dir(os.path.join(root_folder, ".git", "objects"))
+                bloom = graph.bloom_filter(Repository(root_folder).head())
+                assert bloom.contains(("caf\xe9", ))
+                assert bloom.contains(("caf\xe9", "na\xefve"))
@@ -3,16 +3,19 @@
 from tests.helpers import TestCase
 
 from gitmit.executor import main
+from gitmit.trace import Tracer
 
 from noseOfYeti.tokeniser.support import noy_sup_setUp
 from contextlib import contextmanager
+import json
 import mock
+import os
 
 describe TestCase, "mainline":
     before_each:
         self.fake_setup_logging = mock.Mock(name="setup_logging")
         self.gittimes = mock.Mock(name="gittimes")
-        self.gittimes.find.return_value = {}
+        self.gittimes.find_batches.return_value = []
         self.fakeGitTimes = mock.Mock(name="GitTimes", return_value=self.gittimes)
 
     @contextmanager
@@ -21,51 +24,187 @@ describe TestCase, "mainline":
             with mock.patch("gitmit.executor.GitTimes", self.fakeGitTimes):
                 yield
 
+    it "prints and flushes each batch of commit times as it gets them":
+        stdout = mock.Mock(name="stdout")
+        written = []
+        stdout.write.side_effect = lambda s: written.append(s)
+        stdout.flush.side_effect = lambda: written.append("<flush>")
+
+        def find_batches():
+            yield [("one", 3), ("two", 3)]
+            yield [("three", 2)]
+        self.gittimes.find_batches.side_effect = find_batches
+
+        with self.patched_things():
+            with mock.patch("sys.stdout", stdout):
+                main([])
+
+        self.assertEqual("".join(written), "3 one\n3 two\n<flush>2 three\n<flush>")
+
+    it "--apply sets the modified times instead of printing them":
+        self.gittimes.apply.return_value = mock.Mock(name="applied", changed=1, unchanged=2, missing=3, failed=0)
+        with self.patched_things():
+            main(["--apply", "--workers", "5"])
+
+        self.gittimes.apply.assert_called_once_with(workers=5)
+        self.assertEqual(len(self.gittimes.find_batches.mock_calls), 0)
+
+    it "--tar writes a tar instead of printing the times":
+        self.gittimes.write_tar.return_value = 2
+        with self.a_temp_file() as location:
+            with self.patched_things():
+                main(["--tar", location])
+
+            self.gittimes.write_tar.assert_called_once_with(mock.ANY)
+            self.assertEqual(self.gittimes.write_tar.mock_calls[0][1][0].name, location)
+            self.assertEqual(len(self.gittimes.find_batches.mock_calls), 0)
+
+    it "--stats prints the stats to stderr when it's done":
+        self.gittimes.stats.report.return_value = "commits walked 3\n"
+        stderr = mock.Mock(name="stderr")
+        with self.patched_things():
+            with mock.patch("sys.stderr", stderr):
+                main(["--stats"])
+
+        self.gittimes.find_batches.assert_called_once_with()
+        stderr.write.assert_called_once_with("commits walked 3\n")
+
+    it "doesn't print stats without --stats":
+        stderr = mock.Mock(name="stderr")
+        with self.patched_things():
+            with mock.patch("sys.stderr", stderr):
+                main([])
+
+        self.assertEqual(len(self.gittimes.stats.report.mock_calls), 0)
+
+    it "--trace gives GitTimes a tracer and saves it when it's done":
+        with self.a_temp_file() as location:
+            with self.patched_things():
+                main(["--trace", location])
+
+            tracer = self.fakeGitTimes.mock_calls[0][2]["tracer"]
+            assert isinstance(tracer, Tracer), tracer
+
+            with open(location) as fle:
+                self.assertEqual(json.load(fle), json.loads(json.dumps(tracer.as_dict())))
+
     it "sets up the argparse and runs GitTimes with the correct arguments":
         with self.patched_things():
             main([])
 
         self.fake_setup_logging.assert_called_once_with(debug=False)
-        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
 
     it "multiple include, exclude and timestamps_for produces list of those itmes":
         with self.patched_things():
             main(["--include", "one", "--exclude", "two", "--include", "three", "--timestamps-for", "four", "--exclude", "five", "--timestamps-for", "six"])
 
         self.fake_setup_logging.assert_called_once_with(debug=False)
-        self.fakeGitTimes.assert_called_once_with(".", ".", ["four", "six"], ["one", "three"], ["two", "five"], debug=False, with_cache=True)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with(".", ".", ["four", "six"], ["one", "three"], ["two", "five"], debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
 
     it "--no-cache makes with_cache equal to false":
         with self.patched_things():
             main(["--no-cache"])
 
         self.fake_setup_logging.assert_called_once_with(debug=False)
-        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=False)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=False, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
+
+    it "passes on the limits for the cache":
+        with self.patched_things():
+            main(["--cache-max-entries", "10", "--cache-max-bytes", "2000"])
+
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=10, cache_max_bytes=2000, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+
+    it "--export-cache writes the cache as json instead of finding commit times":
+        with self.a_temp_file() as filename:
+            fake_export = mock.Mock(name="export_cached_commit_times")
+            with self.patched_things():
+                with mock.patch("gitmit.cache.export_cached_commit_times", fake_export):
+                    main(["--root-folder", "somewhere", "--export-cache", filename])
+
+        fake_export.assert_called_once_with("somewhere", mock.ANY)
+        self.assertEqual(len(self.fakeGitTimes.mock_calls), 0)
+
+    it "--cache-backend chooses where the cache is kept":
+        with self.patched_things():
+            main(["--cache-backend", "sqlite"])
+
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="sqlite", cache_dir=None, shared_cache_max_bytes=None)
+
+    it "--cache-dir shares commit times between clones":
+        with self.patched_things():
+            main(["--cache-dir", "/tmp/shared"])
+
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir="/tmp/shared", shared_cache_max_bytes=None)
+
+    it "--cache-dir-max-bytes is the budget of the shared cache":
+        with self.patched_things():
+            main(["--cache-dir", "/tmp/shared", "--cache-max-bytes", "10", "--cache-dir-max-bytes", "2000"])
+
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=10, cache_backend="file", cache_dir="/tmp/shared", shared_cache_max_bytes=2000)
+
+    it "--cache-dir without a folder uses XDG_CACHE_HOME":
+        with self.patched_things():
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "/tmp/xdg"}):
+                main(["--cache-dir"])
+
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir="/tmp/xdg/gitmit", shared_cache_max_bytes=None)
+
+    it "--evict-cache evicts the shared cache instead of finding commit times":
+        fake_evict = mock.Mock(name="evict_shared_cache", return_value=2)
+        with self.patched_things():
+            with mock.patch("gitmit.shared_cache.evict_shared_cache", fake_evict):
+                main(["--evict-cache", "--cache-dir", "/tmp/shared", "--cache-max-bytes", "10", "--cache-dir-max-bytes", "2000"])
+
+        fake_evict.assert_called_once_with("/tmp/shared", max_bytes=2000)
+        self.assertEqual(len(self.fakeGitTimes.mock_calls), 0)
 
     it "--debug makes debug equal to true":
         with self.patched_things():
             main(["--debug"])
 
         self.fake_setup_logging.assert_called_once_with(debug=True)
-        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=True, with_cache=True)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=True, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
 
     it "--consider makes the parent_dir change":
         with self.patched_things():
             main(["--consider", "place"])
 
         self.fake_setup_logging.assert_called_once_with(debug=False)
-        self.fakeGitTimes.assert_called_once_with(".", "place", True, None, None, debug=False, with_cache=True)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with(".", "place", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
 
     it "--root-folder makes the root_dir and parent_dir change":
         with self.patched_things():
             main(["--root-folder", "/somewhere/nice", "--consider", "place"])
 
         self.fake_setup_logging.assert_called_once_with(debug=False)
-        self.fakeGitTimes.assert_called_once_with("/somewhere/nice", "place", True, None, None, debug=False, with_cache=True)
-        self.gittimes.find.assert_called_once_with()
+        self.fakeGitTimes.assert_called_once_with("/somewhere/nice", "place", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
+
+
+    it "--backend chooses the backend":
+        with self.patched_things():
+            main(["--backend", "git"])
+
+        self.fake_setup_logging.assert_called_once_with(debug=False)
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="git", first_parent=False, max_commits=None, since=None, fallback_time="oldest", tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
+
+    it "can bound the walk":
+        with self.patched_things():
+            main(["--first-parent", "--max-commits", "20", "--since", "1459034800", "--fallback-time", "1459000000"])
+
+        self.fake_setup_logging.assert_called_once_with(debug=False)
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=True, max_commits=20, since=1459034800, fallback_time=1459000000, tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
+        self.gittimes.find_batches.assert_called_once_with()
+
+    it "can give no fallback time":
+        with self.patched_things():
+            main(["--max-commits", "20", "--fallback-time", "none"])
 
+        self.fakeGitTimes.assert_called_once_with(".", ".", True, None, None, debug=False, with_cache=True, backend="dulwich", first_parent=False, max_commits=20, since=None, fallback_time=None, tracer=None, cache_max_entries=None, cache_max_bytes=None, cache_backend="file", cache_dir=None, shared_cache_max_bytes=None)
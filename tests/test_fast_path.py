@@ -0,0 +1,173 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.fast_path import fast_path_key, fast_path_location, get_fast_path, set_fast_path, read_head
+from gitmit.mit import GitTimes
+
+import subprocess
+import threading
+import textwrap
+import json
+import mock
+import sys
+import os
+
+oid1 = "1" * 40
+oid2 = "2" * 40
+
+describe TestCase, "read_head":
+    def write(self, git_dir, relpath, content):
+        location = os.path.join(git_dir, relpath)
+        if not os.path.exists(os.path.dirname(location)):
+            os.makedirs(os.path.dirname(location))
+        with open(location, "w") as fle:
+            fle.write(content)
+
+    it "follows loose refs, then packed refs":
+        with self.a_temp_dir() as git_dir:
+            self.write(git_dir, "HEAD", "ref: refs/heads/master\n")
+            self.write(git_dir, "packed-refs", "# pack-refs with: peeled fully-peeled sorted\n{0} refs/heads/master\n^{1}\n".format(oid1, oid2))
+            self.assertEqual(read_head(git_dir), oid1)
+
+            self.write(git_dir, "refs/heads/master", "{0}\n".format(oid2))
+            self.assertEqual(read_head(git_dir), oid2)
+
+    it "knows detached heads":
+        with self.a_temp_dir() as git_dir:
+            self.write(git_dir, "HEAD", "{0}\n".format(oid1))
+            self.assertEqual(read_head(git_dir), oid1)
+
+    it "returns None if HEAD doesn't point at a commit yet":
+        with self.a_temp_dir() as git_dir:
+            self.assertIs(read_head(git_dir), None)
+            self.write(git_dir, "HEAD", "ref: refs/heads/master\n")
+            self.assertIs(read_head(git_dir), None)
+
+    it "agrees with git":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            self.do_git_cmd(root_folder, "checkout", "-q", "-b", "somewhere")
+            head = self.do_git_cmd(root_folder, "rev-parse", "HEAD").strip().decode()
+            self.assertEqual(read_head(os.path.join(root_folder, ".git")), head)
+
+            self.do_git_cmd(root_folder, "pack-refs", "--all")
+            assert not os.path.exists(os.path.join(root_folder, ".git", "refs", "heads", "somewhere"))
+            self.assertEqual(read_head(os.path.join(root_folder, ".git")), head)
+
+describe TestCase, "fast_path_key":
+    it "changes when HEAD, the index or the options change":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            key = fast_path_key(root_folder, ".", True, None, None)
+            self.assertEqual(key["head"], self.do_git_cmd(root_folder, "rev-parse", "HEAD").strip().decode())
+            self.assertEqual(fast_path_key(root_folder, ".", True, None, None), key)
+
+            self.assertNotEqual(fast_path_key(root_folder, ".", True, None, ["one"])["options"], key["options"])
+            self.assertNotEqual(fast_path_key(root_folder, "three", True, None, None)["options"], key["options"])
+            self.assertNotEqual(fast_path_key(root_folder, ".", True, None, None, "git")["options"], key["options"])
+
+            self.touch_file(root_folder, "new")
+            self.do_git_cmd(root_folder, "add", "new")
+            after_add = fast_path_key(root_folder, ".", True, None, None)
+            self.assertNotEqual(after_add["index"], key["index"])
+            self.assertEqual(after_add["head"], key["head"])
+
+            self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "commit", "-m", "new")
+            self.assertNotEqual(fast_path_key(root_folder, ".", True, None, None)["head"], key["head"])
+
+    it "is None when there is no repository":
+        with self.a_temp_dir() as root_folder:
+            self.assertIs(fast_path_key(root_folder, ".", True, None, None), None)
+
+describe TestCase, "get_fast_path and set_fast_path":
+    def key(self, head=oid1, index=(1, 2), options="a"):
+        return {"head": head, "index": list(index), "options": options}
+
+    it "remembers results for each set of options while HEAD and the index stay the same":
+        with self.a_temp_dir() as root_folder:
+            os.mkdir(os.path.join(root_folder, ".git"))
+            self.assertIs(get_fast_path(root_folder, self.key()), None)
+
+            set_fast_path(root_folder, self.key(), [("one", 1), ("two", 2)])
+            set_fast_path(root_folder, self.key(options="b"), [("three", 3)])
+            self.assertEqual(get_fast_path(root_folder, self.key()), [("one", 1), ("two", 2)])
+            self.assertEqual(get_fast_path(root_folder, self.key(options="b")), [("three", 3)])
+            self.assertIs(get_fast_path(root_folder, self.key(options="c")), None)
+
+            self.assertIs(get_fast_path(root_folder, self.key(index=(1, 3))), None)
+            self.assertIs(get_fast_path(root_folder, self.key(head=oid2)), None)
+
+            set_fast_path(root_folder, self.key(head=oid2), [])
+            self.assertEqual(get_fast_path(root_folder, self.key(head=oid2)), [])
+            self.assertIs(get_fast_path(root_folder, self.key()), None)
+            self.assertIs(get_fast_path(root_folder, self.key(head=oid2, options="b")), None)
+
+    it "keeps the results of other options set at the same time":
+        with self.a_temp_dir() as root_folder:
+            os.mkdir(os.path.join(root_folder, ".git"))
+
+            def set_results(number):
+                set_fast_path(root_folder, self.key(options=str(number)), [(str(number), number)])
+
+            threads = [threading.Thread(target=set_results, args=(number, )) for number in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            for number in range(8):
+                self.assertEqual(get_fast_path(root_folder, self.key(options=str(number))), [(str(number), number)])
+
+    it "complains and ignores results it can't read":
+        with self.a_temp_dir() as root_folder:
+            os.mkdir(os.path.join(root_folder, ".git"))
+            for content in ("{", "[]", '{"entries": 3}'):
+                with open(fast_path_location(root_folder), "w") as fle:
+                    fle.write(content)
+
+                with mock.patch("gitmit.fast_path.log") as log:
+                    self.assertIs(get_fast_path(root_folder, self.key()), None)
+                self.assertEqual(len(log.warning.mock_calls), 1)
+
+            set_fast_path(root_folder, self.key(), [("one", 1)])
+            self.assertEqual(get_fast_path(root_folder, self.key()), [("one", 1)])
+
+describe TestCase, "GitTimes fast path":
+    it "gives back the same results without opening the repository":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            expected = list(GitTimes(root_folder, ".", silent=True, exclude=["seven"]).find())
+            assert os.path.exists(fast_path_location(root_folder))
+
+            with mock.patch("gitmit.backends.repo_for", mock.Mock(name="repo_for", side_effect=Exception("Shouldn't open the repository"))):
+                gittimes = GitTimes(root_folder, ".", silent=True, exclude=["seven"])
+                self.assertEqual(list(gittimes.find()), expected)
+                self.assertEqual(gittimes.stats.cache, "fast")
+
+            # Different options don't use those results
+            self.assertEqual(dict(GitTimes(root_folder, ".", silent=True).find())["seven"], commit_times["seven"])
+
+    it "doesn't import dulwich":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            expected = dict(GitTimes(root_folder, ".", silent=True).find())
+
+            script = textwrap.dedent("""
+                import json, sys
+                from gitmit.mit import GitTimes
+                found = dict(GitTimes(sys.argv[1], ".", silent=True).find())
+                print(json.dumps([found, "dulwich" in sys.modules]))
+                """)
+            here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            output = subprocess.check_output([sys.executable, "-c", script, root_folder], cwd=here)
+            self.assertEqual(json.loads(output.decode()), [expected, False])
+
+    it "doesn't remember results until every commit time is found":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            found = GitTimes(root_folder, ".", silent=True).find()
+            next(found)
+            found.close()
+            assert not os.path.exists(fast_path_location(root_folder))
+
+    it "isn't used for bounded walks or without the cache":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            for kwargs in (dict(with_cache=False), dict(max_commits=100), dict(since=0), dict(first_parent=True)):
+                list(GitTimes(root_folder, ".", silent=True, **kwargs).find())
+                assert not os.path.exists(fast_path_location(root_folder)), kwargs
@@ -0,0 +1,90 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.filters import Globs, Filters, either, both, negate
+
+import fnmatch
+
+describe TestCase, "three valued logic":
+    it "knows either, both and negate":
+        self.assertEqual([either(True, None), either(False, None), either(False, False), either(None, None)], [True, None, False, None])
+        self.assertEqual([both(False, None), both(True, None), both(True, True), both(None, None)], [False, None, True, None])
+        self.assertEqual([negate(True), negate(False), negate(None)], [False, True, None])
+
+describe TestCase, "Globs":
+    it "matches like fnmatch":
+        globs = Globs(["*.py", "docs/[a-c]?.txt", "exact"])
+        assert globs.matches("one/two.py")
+        assert globs.matches("docs/b1.txt")
+        assert globs.matches("exact")
+        assert not globs.matches("docs/d1.txt")
+        assert not globs.matches("exact/not")
+        assert not Globs([]).matches("anything")
+
+    it "knows when a folder matches everything or nothing":
+        globs = Globs(["src/*", "lib/sub*", "docs/*.txt", "exact/file"])
+        self.assertIs(globs.folder_verdict("src"), True)
+        self.assertIs(globs.folder_verdict("src/deep/er"), True)
+        self.assertIs(globs.folder_verdict("lib/subfolder"), True)
+        self.assertIs(globs.folder_verdict("lib"), None)
+        self.assertIs(globs.folder_verdict("docs"), None)
+        self.assertIs(globs.folder_verdict("docs/deep"), None)
+        self.assertIs(globs.folder_verdict("exact"), None)
+        self.assertIs(globs.folder_verdict("exact/file"), False)
+        self.assertIs(globs.folder_verdict("other"), False)
+        self.assertIs(globs.folder_verdict(""), None)
+
+        self.assertIs(Globs(["*"]).folder_verdict(""), True)
+        self.assertIs(Globs(["*.py"]).folder_verdict("anything"), None)
+
+describe TestCase, "Filters":
+    def old_is_filtered(self, relpath, timestamps_for, exclude, include):
+        """How GitTimes#is_filtered used to work, one fnmatch at a time"""
+        if relpath.startswith("../"):
+            return True
+
+        if timestamps_for is not None and type(timestamps_for) is list:
+            if not any(fnmatch.fnmatch(relpath, line) for line in timestamps_for):
+                return True
+
+        matched = exclude or not any([exclude, include])
+        if exclude:
+            for line in exclude:
+                if fnmatch.fnmatch(relpath, line):
+                    matched = False
+        if include:
+            for line in include:
+                if fnmatch.fnmatch(relpath, line):
+                    matched = True
+                    break
+
+        return not matched
+
+    it "accepts the same files as before and agrees with its folder verdicts":
+        paths = [
+              "one", "two.py", "src/one.py", "src/one.pyc", "src/deep/two.py", "src/deep/three.txt"
+            , "docs/index.rst", "docs/api/things.rst", "lib/sub/one.py", "lib/other/two.pyc", "../outside/four.py"
+            ]
+
+        globs = [None, True, [], ["*.py"], ["src/*"], ["src/deep/*", "docs/*"], ["lib/sub*"], ["one"], ["*"], ["docs/*.rst", "*.pyc"]]
+        for timestamps_for in globs:
+            for exclude in globs:
+                if exclude is True:
+                    continue
+                for include in globs:
+                    if include is True:
+                        continue
+                    filters = Filters(timestamps_for, exclude, include)
+                    for path in paths:
+                        accepted = filters.accepts(path)
+                        self.assertEqual(accepted, not self.old_is_filtered(path, timestamps_for, exclude, include), (path, timestamps_for, exclude, include))
+
+                        folder = path.rpartition("/")[0]
+                        while True:
+                            verdict = filters.folder_verdict(folder)
+                            if verdict is not None:
+                                self.assertEqual(accepted, verdict, (path, folder, timestamps_for, exclude, include))
+                            if folder in ("", ".."):
+                                break
+                            folder = folder.rpartition("/")[0]
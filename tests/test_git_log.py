@@ -0,0 +1,171 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.git_log import GitLogRepo, parse_log
+from gitmit.repo import Repo
+
+import subprocess
+import os
+
+describe TestCase, "parse_log":
+    def header(self, oid, parents, date, from_parent=None):
+        first = b"commit " + oid
+        if from_parent:
+            first += b" (from " + from_parent + b")"
+        lines = [first, b"tree 4ac1ed5a30521ff173981845fa41eea6dfb40aaf"]
+        lines.extend(b"parent " + parent for parent in parents)
+        lines.extend([b"author a <a@b> 1 +0000", b"committer a <a@b> " + date, b"", b"    a message", b"    ", b"    committer not me", b""])
+        return b"\n".join(lines)
+
+    it "yields the commit, commit time, parents and changed paths for each commit":
+        merge, first, second, root = b"5ad69c29c0c4b003e10ed0355cf598b22f314c7d", b"2ccdbff3f86df69695a532232f0d78be844d7ed9", b"04863f2e71a0b230c20a9ab8de46d8b116b08c34", b"369ba2ef53a0e814fd5cd8b68793b08abdf241b3"
+        output = (
+              self.header(merge, [first, second], b"1459123419 +1100", from_parent=first)
+            + b"\n:000000 100644 0000000 f2ad6c7 A\0c\0:100644 000000 f2ad6c7 0000000 D\0gone\0\0"
+            + self.header(merge, [first, second], b"1459123419 +1100", from_parent=second)
+            + b"\n:100644 100644 16f9ec0 f2ad6c7 M\0c\0:100644 100644 16f9ec0 f2ad6c7 M\0e\0\0"
+            + self.header(first, [root], b"1459123395 -0230")
+            + b"\n:000000 100644 0000000 4bcfe98 A\0d\0\0"
+            + self.header(second, [root], b"1459123363 +0000")
+            + b"\0"
+            + self.header(root, [], b"1459123337 +1100")
+            + b"\n:000000 100644 0000000 7898192 A\0a\0:100644 000000 7898192 0000000 D\0b\0"
+            )
+
+        merge, first, second, root = merge.decode(), first.decode(), second.decode(), root.decode()
+        expected = [
+              (merge, 1459123419 - 39600, [first, second], {first: ["c"], second: ["c", "e"]})
+            , (first, 1459123395 + 9000, [root], {root: ["d"]})
+            , (second, 1459123363, [root], {root: []})
+            , (root, 1459123337 - 39600, [], {None: ["a"]})
+            ]
+
+        self.assertEqual(list(parse_log([output])), expected)
+
+        # And it doesn't matter where the chunks are split
+        for size in (1, 7, 50):
+            chunks = [output[i:i + size] for i in range(0, len(output), size)]
+            self.assertEqual(list(parse_log(chunks)), expected)
+
+describe TestCase, "GitLogRepo":
+    it "knows all the files and the first commit":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            repo = GitLogRepo(root_folder)
+            self.assertEqual(repo.all_files(), set(commit_times.keys()))
+            self.assertEqual(repo.first_commit, "6c463ce367c5d7b26da45be6a67456536d944211")
+
+    it "knows if a commit is an ancestor of HEAD":
+        with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+            self.do_git_cmd(root_folder, "checkout", "-q", "2ccdbff3f86df69695a532232f0d78be844d7ed9")
+            repo = GitLogRepo(root_folder)
+            assert repo.is_ancestor("369ba2ef53a0e814fd5cd8b68793b08abdf241b3")
+            assert not repo.is_ancestor("04863f2e71a0b230c20a9ab8de46d8b116b08c34")
+            assert not repo.is_ancestor("9fc25f91ffb9dc693f999a8983954c777f8cb2f6")
+
+    it "finds the same commit times as the dulwich backend":
+        for name in ("paths", "merge_with_changes", "merge_with_no_changes", "tree_that_was_a_blob", "blob_that_was_a_tree"):
+            with self.cloned_repo(name) as (root_folder, commit_times):
+                paths = set(commit_times)
+                expected = [(str(coid), ctime, sorted(differences)) for coid, ctime, differences in Repo(root_folder).file_commit_times(paths)]
+                actual = [(coid, ctime, sorted(differences)) for coid, ctime, differences in GitLogRepo(root_folder).file_commit_times(paths)]
+                self.assertEqual(actual, expected)
+
+    it "finds the same commit times as the dulwich backend for bounded walks":
+        options = [dict(first_parent=True), dict(max_commits=2), dict(max_commits=0), dict(since=1459074433), dict(since=1459123395), dict(first_parent=True, max_commits=3)]
+        for name in ("paths", "merge_with_changes", "merge_with_no_changes"):
+            with self.cloned_repo(name) as (root_folder, commit_times):
+                paths = set(commit_times)
+                for kwargs in options:
+                    expected = [(coid, ctime, sorted(differences)) for coid, ctime, differences in Repo(root_folder).file_commit_times(paths, **kwargs)]
+                    actual = [(coid, ctime, sorted(differences)) for coid, ctime, differences in GitLogRepo(root_folder).file_commit_times(paths, **kwargs)]
+                    self.assertEqual(actual, expected, (name, kwargs))
+
+    it "stops when it's found all the paths it cares about":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            result = list(GitLogRepo(root_folder).file_commit_times(set(["five"])))
+            self.assertEqual(result, [("9265c0337a90334d989e758942d86dc60b267a71", 1459034839, ["five"])])
+
+    it "doesn't look at excluded commits":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            result = list(GitLogRepo(root_folder).file_commit_times(set(commit_times), exclude=["64c9970cc3cfa981882825d16830e23fec9951b3"]))
+            self.assertEqual(result
+                , [ ("6c463ce367c5d7b26da45be6a67456536d944211", 1459036362, ["seven", "six"])
+                  , ("9265c0337a90334d989e758942d86dc60b267a71", 1459034839, ["five"])
+                  ]
+                )
+
+    describe "history simplification":
+        def commit(self, root_folder, when, *args):
+            """Commit at a particular time so the order of the walk is known"""
+            date = "@{0} +0000".format(1500000000 + when)
+            env = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+            cmd = ["git", "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com"] + list(args)
+            subprocess.check_output(cmd, cwd=root_folder, env=env, stderr=subprocess.STDOUT)
+
+        def write(self, root_folder, name, content):
+            with open(os.path.join(root_folder, name), "w") as fle:
+                fle.write(content)
+            self.do_git_cmd(root_folder, "add", name)
+
+        def assertSameAsGit(self, root_folder, paths, expected):
+            """Both backends find the times we expect, which is what git log finds for each path"""
+            for repo in (Repo(root_folder, use_commit_graph=False), GitLogRepo(root_folder)):
+                found = dict((path, ctime) for _, ctime, changed in repo.file_commit_times(paths) for path in changed)
+                self.assertEqual(found, expected, repo)
+
+            for path, ctime in expected.items():
+                self.assertEqual(int(self.do_git_cmd(root_folder, "log", "-1", "--format=%ct", "--", path).strip()), ctime)
+
+        it "follows each file to the first parent a merge is the same as":
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                self.write(root_folder, "a", "a")
+                self.write(root_folder, "c", "c")
+                self.commit(root_folder, 1000, "commit", "-q", "-m", "first")
+                self.do_git_cmd(root_folder, "branch", "side")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                self.write(root_folder, "a", "a_side")
+                self.write(root_folder, "c", "c_side")
+                self.commit(root_folder, 2000, "commit", "-q", "-m", "side")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "-")
+                self.write(root_folder, "c", "c_main")
+                self.commit(root_folder, 3000, "commit", "-q", "-m", "main")
+
+                # The merge drops the change to a from the side branch and takes c from it
+                self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "merge", "-q", "-s", "ours", "--no-commit", "side")
+                self.write(root_folder, "c", "c_side")
+                self.commit(root_folder, 4000, "commit", "-q", "-m", "merge")
+
+                self.assertSameAsGit(root_folder, set(["a", "c"]), {"a": 1500001000, "c": 1500002000})
+
+        it "asks git about files passed on to a commit it has already shown":
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                self.write(root_folder, "f", "f")
+                self.write(root_folder, "g", "g")
+                self.commit(root_folder, 1000, "commit", "-q", "-m", "first")
+
+                self.write(root_folder, "f", "f_p")
+                self.commit(root_folder, 3500, "commit", "-q", "-m", "p")
+                self.do_git_cmd(root_folder, "branch", "side")
+
+                self.write(root_folder, "f", "f_x")
+                self.commit(root_folder, 4000, "commit", "-q", "-m", "x")
+
+                # The side branch is older than where it starts, so git shows p before it
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                self.write(root_folder, "g", "g_y0")
+                self.commit(root_folder, 500, "commit", "-q", "-m", "y0")
+                self.write(root_folder, "g", "g_y1")
+                self.commit(root_folder, 3000, "commit", "-q", "-m", "y1")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "-")
+                self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "merge", "-q", "-s", "ours", "--no-commit", "side")
+                self.write(root_folder, "f", "f_p")
+                self.write(root_folder, "g", "g_y1")
+                self.commit(root_folder, 6000, "commit", "-q", "-m", "merge")
+
+                self.assertSameAsGit(root_folder, set(["f", "g"]), {"f": 1500003500, "g": 1500003000})
@@ -2,7 +2,15 @@
 
 from tests.helpers import TestCase
 
+from gitmit.repo import Repo
 from gitmit.mit import GitTimes
+from gitmit import cache, fast_path
+
+import subprocess
+import tarfile
+import mock
+import io
+import os
 
 describe TestCase, "Integration":
     def assertCorrectFor(self, name, make_commit_times=lambda ct: ct):
@@ -14,6 +22,10 @@ describe TestCase, "Integration":
             result = dict(GitTimes(root_folder, '.').find())
             self.assertEqual(result, make_commit_times(commit_times))
 
+            # And with the git backend
+            result = dict(GitTimes(root_folder, '.', with_cache=False, backend="git").find())
+            self.assertEqual(result, make_commit_times(commit_times))
+
     it "works with symlinks and paths and such":
         def maker(commit_times):
             # Need to include the symlink!
@@ -64,3 +76,158 @@ describe TestCase, "filters":
             result = dict(GitTimes(root_folder, 'five').find())
             self.assertEqual(result, {"four": commit_times["three/four"]})
 
+describe TestCase, "apply":
+    it "sets the modified times of the files in the working tree":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            applied = GitTimes(root_folder, '.', silent=True).apply()
+            self.assertEqual(applied.missing, 0)
+            self.assertEqual(applied.failed, 0)
+
+            for path, epoch in commit_times.items():
+                self.assertEqual(os.lstat(os.path.join(root_folder, path)).st_mtime, epoch, path)
+
+            applied = GitTimes(root_folder, '.', silent=True).apply()
+            self.assertEqual(applied.changed, 0)
+
+describe TestCase, "tar":
+    it "writes the files in the repository with their commit times":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            out = io.BytesIO()
+            GitTimes(root_folder, '.', silent=True).write_tar(out)
+
+            expected = dict(commit_times)
+            expected["five/four"] = commit_times["three/four"]
+
+            with tarfile.open(fileobj=io.BytesIO(out.getvalue())) as archive:
+                self.assertEqual(dict((member.name, member.mtime) for member in archive.getmembers()), expected)
+
+    it "writes the same bytes no matter how the commit times were found":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            archives = []
+            for with_cache in (True, True, False):
+                # A walk, then the fast path, then a walk without any cache
+                out = io.BytesIO()
+                GitTimes(root_folder, '.', silent=True, with_cache=with_cache).write_tar(out)
+                archives.append(out.getvalue())
+
+            self.assertEqual(archives[0], archives[1])
+            self.assertEqual(archives[0], archives[2])
+
+            with tarfile.open(fileobj=io.BytesIO(archives[0])) as archive:
+                names = archive.getnames()
+            self.assertEqual(names, sorted(names))
+
+describe TestCase, "cache":
+    it "says whether it used the cache in the stats":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            expected = dict(commit_times)
+            expected["five/four"] = commit_times["three/four"]
+
+            gittimes = GitTimes(root_folder, '.', silent=True)
+            self.assertEqual(dict(gittimes.find()), expected)
+            self.assertEqual(gittimes.stats.cache, "miss")
+            self.assertEqual(list(gittimes.stats.phases), ["index", "filtering", "symlinks", "cache", "walk", "output"])
+            assert gittimes.stats.commits_walked > 0
+
+            self.assertEqual(dict(gittimes.find()), expected)
+            self.assertEqual(gittimes.stats.cache, "fast")
+            self.assertEqual(list(gittimes.stats.phases), ["output"])
+
+            os.remove(fast_path.fast_path_location(root_folder))
+            self.assertEqual(dict(gittimes.find()), expected)
+            self.assertEqual(gittimes.stats.cache, "hit")
+            self.assertEqual(gittimes.stats.commits_walked, 0)
+            assert "walk" not in gittimes.stats.phases
+
+            gittimes = GitTimes(root_folder, '.', silent=True, max_commits=2)
+            list(gittimes.find())
+            self.assertEqual(gittimes.stats.cache, "bypassed")
+            self.assertEqual(gittimes.stats.commits_walked, 2)
+
+            gittimes = GitTimes(root_folder, '.', silent=True, with_cache=False, backend="git")
+            list(gittimes.find_batches())
+            self.assertEqual(gittimes.stats.cache, "disabled")
+            assert gittimes.stats.commits_walked > 0
+            self.assertEqual(sum(gittimes.stats.resolved.values()), 5)
+
+    it "doesn't give one backend the commit times another backend found":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            gittimes = GitTimes(root_folder, '.', silent=True)
+            list(gittimes.find())
+            self.assertEqual(gittimes.stats.cache, "miss")
+
+            # Not from the fast path, the cache or the cache for other sets of files
+            gittimes = GitTimes(root_folder, '.', silent=True, backend="git")
+            list(gittimes.find())
+            self.assertEqual(gittimes.stats.cache, "miss")
+
+            gittimes = GitTimes(root_folder, '.', silent=True)
+            list(gittimes.find())
+            self.assertEqual(gittimes.stats.cache, "fast")
+
+    it "only walks the new commits when HEAD has moved forward from the cached commit":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            result = dict(GitTimes(root_folder, '.', timestamps_for=["one", "two", "three/*"]).find())
+            self.assertEqual(result, dict((key, commit_times[key]) for key in ("one", "two", "three/four")))
+
+            with open(os.path.join(root_folder, "one"), "w") as fle:
+                fle.write("changed")
+            self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "commit", "-am", "change one")
+            head = self.do_git_cmd(root_folder, "rev-parse", "HEAD").strip().decode()
+            info = self.do_git_cmd(root_folder, "log", "-1", "--format=%ct %ci").decode().split()
+            commit_time, timezone = info[0], info[-1]
+            offset = (int(timezone[1:3]) * 3600 + int(timezone[3:5]) * 60) * (-1 if timezone[0] == "-" else 1)
+
+            file_commit_times = Repo.file_commit_times
+            excludes = []
+            def recording_file_commit_times(s, use_files_paths, debug=False, exclude=None, stats=None):
+                excludes.append(exclude)
+                return file_commit_times(s, use_files_paths, debug=debug, exclude=exclude, stats=stats)
+
+            with mock.patch.object(Repo, "file_commit_times", recording_file_commit_times):
+                result = dict(GitTimes(root_folder, '.', timestamps_for=["one", "two", "three/*"]).find())
+
+            self.assertEqual(result, {"one": int(commit_time) - offset, "two": commit_times["two"], "three/four": commit_times["three/four"]})
+            # one is different from the cached commit, so it's found with a walk of all of history
+            self.assertEqual(excludes, [["6c463ce367c5d7b26da45be6a67456536d944211"], None])
+            self.assertEqual([item["commit"] for item in cache.get_all_cached_commit_times(root_folder).values()], [head])
+
+    it "finds files a merge took from before the cached commit when refreshing":
+        def commit(root_folder, when, *args):
+            date = "@{0} +0000".format(1500000000 + when)
+            env = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+            subprocess.check_output(["git", "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com"] + list(args), cwd=root_folder, env=env, stderr=subprocess.STDOUT)
+
+        def write(root_folder, name, content):
+            with open(os.path.join(root_folder, name), "w") as fle:
+                fle.write(content)
+            self.do_git_cmd(root_folder, "add", name)
+
+        for backend in ("dulwich", "git"):
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                write(root_folder, "f", "f")
+                write(root_folder, "g", "g")
+                commit(root_folder, 1000, "commit", "-q", "-m", "first")
+                self.do_git_cmd(root_folder, "branch", "side")
+
+                write(root_folder, "g", "g_main")
+                commit(root_folder, 3000, "commit", "-q", "-m", "main")
+
+                # Cache the commit times at the side branch, which changes f
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                write(root_folder, "f", "f_side")
+                commit(root_folder, 2000, "commit", "-q", "-m", "side")
+                self.assertEqual(dict(GitTimes(root_folder, ".", silent=True, backend=backend).find()), {"f": 1500002000, "g": 1500001000})
+
+                # And merge it without its change to f
+                self.do_git_cmd(root_folder, "checkout", "-q", "-")
+                commit(root_folder, 4000, "merge", "-q", "-s", "ours", "-m", "merge", "side")
+
+                gittimes = GitTimes(root_folder, ".", silent=True, backend=backend)
+                result = dict(gittimes.find())
+                self.assertEqual(gittimes.stats.cache, "refresh")
+                self.assertEqual(result, {"f": 1500001000, "g": 1500003000})
+
+                for path, ctime in result.items():
+                    self.assertEqual(int(self.do_git_cmd(root_folder, "log", "-1", "--format=%ct", "--", path).strip()), ctime)
@@ -0,0 +1,28 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.lru import LRU
+
+describe TestCase, "LRU":
+    it "remembers values and counts hits and misses":
+        memo = LRU(10)
+        self.assertIs(memo.get("one"), None)
+        memo.set("one", 1)
+        self.assertEqual(memo.get("one"), 1)
+        self.assertEqual(memo.get("two", 2), 2)
+
+        self.assertEqual(memo.hits, 1)
+        self.assertEqual(memo.misses, 2)
+
+    it "forgets the least recently used values":
+        memo = LRU(2)
+        memo.set("one", 1)
+        memo.set("two", 2)
+        self.assertEqual(memo.get("one"), 1)
+
+        memo.set("three", 3)
+        self.assertEqual(len(memo), 2)
+        self.assertIs(memo.get("two"), None)
+        self.assertEqual(memo.get("one"), 1)
+        self.assertEqual(memo.get("three"), 3)
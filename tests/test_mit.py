@@ -3,7 +3,7 @@
 from tests.helpers import TestCase
 
 from gitmit.mit import GitTimes, Path, SymlinkdPath
-from gitmit import cache
+from gitmit import cache, sqlite_cache
 
 from noseOfYeti.tokeniser.support import noy_sup_setUp
 import uuid
@@ -20,8 +20,15 @@ describe TestCase, "GitTimes":
         parent_dir = str(uuid.uuid1())
         root_folder = str(uuid.uuid1())
         timestamps_for = str(uuid.uuid1())
+        backend = str(uuid.uuid1())
+        first_parent = str(uuid.uuid1())
+        max_commits = str(uuid.uuid1())
+        since = str(uuid.uuid1())
+        fallback_time = str(uuid.uuid1())
 
-        gittimes = GitTimes(root_folder, parent_dir, timestamps_for=timestamps_for, include=include, exclude=exclude, silent=silent, with_cache=with_cache, debug=debug)
+        gittimes = GitTimes(root_folder, parent_dir, timestamps_for=timestamps_for, include=include, exclude=exclude, silent=silent, with_cache=with_cache, debug=debug, backend=backend
+            , first_parent=first_parent, max_commits=max_commits, since=since, fallback_time=fallback_time
+            )
 
         assert gittimes.debug is debug
         assert gittimes.silent is silent
@@ -31,6 +38,11 @@ describe TestCase, "GitTimes":
         assert gittimes.parent_dir is parent_dir
         assert gittimes.root_folder is root_folder
         assert gittimes.timestamps_for is timestamps_for
+        assert gittimes.backend is backend
+        assert gittimes.first_parent is first_parent
+        assert gittimes.max_commits is max_commits
+        assert gittimes.since is since
+        assert gittimes.fallback_time is fallback_time
 
     describe "relpath_for":
         it "takes in a path and returns that path relative to the parent_dir":
@@ -65,32 +77,32 @@ describe TestCase, "GitTimes":
             fle1, fle2, fle3, fle4 = mock.Mock(name="fle1"), mock.Mock(name="fle2"), mock.Mock(name="fle3"), mock.Mock(name="fle4")
 
             repo = mock.Mock(name="repo")
-            FakeRepo = mock.Mock(name="Repo", return_value=repo)
+            fake_repo_for = mock.Mock(name="repo_for", return_value=repo)
             repo.all_files.return_value = [fle1, fle2]
 
-            commit_times = mock.Mock(name="commit_times")
             fake_find_files_for_use = mock.Mock(name="find_files_for_use", return_value=[fle1])
             def fake_extra_symlinked_files(use_files):
                 self.assertEqual(use_files, set([fle1]))
                 return set([fle3, fle4])
             fake_extra_symlinked_files = mock.Mock(name="fake_extra_symlinked_files", side_effect=fake_extra_symlinked_files)
-            fake_commit_times_for = mock.Mock(name="commit_times_for", return_value=commit_times)
+            fake_commit_time_batches_for = mock.Mock(name="commit_time_batches_for", return_value=[[("one", 1), ("two", 1)], [("three", 2)]])
 
             root_folder = mock.Mock(name="root_folder")
             parent_dir = mock.Mock(name="parent_dir")
             gittimes = GitTimes(root_folder, parent_dir)
 
-            with mock.patch.multiple(gittimes, find_files_for_use=fake_find_files_for_use, extra_symlinked_files=fake_extra_symlinked_files, commit_times_for=fake_commit_times_for):
-                with mock.patch("gitmit.mit.Repo", FakeRepo):
-                    self.assertIs(gittimes.find(), commit_times)
+            with mock.patch.multiple(gittimes, find_files_for_use=fake_find_files_for_use, extra_symlinked_files=fake_extra_symlinked_files, commit_time_batches_for=fake_commit_time_batches_for, fast_path_key=mock.Mock(name="fast_path_key", return_value=None)):
+                with mock.patch("gitmit.backends.repo_for", fake_repo_for):
+                    self.assertEqual(list(gittimes.find()), [("one", 1), ("two", 1), ("three", 2)])
 
-            FakeRepo.assert_called_once_with(root_folder)
+            fake_repo_for.assert_called_once_with(root_folder, "dulwich", tree_cache=mock.ANY)
+            self.assertEqual(fake_repo_for.mock_calls[0][2]["tree_cache"].root_folder, root_folder)
             fake_find_files_for_use.assert_called_once_with([fle1, fle2])
-            fake_commit_times_for.assert_called_once_with(repo, set([fle1, fle3, fle4]))
+            fake_commit_time_batches_for.assert_called_once_with(repo, set([fle1, fle3, fle4]))
 
     describe "commit_times_for":
         it "uses cached_commit_times if it can find them":
-            t1, t2 = str(uuid.uuid1()), str(uuid.uuid1())
+            t1, t2 = 1500000001, 1500000002
             parent_dir = "one"
             first_commit = str(uuid.uuid1())
 
@@ -104,8 +116,171 @@ describe TestCase, "GitTimes":
                 use_files = [Path("one/two", "two"), Path("one/three", "three")]
                 self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
 
+        it "uses the cache backend it's given":
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit"], first_commit=first_commit)
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+                sqlite_cache.set_cached_commit_times(root_folder, "one", first_commit, {"one/two": 1, "one/three": 2}, ["three", "two"])
+
+                gittimes = GitTimes(root_folder, "one", cache_backend="sqlite")
+                use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": 1, "three": 2})
+                self.assertEqual(gittimes.stats.cache, "hit")
+
+        it "only looks at new commits if the cached commit is an ancestor of HEAD":
+            t1, t2, t3 = 1500000001, 1500000002, 1500000003
+            parent_dir = "one"
+            cached_commit = str(uuid.uuid1())
+            first_commit = str(uuid.uuid1())
+
+            git = mock.Mock(name="git", spec=["first_commit", "is_ancestor", "changed_since", "file_commit_times"], first_commit=first_commit)
+            git.is_ancestor.return_value = True
+            git.changed_since.return_value = set()
+            git.file_commit_times.return_value = [(first_commit, t3, ["one/two"])]
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+                cache.set_cached_commit_times(root_folder, parent_dir, cached_commit, {"one/two": t1, "one/three": t2}, ["three", "two"])
+
+                gittimes = GitTimes(root_folder, parent_dir)
+                use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t3, "three": t2})
+
+                git.is_ancestor.assert_called_once_with(cached_commit)
+                git.changed_since.assert_called_once_with(cached_commit, set(["one/two", "one/three"]))
+                git.file_commit_times.assert_called_once_with(set(["one/two", "one/three"]), debug=False, stats=gittimes.stats, exclude=[cached_commit])
+                self.assertEqual(cache.get_cached_commit_times(root_folder, parent_dir, ["three", "two"]), (first_commit, {"one/two": t3, "one/three": t2}))
+
+        it "walks all of history for files that changed since the cached commit":
+            t1, t2, t3, t4 = 1500000001, 1500000002, 1500000003, 1500000000
+            parent_dir = "one"
+            cached_commit = str(uuid.uuid1())
+            first_commit = str(uuid.uuid1())
+
+            git = mock.Mock(name="git", spec=["first_commit", "is_ancestor", "changed_since", "file_commit_times"], first_commit=first_commit)
+            git.is_ancestor.return_value = True
+            git.changed_since.return_value = set(["one/two"])
+
+            def file_commit_times(use_files_paths, exclude=None, **kwargs):
+                if exclude:
+                    return [(first_commit, t3, ["one/four"])]
+                # A merge brought back a version of two from before the cached commit
+                return [("older", t4, ["one/two"])]
+            git.file_commit_times.side_effect = file_commit_times
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+                cache.set_cached_commit_times(root_folder, parent_dir, cached_commit, {"one/two": t1, "one/three": t2, "one/four": t1}, ["four", "three", "two"])
+
+                gittimes = GitTimes(root_folder, parent_dir, silent=True)
+                use_files = [Path("one/two", "two"), Path("one/three", "three"), Path("one/four", "four")]
+                self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t4, "three": t2, "four": t3})
+                self.assertEqual(gittimes.stats.cache, "refresh")
+
+                self.assertEqual(git.file_commit_times.mock_calls, [
+                      mock.call(set(["one/three", "one/four"]), debug=False, stats=gittimes.stats, exclude=[cached_commit])
+                    , mock.call(set(["one/two"]), debug=False, stats=gittimes.stats)
+                    ])
+
+        it "uses the commit times other sets of files found at HEAD":
+            t1, t2 = 1500000001, 1500000002
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit"], first_commit=first_commit)
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+                cache.set_cached_commit_times(root_folder, ".", first_commit, {"one/two": t1, "one/three": t2, "four": 3}, ["four", "one/three", "one/two"])
+
+                gittimes = GitTimes(root_folder, "one")
+                use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
+                self.assertEqual(gittimes.stats.cache, "superset")
+
+                # And it is now a hit for this set of files
+                self.assertEqual(cache.get_cached_commit_times(root_folder, "one", ["three", "two"]), (first_commit, {"one/two": t1, "one/three": t2}))
+
+        it "only walks for the files other sets of files didn't find":
+            t1, t2 = 1500000001, 1500000002
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+            git.file_commit_times.return_value = [(first_commit, t2, ["one/three"])]
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+                sqlite_cache.set_cached_commit_times(root_folder, "one", first_commit, {"one/two": t1}, ["two"])
+
+                gittimes = GitTimes(root_folder, "one", cache_backend="sqlite")
+                use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
+                self.assertEqual(gittimes.stats.cache, "superset")
+
+                git.file_commit_times.assert_called_once_with(set(["one/three"]), debug=False, stats=gittimes.stats, first_parent=False, max_commits=None, since=None)
+                self.assertEqual(sqlite_cache.get_cached_commit_times(root_folder, "one", ["three", "two"]), (first_commit, {"one/two": t1, "one/three": t2}))
+
+        it "uses and fills the shared cache between clones":
+            t1, t2 = 1500000001, 1500000002
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+            git.file_commit_times.return_value = [(first_commit, t1, ["one/two"]), (first_commit, t2, ["one/three"])]
+            use_files = [Path("one/two", "two"), Path("one/three", "three")]
+
+            with self.a_temp_dir() as cache_dir:
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    gittimes = GitTimes(root_folder, "one", cache_dir=cache_dir)
+                    self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
+                    self.assertEqual(gittimes.stats.cache, "miss")
+
+                # A fresh clone doesn't need to walk
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    gittimes = GitTimes(root_folder, "one", cache_dir=cache_dir)
+                    self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
+                    self.assertEqual(gittimes.stats.cache, "shared")
+                    self.assertEqual(cache.get_cached_commit_times(root_folder, "one", ["three", "two"]), (first_commit, {"one/two": t1, "one/three": t2}))
+
+            self.assertEqual(len(git.file_commit_times.mock_calls), 1)
+
+        it "gives the shared cache its own budget":
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+            git.file_commit_times.return_value = [(first_commit, 1, ["one/two"])]
+            fake_set_shared = mock.Mock(name="set_shared_commit_times")
+
+            with self.a_temp_dir() as cache_dir:
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    gittimes = GitTimes(root_folder, "one", cache_dir=cache_dir, cache_max_bytes=10, shared_cache_max_bytes=2000)
+                    with mock.patch("gitmit.shared_cache.set_shared_commit_times", fake_set_shared):
+                        self.assertEqual(dict(gittimes.commit_times_for(git, [Path("one/two", "two")])), {"two": 1})
+
+            fake_set_shared.assert_called_once_with(cache_dir, "one", first_commit, {"one/two": 1}, ["two"], max_bytes=2000, backend="dulwich")
+
+        it "doesn't use the shared cache from a shallow clone":
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+            git.file_commit_times.return_value = [(first_commit, 1, ["one/two"])]
+            fake_get_shared = mock.Mock(name="get_shared_commit_times")
+            fake_set_shared = mock.Mock(name="set_shared_commit_times")
+
+            with self.a_temp_dir() as cache_dir:
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    with open(os.path.join(root_folder, ".git", "shallow"), "w") as fle:
+                        fle.write("{0}\n".format(first_commit))
+
+                    gittimes = GitTimes(root_folder, "one", cache_dir=cache_dir)
+                    with mock.patch.multiple("gitmit.shared_cache", get_shared_commit_times=fake_get_shared, set_shared_commit_times=fake_set_shared):
+                        self.assertEqual(dict(gittimes.commit_times_for(git, [Path("one/two", "two")])), {"two": 1})
+                    self.assertEqual(gittimes.stats.cache, "miss")
+
+            self.assertEqual(len(fake_get_shared.mock_calls), 0)
+            self.assertEqual(len(fake_set_shared.mock_calls), 0)
+
         it "does not use cached_commit_times if not with_cache":
-            t1, t2 = str(uuid.uuid1()), str(uuid.uuid1())
+            t1, t2 = 1500000001, 1500000002
             parent_dir = "one"
             first_commit = str(uuid.uuid1())
             second_commit = str(uuid.uuid1())
@@ -122,10 +297,10 @@ describe TestCase, "GitTimes":
                 self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
 
                 # If it calls this, then we didn't use the cache
-                git.file_commit_times.assert_called_once_with(set(["one/two", "one/three"]), debug=False)
+                git.file_commit_times.assert_called_once_with(set(["one/two", "one/three"]), debug=False, stats=gittimes.stats, first_parent=False, max_commits=None, since=None)
 
         it "sets cached_commit_times if with_cache":
-            t1, t2 = str(uuid.uuid1()), str(uuid.uuid1())
+            t1, t2 = 1500000001, 1500000002
             parent_dir = "one"
             first_commit = str(uuid.uuid1())
             second_commit = str(uuid.uuid1())
@@ -140,13 +315,28 @@ describe TestCase, "GitTimes":
                 use_files = [Path("one/two", "two"), Path("one/three", "three")]
                 self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
 
-                self.assertEqual(cache.get_all_cached_commit_times(root_folder)
-                    , [ {"parent_dir": parent_dir, "commit": first_commit, "commit_times": {"one/two": t1, "one/three": t2}, "sorted_relpaths": ["three", "two"]}
-                      ]
-                    )
+                entries = cache.get_all_cached_commit_times(root_folder)
+                self.assertEqual(list(entries), [cache.cache_key(parent_dir, ["three", "two"])])
+                entry = list(entries.values())[0]
+                self.assertEqual((entry["parent_dir"], entry["commit"], entry["commit_times"]), (parent_dir, first_commit, {"one/two": t1, "one/three": t2}))
+
+        it "gives the cache its limits":
+            first_commit = str(uuid.uuid1())
+            git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+            git.file_commit_times.side_effect = lambda *args, **kwargs: [(first_commit, 1, ["one/two"])]
+
+            with self.a_temp_dir() as root_folder:
+                os.mkdir(os.path.join(root_folder, ".git"))
+
+                for parent_dir in ("one", "two"):
+                    gittimes = GitTimes(root_folder, parent_dir, cache_max_entries=1)
+                    list(gittimes.commit_times_for(git, [Path("one/two", "two")]))
+
+                entries = cache.get_all_cached_commit_times(root_folder)
+                self.assertEqual([entry["parent_dir"] for entry in entries.values()], ["two"])
 
         it "does not set cached times if not with_cache":
-            t1, t2 = str(uuid.uuid1()), str(uuid.uuid1())
+            t1, t2 = 1500000001, 1500000002
             parent_dir = "one"
             first_commit = str(uuid.uuid1())
             second_commit = str(uuid.uuid1())
@@ -161,7 +351,118 @@ describe TestCase, "GitTimes":
                 use_files = [Path("one/two", "two"), Path("one/three", "three")]
                 self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t1, "three": t2})
 
-                self.assertEqual(cache.get_all_cached_commit_times(root_folder), [])
+                self.assertEqual(cache.get_all_cached_commit_times(root_folder), {})
+
+        describe "batches":
+            it "yields each commit's files as soon as the walk finds them":
+                first_commit = str(uuid.uuid1())
+                git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+
+                walked = []
+                def file_commit_times(use_files_paths, **kwargs):
+                    walked.append("first")
+                    yield first_commit, 3, ["one/two"]
+                    walked.append("second")
+                    yield "second", 2, ["one/three"]
+                git.file_commit_times.side_effect = file_commit_times
+
+                gittimes = GitTimes(mock.Mock(name="root_folder"), "one", with_cache=False)
+                use_files = [Path("one/two", "two"), Path("one/three", "three"), SymlinkdPath("link/two", "link/two", "one/two")]
+
+                batches = gittimes.commit_time_batches_for(git, use_files)
+                self.assertEqual(sorted(next(batches)), [("link/two", 3), ("two", 3)])
+                self.assertEqual(walked, ["first"])
+
+                self.assertEqual(list(batches), [[("three", 2)]])
+                self.assertEqual(walked, ["first", "second"])
+
+            it "yields new commits before the rest of the cache when refreshing":
+                parent_dir = "one"
+                cached_commit = str(uuid.uuid1())
+                first_commit = str(uuid.uuid1())
+
+                git = mock.Mock(name="git", spec=["first_commit", "is_ancestor", "changed_since", "file_commit_times"], first_commit=first_commit)
+                git.is_ancestor.return_value = True
+                git.changed_since.return_value = set()
+                git.file_commit_times.return_value = [(first_commit, 3, ["one/two"])]
+
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    cache.set_cached_commit_times(root_folder, parent_dir, cached_commit, {"one/two": 1, "one/three": 2}, ["three", "two"])
+
+                    gittimes = GitTimes(root_folder, parent_dir, silent=True)
+                    use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                    self.assertEqual(list(gittimes.commit_time_batches_for(git, use_files)), [[("two", 3)], [("three", 2)]])
+
+            it "apply sets the times of the batches relative to the parent_dir":
+                batches = mock.Mock(name="batches")
+                applied = mock.Mock(name="applied")
+                fake_apply_mtimes = mock.Mock(name="apply_mtimes", return_value=applied)
+
+                gittimes = GitTimes("/somewhere/nice", "stuff")
+                with mock.patch.object(gittimes, "find_batches", return_value=batches):
+                    with mock.patch("gitmit.apply.apply_mtimes", fake_apply_mtimes):
+                        self.assertIs(gittimes.apply(workers=4), applied)
+
+                fake_apply_mtimes.assert_called_once_with("/somewhere/nice/stuff", batches, workers=4)
+
+            it "write_tar writes the files it finds relative to the parent_dir":
+                found = [("two", 2), ("one", 1), ("three", 3)]
+                fileobj = mock.Mock(name="fileobj")
+                fake_write_tar = mock.Mock(name="write_tar", return_value=3)
+
+                gittimes = GitTimes("/somewhere/nice", "stuff")
+                with mock.patch.object(gittimes, "find", return_value=iter(found)):
+                    with mock.patch("gitmit.tar.write_tar", fake_write_tar):
+                        self.assertEqual(gittimes.write_tar(fileobj), 3)
+
+                fake_write_tar.assert_called_once_with("/somewhere/nice/stuff", [("one", 1), ("three", 3), ("two", 2)], fileobj)
+
+            it "find_batches finds the files and gives them to commit_time_batches_for":
+                git, use_files = mock.Mock(name="git"), mock.Mock(name="use_files")
+                gittimes = GitTimes(mock.Mock(name="root_folder"), ".")
+
+                files_to_find = mock.Mock(name="files_to_find", return_value=(git, use_files))
+                commit_time_batches_for = mock.Mock(name="commit_time_batches_for", return_value=[[("one", 1)], [("two", 2)]])
+                with mock.patch.multiple(gittimes, files_to_find=files_to_find, commit_time_batches_for=commit_time_batches_for, fast_path_key=mock.Mock(name="fast_path_key", return_value=None)):
+                    self.assertEqual(list(gittimes.find_batches()), [[("one", 1)], [("two", 2)]])
+
+                commit_time_batches_for.assert_called_once_with(git, use_files)
+
+        describe "bounded walks":
+            def find_with(self, **kwargs):
+                t1 = str(uuid.uuid1())
+                parent_dir = "one"
+                first_commit = str(uuid.uuid1())
+
+                git = mock.Mock(name="git", spec=["first_commit", "file_commit_times"], first_commit=first_commit)
+                git.file_commit_times.return_value = [(first_commit, t1, ["one/two"]), (None, 200, ["one/three"])]
+
+                with self.a_temp_dir() as root_folder:
+                    os.mkdir(os.path.join(root_folder, ".git"))
+                    cache.set_cached_commit_times(root_folder, parent_dir, first_commit, {"one/two": 1, "one/three": 2}, ["three", "two"])
+
+                    gittimes = GitTimes(root_folder, parent_dir, silent=True, max_commits=10, since=100, **kwargs)
+                    use_files = [Path("one/two", "two"), Path("one/three", "three")]
+                    found = dict(gittimes.commit_times_for(git, use_files))
+
+                    # Bounded walks don't use or change the cache
+                    git.file_commit_times.assert_called_once_with(set(["one/two", "one/three"]), debug=False, stats=gittimes.stats, first_parent=False, max_commits=10, since=100)
+                    self.assertEqual(cache.get_cached_commit_times(root_folder, parent_dir, ["three", "two"]), (first_commit, {"one/two": 1, "one/three": 2}))
+
+                return t1, found
+
+            it "gives the time of the oldest commit to files it didn't find by default":
+                t1, found = self.find_with()
+                self.assertEqual(found, {"two": t1, "three": 200})
+
+            it "can give a particular fallback time":
+                t1, found = self.find_with(fallback_time=50)
+                self.assertEqual(found, {"two": t1, "three": 50})
+
+            it "can give no fallback time":
+                t1, found = self.find_with(fallback_time=None)
+                self.assertEqual(found, {"two": t1})
 
         describe "with symlinks":
             it "uses the relpath of the target in use_files to ensure we get a commit times for the target":
@@ -184,7 +485,7 @@ describe TestCase, "GitTimes":
 
                     self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t2, "three": t2, "six/four": t1, "six/five": t1})
 
-                    git.file_commit_times.assert_called_once_with(set(["one/two", "one/three", "three/four", "three/five"]), debug=False)
+                    git.file_commit_times.assert_called_once_with(set(["one/two", "one/three", "three/four", "three/five"]), debug=False, stats=gittimes.stats, first_parent=False, max_commits=None, since=None)
 
             it "doesn't complain if it can't find the target":
                 t1, t2 = str(uuid.uuid1()), str(uuid.uuid1())
@@ -206,7 +507,7 @@ describe TestCase, "GitTimes":
 
                     self.assertEqual(dict(gittimes.commit_times_for(git, use_files)), {"two": t2, "three": t2, "six/four": t1})
 
-                    git.file_commit_times.assert_called_once_with(set(["one/two", "one/three", "three/four", "three/five"]), debug=False)
+                    git.file_commit_times.assert_called_once_with(set(["one/two", "one/three", "three/four", "three/five"]), debug=False, stats=gittimes.stats, first_parent=False, max_commits=None, since=None)
 
     describe "extra_symlinked_files":
         it "returns us SymlinkdPath objects representing where in the repo, where the symlink is, where the target is":
@@ -247,27 +548,43 @@ describe TestCase, "GitTimes":
                 self.assertEqual(result, expected)
 
     describe "find_files_for_use":
-        it "finds relpath_for and then yields Path if not is_filtered":
-            r1, p1 = "./r1", mock.Mock(name="p1")
-            r2, p2 = mock.Mock(name="r2"), mock.Mock(name="p2")
-            r2.startswith.return_value = False
-            r3, p3 = "./one/two/three", mock.Mock(name="p3")
-            all_files = [p1, p2, p3]
-
-            def relpath_for(p):
-                return {p1: r1, p2: r2, p3: r3}[p]
-            fake_relpath_for = mock.Mock(name="relpath_for", side_effect=relpath_for)
-
-            def is_filtered(p):
-                return {"r1": False, r2: True, "one/two/three": False}[p]
-            fake_is_filtered = mock.Mock(name="is_filtered", side_effect=is_filtered)
-
-            root_folder = mock.Mock(name="root_folder")
-            parent_dir = mock.Mock(name="parent_dir")
-            gittimes = GitTimes(root_folder, parent_dir)
-
-            with mock.patch.multiple(gittimes, relpath_for=fake_relpath_for, is_filtered=fake_is_filtered):
-                self.assertEqual(list(gittimes.find_files_for_use(all_files)), [Path(p1, "r1"), Path(p3, "one/two/three")])
+        it "yields Path for the files relative to the parent_dir that aren't filtered":
+            all_files = ["one/two", "one/three/four", "one/three/five.pyc", "one/six/seven", "other/eight", "nine", "one"]
+
+            gittimes = GitTimes(mock.Mock(name="root_folder"), "one", exclude=["*.pyc", "six/*"])
+            self.assertEqual(sorted(gittimes.find_files_for_use(all_files))
+                , [Path("one", ""), Path("one/three/four", "three/four"), Path("one/two", "two")]
+                )
+
+            gittimes = GitTimes(mock.Mock(name="root_folder"), ".", timestamps_for=["one/*"], exclude=["*.pyc"], include=["one/three/*"])
+            self.assertEqual(sorted(gittimes.find_files_for_use(all_files))
+                , [Path("one/six/seven", "one/six/seven"), Path("one/three/five.pyc", "one/three/five.pyc"), Path("one/three/four", "one/three/four"), Path("one/two", "one/two")]
+                )
+
+        it "doesn't look at each file in folders the filters have decided on":
+            all_files = ["one/two", "one/three/four", "one/three/five.pyc", "one/six/seven", "other/eight", "nine"]
+            gittimes = GitTimes(mock.Mock(name="root_folder"), "one", exclude=["six/*"])
+
+            accepts = gittimes.filters.accepts
+            looked_at = []
+            def recording_accepts(relpath):
+                looked_at.append(relpath)
+                return accepts(relpath)
+
+            with mock.patch.object(gittimes.filters, "accepts", recording_accepts):
+                found = sorted(gittimes.find_files_for_use(all_files))
+
+            self.assertEqual(found, [Path("one/three/five.pyc", "three/five.pyc"), Path("one/three/four", "three/four"), Path("one/two", "two")])
+            # Only the files at the top need to be looked at
+            self.assertEqual(looked_at, ["two"])
+
+        it "compiles the filters again if they change":
+            gittimes = GitTimes(mock.Mock(name="root_folder"), ".", exclude=["one"])
+            assert gittimes.is_filtered("one")
+            assert not gittimes.is_filtered("two")
+
+            gittimes.exclude.append("two")
+            assert gittimes.is_filtered("two")
 
     describe "is_filtered":
         before_each:
@@ -34,6 +34,32 @@ describe TestCase, "PrefixTree":
         prefix_tree.cache[prefix] = True
         assert prefix in prefix_tree
 
+    it "returns the folder for a prefix if it can be found in the cache":
+        prefix_tree = PrefixTree()
+        prefix_tree.fill(["one/two/three", "four"])
+
+        self.assertIs(prefix_tree.folder(("one", "two")), prefix_tree.tree.folders["one"].folders["two"])
+        self.assertIs(prefix_tree.folder(()), prefix_tree.tree)
+        self.assertIs(prefix_tree.folder(("four", )), None)
+
+    it "knows the paths that are left":
+        prefix_tree = PrefixTree()
+        prefix_tree.fill(["one/two/three", "one/five", "four"])
+        self.assertEqual(sorted(prefix_tree.paths()), [("four", ), ("one", "five"), ("one", "two", "three")])
+
+        prefix_tree.remove(("one", "two"), "three")
+        self.assertEqual(sorted(prefix_tree.paths()), [("four", ), ("one", "five")])
+
+    it "knows how many files are left":
+        tree = PrefixTree()
+        self.assertEqual(len(tree), 0)
+
+        tree.fill(["one", "two/three", "two/four/five"])
+        self.assertEqual(len(tree), 3)
+
+        tree.remove(("two", ), "three")
+        self.assertEqual(len(tree), 2)
+
     describe "fill":
         it "creates a linked list like structure using parent, folders and files":
             paths = ["one/two/three", "one/two/four", "one/five", "six"]
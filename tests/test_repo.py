@@ -2,15 +2,17 @@
 
 from tests.helpers import TestCase
 
-from gitmit.repo import Repo, empty
-
-from collections import namedtuple
-import uuid
+from gitmit.tree_cache import TreeEntryCache
+from gitmit.prefix_tree import PrefixTree
+from gitmit.stats import Stats
+from gitmit.repo import Repo
+
+from noseOfYeti.tokeniser.support import noy_sup_setUp
+from contextlib import contextmanager
+import subprocess
 import mock
 import os
 
-Entry = namedtuple("Entry", ["name", "type", "oid"])
-
 describe TestCase, "Repo":
     it "takes in the root_folder and creates a libgit Repository from it":
         git = mock.Mock(name="git")
@@ -48,6 +50,21 @@ describe TestCase, "Repo":
                 head = self.do_git_cmd(root_folder, "rev-parse", "HEAD").strip().decode('utf-8')
                 self.assertEqual(str(Repo(root_folder).first_commit), head)
 
+    describe "is_ancestor":
+        it "says whether the commit is reachable from HEAD":
+            with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+                repo = Repo(root_folder)
+                assert repo.is_ancestor("5ad69c29c0c4b003e10ed0355cf598b22f314c7d")
+                assert repo.is_ancestor("04863f2e71a0b230c20a9ab8de46d8b116b08c34")
+                assert repo.is_ancestor(b"369ba2ef53a0e814fd5cd8b68793b08abdf241b3")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "2ccdbff3f86df69695a532232f0d78be844d7ed9")
+                repo = Repo(root_folder)
+                assert repo.is_ancestor("369ba2ef53a0e814fd5cd8b68793b08abdf241b3")
+                assert not repo.is_ancestor("04863f2e71a0b230c20a9ab8de46d8b116b08c34")
+                assert not repo.is_ancestor("5ad69c29c0c4b003e10ed0355cf598b22f314c7d")
+                assert not repo.is_ancestor("9fc25f91ffb9dc693f999a8983954c777f8cb2f6")
+
     describe "file_commit_times":
         it "yields the commit oid, commit time and files changed in that commit":
             with self.cloned_repo("paths") as (root_folder, commit_times):
@@ -104,220 +121,452 @@ describe TestCase, "Repo":
 
                 self.assertEqual(actual, expected)
 
-    describe "entries_in_tree_oid":
-        it "returns empty if tree_oid not in git":
+        it "only decodes each tree once per walk":
             with self.cloned_repo("paths") as (root_folder, commit_times):
                 repo = Repo(root_folder)
-                self.assertIs(repo.entries_in_tree_oid((), b"9fc25f91ffb9dc693f999a8983954c777f8cb2f6"), empty)
 
-        it "gets entries_in_tree as a set if can find a tree":
-            with self.cloned_repo("paths") as (root_folder, commit_times):
-                repo = Repo(root_folder)
-                tree_oid = list(repo.git.get_walker())[0].commit.tree
-                self.assertEqual(repo.entries_in_tree_oid((), tree_oid)
-                    , frozenset(
-                        [ (('one',), False, b'3b5b7321662dac4ad026e1434206f19167fb119b')
-                        , (('six',), False, b'ffe2fce498955b628014618b28c6bcf152466a4a')
-                        , (('three',), True, b'dd53cbd0fe752a982d79710e0b801c08fb10bce9')
-                        , (('seven',), False, b'fe7900bcbd294970da3296db5cf2020b4391a639')
-                        , (('five',), False, b'1d19714ffbc272ba0da6eb419d66123c20527174')
-                        , (('two',), False, b'f719efd430d52bcfc8566a43b2eb655688d38871')
-                        ]
-                      )
-                    )
-
-                self.assertEqual(repo.entries_in_tree_oid(("prefix", "blah"), tree_oid)
-                    , frozenset(
-                        [ (('prefix', 'blah', 'one',), False, b'3b5b7321662dac4ad026e1434206f19167fb119b')
-                        , (('prefix', 'blah', 'six',), False, b'ffe2fce498955b628014618b28c6bcf152466a4a')
-                        , (('prefix', 'blah', 'three',), True, b'dd53cbd0fe752a982d79710e0b801c08fb10bce9')
-                        , (('prefix', 'blah', 'seven',), False, b'fe7900bcbd294970da3296db5cf2020b4391a639')
-                        , (('prefix', 'blah', 'five',), False, b'1d19714ffbc272ba0da6eb419d66123c20527174')
-                        , (('prefix', 'blah', 'two',), False, b'f719efd430d52bcfc8566a43b2eb655688d38871')
-                        ]
-                      )
-                    )
+                decoded = []
+                tree_entries = repo.tree_entries
+                def recording_tree_entries(tree_oid):
+                    decoded.append(tree_oid)
+                    return tree_entries(tree_oid)
 
-    describe "tree_structures_for":
-        it "returns empty and empty if prefix not in prefixes":
-            prefixes = {1:2}
-            prefix = 3
+                with mock.patch.object(repo, "tree_entries", recording_tree_entries):
+                    list(repo.file_commit_times(set(commit_times)))
 
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
+                self.assertEqual(len(decoded), len(set(decoded)))
+                assert repo.memo.hits > 0
+                self.assertEqual(repo.memo.misses, len(decoded))
 
-            self.assertEqual(repo.tree_structures_for(prefix, str(uuid.uuid1()), [str(uuid.uuid1())], prefixes), (empty, empty))
-
-        it "returns entries_for_tree_oid for current files and parent files":
-            prefix = str(uuid.uuid1())
-            prefixes = {prefix: set(["one"])}
-            current_oid = mock.Mock(name="current_oid")
-            parent_oid_1 = mock.Mock(name="parent_oid_1")
-            parent_oids = [parent_oid_1]
-
-            current_files = set(["one", "two"])
-            parent_files = set(["one"])
-            changes = set(["two"])
+        it "can stop after a number of commits and say what it didn't find":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                result = [(coid, ctime, sorted(paths)) for coid, ctime, paths in Repo(root_folder).file_commit_times(set(commit_times), max_commits=2)]
+                self.assertEqual(result
+                    , [ ('6c463ce367c5d7b26da45be6a67456536d944211', 1459036362, ['seven', 'six'])
+                      , ('9265c0337a90334d989e758942d86dc60b267a71', 1459034839, ['five'])
+                      , (None, 1459034839, ['one', 'three/four', 'two'])
+                      ]
+                    )
 
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
+        it "can stop at commits older than an epoch":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                result = [(coid, ctime, sorted(paths)) for coid, ctime, paths in Repo(root_folder).file_commit_times(set(commit_times), since=1459074433)]
+                self.assertEqual(result[-1], (None, 1459034833, ['one', 'two']))
 
-            def entries_in_tree_oid(prefix, oid):
-                return {current_oid: current_files, parent_oid_1: parent_files}[oid]
-            fake_entries_in_tree_oid = mock.Mock(name="entries_in_tree_oid", side_effect=entries_in_tree_oid)
+                result = [(coid, ctime, sorted(paths)) for coid, ctime, paths in Repo(root_folder).file_commit_times(set(commit_times), since=1459075963)]
+                self.assertEqual(result, [(None, None, sorted(commit_times))])
 
-            with mock.patch.multiple(repo, entries_in_tree_oid=fake_entries_in_tree_oid):
-                self.assertEqual(repo.tree_structures_for(prefix, current_oid, parent_oids, prefixes), ((current_files, parent_files), changes))
+        it "doesn't say what it didn't find if the walk wasn't bounded or found everything":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                result = list(Repo(root_folder).file_commit_times(set(["five"]), max_commits=10))
+                self.assertEqual(result, [('9265c0337a90334d989e758942d86dc60b267a71', 1459034839, ['five'])])
+
+                result = list(Repo(root_folder).file_commit_times(set(["five", "nope"])))
+                self.assertEqual(result, [('9265c0337a90334d989e758942d86dc60b267a71', 1459034839, ['five'])])
+
+        it "can only follow first parents":
+            with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+                result = dict((path, coid) for coid, _, paths in Repo(root_folder).file_commit_times(set(commit_times), first_parent=True) for path in paths)
+
+                # The merge is compared against the first parent, so it gets the changes from the second parent
+                self.assertEqual(result["b"], "5ad69c29c0c4b003e10ed0355cf598b22f314c7d")
+                self.assertEqual(result["c"], "5ad69c29c0c4b003e10ed0355cf598b22f314c7d")
+                self.assertEqual(result["d"], "2ccdbff3f86df69695a532232f0d78be844d7ed9")
+
+        it "uses the commit-graph instead of parsing every commit":
+            for name in ("paths", "merge_with_changes"):
+                with self.cloned_repo(name) as (root_folder, commit_times):
+                    without_graph = list(Repo(root_folder, use_commit_graph=False).file_commit_times(set(commit_times)))
+
+                    self.do_git_cmd(root_folder, "branch", "graphed")
+                    self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable")
+
+                    repo = Repo(root_folder)
+                    assert repo.commit_graph is not None
+
+                    parsed = []
+                    get_object = repo.git.get_object
+                    def recording_get_object(oid):
+                        obj = get_object(oid)
+                        if obj.type_name == b"commit":
+                            parsed.append(oid.decode())
+                        return obj
+
+                    with mock.patch.object(repo.git, "get_object", recording_get_object):
+                        with_graph = list(repo.file_commit_times(set(commit_times)))
+
+                    self.assertEqual(with_graph, without_graph)
+
+                    # Only the commits that changed something are parsed, for their timezone
+                    self.assertEqual(sorted(parsed), sorted(oid for oid, _, _ in with_graph))
+
+        it "skips commits the bloom filters say didn't change anything we care about":
+            for name in ("paths", "merge_with_changes", "merge_with_no_changes"):
+                with self.cloned_repo(name) as (root_folder, commit_times):
+                    without_filters = list(Repo(root_folder, use_commit_graph=False).file_commit_times(set(commit_times)))
+
+                    self.do_git_cmd(root_folder, "branch", "graphed")
+                    self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--changed-paths")
+
+                    repo = Repo(root_folder)
+                    diffed = []
+                    differences_between = repo.differences_between
+                    def recording_differences_between(current_oid, parent_oids, prefixes):
+                        diffed.append(current_oid)
+                        return differences_between(current_oid, parent_oids, prefixes)
+
+                    with mock.patch.object(repo, "differences_between", recording_differences_between):
+                        with_filters = list(repo.file_commit_times(set(commit_times)))
+
+                    self.assertEqual(with_filters, without_filters)
+
+                    if name == "paths":
+                        # Small enough for no false positives, so we only diff commits that change something
+                        self.assertEqual(len(diffed), len(with_filters))
+
+        it "counts what it does in the stats":
+            with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+                stats = Stats()
+                found = list(Repo(root_folder, use_commit_graph=False).file_commit_times(set(commit_times), stats=stats))
+
+                walked = self.do_git_cmd(root_folder, "rev-list", "--count", "HEAD").strip()
+                merges = self.do_git_cmd(root_folder, "rev-list", "--count", "--merges", "HEAD").strip()
+                self.assertEqual(stats.commits_walked, int(walked))
+                self.assertEqual(stats.merge_commits, int(merges))
+                self.assertEqual(sum(stats.resolved.values()), len(found))
+                assert stats.trees_decoded > 0
+                assert stats.entries_compared > 0
+                self.assertEqual(stats.tree_cache_hits, 0)
+
+        it "counts the trees it gets from the tree cache":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                list(Repo(root_folder, tree_cache=TreeEntryCache(root_folder)).file_commit_times(set(commit_times)))
+
+                repo = Repo(root_folder, tree_cache=TreeEntryCache(root_folder))
+                list(repo.file_commit_times(set(commit_times)))
+                self.assertEqual(repo.stats.trees_decoded, 0)
+                assert repo.stats.tree_cache_hits > 0
+
+    describe "maybe_changed":
+        before_each:
+            self.repo = Repo.__new__(Repo)
+            self.prefixes = PrefixTree()
+            self.prefixes.fill(["one", "two/three", "two/four/five", "six/seven"])
+
+        def bloom_with(self, *paths):
+            bloom = mock.Mock(name="bloom")
+            checked = bloom.checked = []
+            def contains(parts):
+                checked.append("/".join(parts))
+                return "/".join(parts) in paths
+            bloom.contains.side_effect = contains
+            return bloom
+
+        it "says no if nothing we care about is in the filter":
+            bloom = self.bloom_with("other", "six")
+            assert not self.repo.maybe_changed(bloom, self.prefixes)
+
+            # We only look inside folders that are in the filter
+            self.assertEqual(sorted(bloom.checked), sorted(["one", "two", "six", "six/seven"]))
+
+        it "says yes if a file we care about is in the filter":
+            assert self.repo.maybe_changed(self.bloom_with("two", "two/four", "two/four/five"), self.prefixes)
+            assert self.repo.maybe_changed(self.bloom_with("one"), self.prefixes)
+
+        it "ignores files we've already found":
+            self.prefixes.remove((), "one")
+            assert not self.repo.maybe_changed(self.bloom_with("one"), self.prefixes)
+
+        it "says yes once it runs out of budget":
+            bloom = self.bloom_with()
+            assert self.repo.maybe_changed(bloom, self.prefixes, budget=2)
+            self.assertEqual(len(bloom.checked), 2)
+
+    describe "history simplification":
+        def commit(self, root_folder, when, *args):
+            """Commit at a particular time so the order of the walk is known"""
+            date = "@{0} +0000".format(1500000000 + when)
+            env = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+            cmd = ["git", "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com"] + list(args)
+            subprocess.check_output(cmd, cwd=root_folder, env=env, stderr=subprocess.STDOUT)
+            return self.do_git_cmd(root_folder, "rev-parse", "HEAD").strip().decode()
+
+        def write(self, root_folder, name, content):
+            with open(os.path.join(root_folder, name), "w") as fle:
+                fle.write(content)
+            self.do_git_cmd(root_folder, "add", name)
+
+        @contextmanager
+        def merged_with_ours(self):
+            """
+            A repository where a side branch changes ``b`` and ``c`` but is merged
+            with ``-s ours`` so those changes never make it into HEAD
+            """
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                self.write(root_folder, "a", "a")
+                self.write(root_folder, "b", "b")
+                self.write(root_folder, "c", "c")
+                self.commit(root_folder, 1000, "commit", "-q", "-m", "first")
+                self.do_git_cmd(root_folder, "branch", "side")
+
+                self.write(root_folder, "a", "a2")
+                main = self.commit(root_folder, 2000, "commit", "-q", "-m", "main")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                self.write(root_folder, "b", "b2")
+                self.write(root_folder, "c", "c2")
+                side = self.commit(root_folder, 3000, "commit", "-q", "-m", "side")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "-")
+                merge = self.commit(root_folder, 4000, "merge", "-q", "-s", "ours", "-m", "merge", "side")
+                yield root_folder, main, side, merge
+
+        it "only follows the parent a merge is the same as":
+            with self.merged_with_ours() as (root_folder, main, side, merge):
+                repo = Repo(root_folder)
 
-            self.assertEqual(fake_entries_in_tree_oid.mock_calls, [mock.call(prefix, parent_oid_1), mock.call(prefix, current_oid)])
+                walked = []
+                walk_commits = repo.walk_commits
+                def recording_walk_commits(exclude=None, requeue=None):
+                    for info, parents in walk_commits(exclude=exclude, requeue=requeue):
+                        walked.append(info.oid.decode())
+                        yield info, parents
+
+                with mock.patch.object(repo, "walk_commits", recording_walk_commits):
+                    found = dict((path, ctime) for _, ctime, paths in repo.file_commit_times(["a", "b", "c"]) for path in paths)
+
+                # b and c in HEAD are the versions from the first commit
+                self.assertEqual(found, {"a": 1500002000, "b": 1500001000, "c": 1500001000})
+                assert side not in walked
+
+        @contextmanager
+        def merged_with_side_file(self):
+            """
+            A repository where a merge takes ``c`` from its second parent and
+            changes ``a``, while the first parent changed ``c`` more recently
+            """
+            with self.a_temp_dir() as root_folder:
+                self.do_git_cmd(root_folder, "init", "-q")
+                self.write(root_folder, "a", "a")
+                self.write(root_folder, "c", "c")
+                self.commit(root_folder, 1000, "commit", "-q", "-m", "first")
+                self.do_git_cmd(root_folder, "branch", "side")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                self.write(root_folder, "c", "c_side")
+                self.commit(root_folder, 2000, "commit", "-q", "-m", "side")
+
+                self.do_git_cmd(root_folder, "checkout", "-q", "-")
+                self.write(root_folder, "c", "c_main")
+                self.commit(root_folder, 3000, "commit", "-q", "-m", "main")
+
+                self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "merge", "-q", "-s", "ours", "--no-commit", "side")
+                self.write(root_folder, "a", "a_merge")
+                self.write(root_folder, "c", "c_side")
+                self.commit(root_folder, 4000, "commit", "-q", "-m", "merge")
+                yield root_folder
+
+        it "gives a file the same time no matter what else we look for":
+            with self.merged_with_side_file() as root_folder:
+                def found(paths):
+                    repo = Repo(root_folder, use_commit_graph=False)
+                    return dict((path, ctime) for _, ctime, changed in repo.file_commit_times(paths) for path in changed)
+
+                # c in HEAD came from the side branch, so that is where its time comes from
+                self.assertEqual(found(["c"]), {"c": 1500002000})
+                self.assertEqual(found(["a", "c"]), {"a": 1500004000, "c": 1500002000})
+
+                # And that is what git says too
+                for path, ctime in found(["a", "c"]).items():
+                    self.assertEqual(int(self.do_git_cmd(root_folder, "log", "-1", "--format=%ct", "--", path).strip()), ctime)
+
+        it "follows every parent with full_history":
+            with self.merged_with_ours() as (root_folder, main, side, merge):
+                repo = Repo(root_folder, full_history=True)
+                found = dict((path, ctime) for _, ctime, paths in repo.file_commit_times(["a", "b", "c"]) for path in paths)
+                self.assertEqual(found, {"a": 1500002000, "b": 1500003000, "c": 1500003000})
+
+        it "simplifies merges the bloom filters say are the same as the first parent":
+            with self.merged_with_ours() as (root_folder, main, side, merge):
+                self.do_git_cmd(root_folder, "commit-graph", "write", "--reachable", "--changed-paths")
+                repo = Repo(root_folder)
+                with mock.patch.object(repo, "treesame_parent") as treesame_parent:
+                    found = dict((path, ctime) for _, ctime, paths in repo.file_commit_times(["b", "c"]) for path in paths)
+
+                self.assertEqual(found, {"b": 1500001000, "c": 1500001000})
+                self.assertEqual(len(treesame_parent.mock_calls), 0)
+
+        it "finds the first parent that is the same for everything we care about":
+            with self.merged_with_ours() as (root_folder, main, side, merge):
+                repo = Repo(root_folder, use_commit_graph=False)
+                info = repo.commit_info(merge.encode())
+                parents = [repo.commit_info(oid) for oid in info.parents]
+
+                prefixes = PrefixTree()
+                prefixes.fill(["a", "b"])
+                self.assertEqual(repo.treesame_parent(info, parents, prefixes).oid.decode(), main)
+
+                prefixes = PrefixTree()
+                prefixes.fill(["a"])
+                self.assertEqual(repo.treesame_parent(info, parents, prefixes).oid.decode(), main)
+
+                # Merge the other way, keeping c from the second parent and changing a
+                self.do_git_cmd(root_folder, "checkout", "-q", "side")
+                self.do_git_cmd(root_folder, "-c", "user.name=gitmit", "-c", "user.email=gitmit@example.com", "merge", "-q", "-s", "ours", "--no-commit", merge)
+                self.write(root_folder, "a", "a3")
+                self.write(root_folder, "c", "c")
+                other = self.commit(root_folder, 5000, "commit", "-q", "-m", "other merge")
+                info = repo.commit_info(other.encode())
+                parents = [repo.commit_info(oid) for oid in info.parents]
+
+                prefixes = PrefixTree()
+                prefixes.fill(["c"])
+                self.assertEqual(repo.treesame_parent(info, parents, prefixes).oid.decode(), merge)
+
+                prefixes = PrefixTree()
+                prefixes.fill(["a", "c"])
+                self.assertIs(repo.treesame_parent(info, parents, prefixes), None)
+
+    describe "sorted_entries":
+        it "returns empty if tree_oid not in git":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                repo = Repo(root_folder)
+                self.assertEqual(repo.sorted_entries(b"9fc25f91ffb9dc693f999a8983954c777f8cb2f6"), ())
 
-        it "joins multiple parent_files together":
-            prefix = str(uuid.uuid1())
-            prefixes = {prefix: set(["one"])}
-            current_oid = mock.Mock(name="current_oid")
-            parent_oid_1 = mock.Mock(name="parent_oid_1")
-            parent_oid_2 = mock.Mock(name="parent_oid_2")
-            parent_oids = [parent_oid_1, parent_oid_2]
+        it "gets the entries in the tree sorted by key":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                repo = Repo(root_folder)
+                tree_oid = list(repo.git.get_walker())[0].commit.tree
+                expected = (
+                      ('five', 'five', False, b'1d19714ffbc272ba0da6eb419d66123c20527174')
+                    , ('one', 'one', False, b'3b5b7321662dac4ad026e1434206f19167fb119b')
+                    , ('seven', 'seven', False, b'fe7900bcbd294970da3296db5cf2020b4391a639')
+                    , ('six', 'six', False, b'ffe2fce498955b628014618b28c6bcf152466a4a')
+                    , ('three/', 'three', True, b'dd53cbd0fe752a982d79710e0b801c08fb10bce9')
+                    , ('two', 'two', False, b'f719efd430d52bcfc8566a43b2eb655688d38871')
+                    )
+                self.assertEqual(repo.sorted_entries(tree_oid), expected)
 
-            current_files = set(["one", "two", "three", "four"])
-            parent_files = set(["one", "three", "four"])
-            changes = set(["two"])
+                # And it is memoized
+                with mock.patch.object(repo, "tree_entries", mock.NonCallableMock(name="tree_entries")):
+                    self.assertEqual(repo.sorted_entries(tree_oid), expected)
 
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
+    describe "tree_entries":
+        it "uses and fills in the tree_cache":
+            with self.cloned_repo("paths") as (root_folder, commit_times):
+                tree_cache = TreeEntryCache(root_folder)
+                repo = Repo(root_folder, tree_cache=tree_cache)
+                tree_oid = list(repo.git.get_walker())[0].commit.tree
 
-            def entries_in_tree_oid(prefix, oid):
-                return {current_oid: current_files, parent_oid_1: set(["one"]), parent_oid_2: set(["three", "four"])}[oid]
-            fake_entries_in_tree_oid = mock.Mock(name="entries_in_tree_oid", side_effect=entries_in_tree_oid)
+                self.assertIs(tree_cache.get(tree_oid), None)
+                entries = repo.tree_entries(tree_oid)
+                self.assertEqual(tree_cache.get(tree_oid), entries)
+                self.assertEqual(sorted(entries)[0], ("five", False, b"1d19714ffbc272ba0da6eb419d66123c20527174"))
 
-            with mock.patch.multiple(repo, entries_in_tree_oid=fake_entries_in_tree_oid):
-                self.assertEqual(repo.tree_structures_for(prefix, current_oid, parent_oids, prefixes), ((current_files, parent_files), changes))
+                list(repo.file_commit_times(set(["one"])))
+                self.assertEqual(TreeEntryCache(root_folder).get(tree_oid), entries)
 
-            self.assertEqual(fake_entries_in_tree_oid.mock_calls, [mock.call(prefix, parent_oid_1), mock.call(prefix, parent_oid_2), mock.call(prefix, current_oid)])
+                repo = Repo(root_folder, tree_cache=TreeEntryCache(root_folder))
+                with mock.patch.object(repo.git, "get_object", mock.NonCallableMock(name="get_object")):
+                    self.assertEqual(repo.tree_entries(tree_oid), entries)
 
     describe "differences_between":
-        it "yields paths if all that has changed is blobs":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, False, oid1), (path2, False, oid2)])
-            parent_files = set([(path1, False, oid1)])
+        def entries(self, *items):
+            return tuple(sorted((name + "/" if is_tree else name, name, is_tree, oid) for name, is_tree, oid in items))
 
+        def repo_with_trees(self, trees):
             with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
                 repo = Repo("root_folder")
 
-            result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {}))
-
-            self.assertEqual(result, [(path2, None, True)])
-
-        it "yields nothing if the path is for a tree and not in prefixes":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, True, oid1), (path2, True, oid2)])
-            parent_files = set([(path1, True, oid1)])
-
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
-
-            fake_tree_structures_for = mock.NonCallableMock(name="tree_structures_for")
-
-            with mock.patch.multiple(repo, tree_structures_for=fake_tree_structures_for):
-                result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {}))
-
-            self.assertEqual(result, [])
-
-        it "yields next layer if path is indeed in prefixes and it's a tree":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, True, oid1), (path2, True, oid2)])
-            parent_files = set([(path1, True, oid1)])
-
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
-
-            cf_and_pf = mock.Mock(name="cf_and_pf")
-            changes = mock.Mock(name="changes")
-            fake_tree_structures_for = mock.Mock(name="tree_structures_for", return_value=(cf_and_pf, changes))
-
-            with mock.patch.multiple(repo, tree_structures_for=fake_tree_structures_for):
-                result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {path2: True}))
-
-            self.assertEqual(result, [(cf_and_pf, changes, False)])
-
-            fake_tree_structures_for.assert_called_once_with(path2, oid2, frozenset([]), {path2: True})
-
-        it "works when the tree has one parent":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            oid3 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, True, oid1), (path2, True, oid2)])
-            parent_files = set([(path1, True, oid1), (path2, True, oid3)])
-
+            def sorted_entries(tree_oid):
+                return trees[tree_oid]
+            repo.sorted_entries = mock.Mock(name="sorted_entries", side_effect=sorted_entries)
+            return repo
+
+        def prefixes_for(self, *paths):
+            prefixes = PrefixTree()
+            prefixes.fill(paths)
+            return prefixes
+
+        it "yields nothing without looking at trees if the tree is the same as a parent":
+            repo = self.repo_with_trees({})
+            self.assertEqual(list(repo.differences_between("t1", ["t2", "t1"], self.prefixes_for("one"))), [])
+            self.assertEqual(repo.sorted_entries.mock_calls, [])
+
+        it "yields the files we care about that are different from the parent":
+            repo = self.repo_with_trees(
+                { "t1": self.entries(("a", False, "o1"), ("b", False, "o2"), ("c", False, "o3"))
+                , "t2": self.entries(("a", False, "o1"), ("b", False, "o4"))
+                }
+              )
+            self.assertEqual(list(repo.differences_between("t1", ["t2"], self.prefixes_for("a", "b"))), [("b", )])
+
+        it "yields everything we care about if there are no parents":
+            repo = self.repo_with_trees({"t1": self.entries(("a", False, "o1"), ("b", False, "o2"), ("c", False, "o3"))})
+            self.assertEqual(list(repo.differences_between("t1", [], self.prefixes_for("a", "c"))), [("a", ), ("c", )])
+
+        it "only looks at subtrees that are different and that we care about":
+            repo = self.repo_with_trees(
+                { "t1": self.entries(("d", True, "t3"), ("e", True, "t4"), ("f", True, "t5"))
+                , "t2": self.entries(("d", True, "t3"), ("e", True, "t6"), ("f", True, "t7"))
+                , "t4": self.entries(("one", False, "o1"), ("two", False, "o2"))
+                , "t6": self.entries(("one", False, "o3"), ("two", False, "o2"))
+                }
+              )
+            prefixes = self.prefixes_for("d/one", "e/one", "e/two")
+            self.assertEqual(list(repo.differences_between("t1", ["t2"], prefixes)), [("e", "one")])
+            self.assertEqual(repo.sorted_entries.mock_calls, [mock.call("t1"), mock.call("t2"), mock.call("t4"), mock.call("t6")])
+
+        it "doesn't look at subtrees we stopped caring about since they were found":
+            repo = self.repo_with_trees(
+                { "t1": self.entries(("a", False, "o1"), ("d", True, "t3"))
+                , "t2": self.entries(("a", False, "o2"), ("d", True, "t4"))
+                }
+              )
+            prefixes = self.prefixes_for("a", "d/one")
+
+            found = []
+            for path in repo.differences_between("t1", ["t2"], prefixes):
+                found.append(path)
+                prefixes.remove(path[:-1], path[-1])
+                prefixes.remove(("d", ), "one")
+
+            self.assertEqual(found, [("a", )])
+            self.assertEqual(repo.sorted_entries.mock_calls, [mock.call("t1"), mock.call("t2")])
+
+        it "treats a file and a folder with the same name as different":
+            repo = self.repo_with_trees(
+                { "t1": self.entries(("x", True, "t3"))
+                , "t2": self.entries(("x", False, "o1"))
+                , "t3": self.entries(("one", False, "o2"))
+                }
+              )
+            self.assertEqual(list(repo.differences_between("t1", ["t2"], self.prefixes_for("x/one"))), [("x", "one")])
+
+        it "only yields files that are different from every parent":
+            repo = self.repo_with_trees(
+                { "t1": self.entries(("a", False, "o1"), ("b", False, "o2"), ("c", False, "o3"), ("d", True, "t5"))
+                , "t2": self.entries(("a", False, "o1"), ("b", False, "o4"), ("d", True, "t6"))
+                , "t3": self.entries(("a", False, "o5"), ("b", False, "o2"), ("d", True, "t7"))
+                , "t5": self.entries(("one", False, "o6"), ("two", False, "o7"))
+                , "t6": self.entries(("one", False, "o6"), ("two", False, "o8"))
+                , "t7": self.entries(("one", False, "o9"), ("two", False, "o10"))
+                }
+              )
+            prefixes = self.prefixes_for("a", "b", "c", "d/one", "d/two")
+            self.assertEqual(list(repo.differences_between("t1", ["t2", "t3"], prefixes)), [("c", ), ("d", "two")])
+
+    describe "changed_entries":
+        it "removes entries that are the same and remembers the parent oid of different trees":
             with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
                 repo = Repo("root_folder")
 
-            cf_and_pf = mock.Mock(name="cf_and_pf")
-            changes = mock.Mock(name="changes")
-            fake_tree_structures_for = mock.Mock(name="tree_structures_for", return_value=(cf_and_pf, changes))
-
-            with mock.patch.multiple(repo, tree_structures_for=fake_tree_structures_for):
-                result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {path2: True}))
-
-            self.assertEqual(result, [(cf_and_pf, changes, False)])
-
-            fake_tree_structures_for.assert_called_once_with(path2, oid2, frozenset([oid3]), {path2: True})
-
-        it "works when the tree has more than one parent":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            oid3 = str(uuid.uuid1())
-            oid4 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, True, oid1), (path2, True, oid2)])
-            parent_files = set([(path1, True, oid1), (path2, True, oid3), (path2, True, oid4)])
-
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
-
-            cf_and_pf = mock.Mock(name="cf_and_pf")
-            changes = mock.Mock(name="changes")
-            fake_tree_structures_for = mock.Mock(name="tree_structures_for", return_value=(cf_and_pf, changes))
-
-            with mock.patch.multiple(repo, tree_structures_for=fake_tree_structures_for):
-                result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {path2: True}))
-
-            self.assertEqual(result, [(cf_and_pf, changes, False)])
-
-            fake_tree_structures_for.assert_called_once_with(path2, oid2, frozenset([oid3, oid4]), {path2: True})
-
-        it "ignores parents that aren't trees":
-            oid1 = str(uuid.uuid1())
-            oid2 = str(uuid.uuid1())
-            oid3 = str(uuid.uuid1())
-            oid4 = str(uuid.uuid1())
-            path1 = str(uuid.uuid1())
-            path2 = str(uuid.uuid1())
-            current_files = set([(path1, True, oid1), (path2, True, oid2)])
-            parent_files = set([(path1, True, oid1), (path2, True, oid3), (path2, False, oid4)])
-
-            with mock.patch("gitmit.repo.Repository", mock.Mock(name="Repository")):
-                repo = Repo("root_folder")
-
-            cf_and_pf = mock.Mock(name="cf_and_pf")
-            changes = mock.Mock(name="changes")
-            fake_tree_structures_for = mock.Mock(name="tree_structures_for", return_value=(cf_and_pf, changes))
-
-            with mock.patch.multiple(repo, tree_structures_for=fake_tree_structures_for):
-                result = list(repo.differences_between(current_files, parent_files, current_files-parent_files, {path2: True}))
-
-            self.assertEqual(result, [(cf_and_pf, changes, False)])
+            a = ("a", "a", False, "o1")
+            b = ("b", "b", False, "o2")
+            c = ("c/", "c", True, "t1")
+            d = ("d/", "d", True, "t2")
+            changes = [(a, []), (b, []), (c, []), (d, ["t3"])]
+            parent_entries = (("a", "a", False, "o1"), ("b", "b", False, "o4"), ("b/", "b", True, "t4"), ("d/", "d", True, "t5"))
 
-            fake_tree_structures_for.assert_called_once_with(path2, oid2, frozenset([oid3]), {path2: True})
+            self.assertEqual(repo.changed_entries(changes, parent_entries), [(b, []), (c, []), (d, ["t3", "t5"])])
@@ -0,0 +1,72 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.shared_cache import default_cache_dir, entry_location, get_shared_commit_times, set_shared_commit_times, evict_shared_cache
+from gitmit.cache import cache_key
+
+import mock
+import os
+
+describe TestCase, "shared cache":
+    it "defaults to a gitmit folder in the XDG cache folder":
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "/tmp/xdg"}):
+            self.assertEqual(default_cache_dir(), "/tmp/xdg/gitmit")
+
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "", "HOME": "/tmp/home"}):
+            self.assertEqual(default_cache_dir(), "/tmp/home/.cache/gitmit")
+
+    it "keeps a file for each commit and set of files":
+        with self.a_temp_dir() as cache_dir:
+            self.assertIs(get_shared_commit_times(cache_dir, ".", "abc", ["one"]), None)
+
+            set_shared_commit_times(cache_dir, ".", "abc", {"one": 1}, ["one"])
+            set_shared_commit_times(cache_dir, ".", "def", {"one": 2}, ["one"])
+            set_shared_commit_times(cache_dir, "sub", "abc", {"sub/one": 3}, ["one"])
+
+            assert os.path.exists(entry_location(cache_dir, "abc", cache_key(".", ["one"])))
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "abc", ["one"]), {"one": 1})
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "def", ["one"]), {"one": 2})
+            self.assertEqual(get_shared_commit_times(cache_dir, "sub", "abc", ["one"]), {"sub/one": 3})
+            self.assertIs(get_shared_commit_times(cache_dir, ".", "abc", ["two"]), None)
+
+            # And what one backend found isn't used for another
+            self.assertIs(get_shared_commit_times(cache_dir, ".", "abc", ["one"], backend="git"), None)
+            set_shared_commit_times(cache_dir, ".", "abc", {"one": 4}, ["one"], backend="git")
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "abc", ["one"], backend="git"), {"one": 4})
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "abc", ["one"]), {"one": 1})
+
+    it "complains rather than fails about files it can't read":
+        with self.a_temp_dir() as cache_dir:
+            location = entry_location(cache_dir, "abc", cache_key(".", ["one"]))
+            os.makedirs(os.path.dirname(location))
+            with open(location, "wb") as fle:
+                fle.write(b"nope")
+
+            with mock.patch("gitmit.shared_cache.log") as log:
+                self.assertIs(get_shared_commit_times(cache_dir, ".", "abc", ["one"]), None)
+            self.assertEqual(len(log.warning.mock_calls), 1)
+
+    it "removes the least recently used files when they take up too many bytes":
+        with self.a_temp_dir() as cache_dir:
+            for number, commit in enumerate(["a", "b", "c"]):
+                set_shared_commit_times(cache_dir, ".", commit, {"one": 1}, ["one"])
+                os.utime(entry_location(cache_dir, commit, cache_key(".", ["one"])), (number, number))
+
+            # Using a makes b the least recently used
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "a", ["one"]), {"one": 1})
+
+            size = os.path.getsize(entry_location(cache_dir, "a", cache_key(".", ["one"])))
+            self.assertEqual(evict_shared_cache(cache_dir, max_bytes=size * 2), 1)
+            self.assertEqual(sorted(os.listdir(os.path.join(cache_dir, "commit_times"))), sorted(os.path.basename(entry_location(cache_dir, commit, cache_key(".", ["one"]))) for commit in ["a", "c"]))
+
+    it "never evicts the file it just wrote":
+        with self.a_temp_dir() as cache_dir:
+            set_shared_commit_times(cache_dir, ".", "a", {"one": 1}, ["one"])
+            set_shared_commit_times(cache_dir, ".", "b", {"one": 1}, ["one"], max_bytes=1)
+            self.assertIs(get_shared_commit_times(cache_dir, ".", "a", ["one"]), None)
+            self.assertEqual(get_shared_commit_times(cache_dir, ".", "b", ["one"]), {"one": 1})
+
+    it "doesn't mind evicting a cache that doesn't exist":
+        with self.a_temp_dir() as cache_dir:
+            self.assertEqual(evict_shared_cache(os.path.join(cache_dir, "nope")), 0)
@@ -0,0 +1,138 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.sqlite_cache import sqlite_cache_location, connect, get_cached_commit_times, set_cached_commit_times, get_times_at_commit, get_all_cached_commit_times, export_cached_commit_times
+from gitmit.cache import cache_key
+
+import sqlite3
+import json
+import mock
+import os
+
+def count(root_folder, table):
+    connection = connect(root_folder)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM {0}".format(table)).fetchone()[0]
+    finally:
+        connection.close()
+
+describe TestCase, "sqlite cache":
+    it "lives under the .git folder":
+        with self.a_temp_dir() as dirname:
+            self.assertEqual(sqlite_cache_location(dirname), "{0}/.git/gitmit_cached_commit_times.sqlite".format(dirname))
+
+    it "returns None, {} if it doesn't have the commit times":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one"]), (None, {}))
+
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["two"]), (None, {}))
+            self.assertEqual(get_cached_commit_times(dirname, "other", ["one"]), (None, {}))
+
+    it "doesn't complain if there is no .git folder":
+        with self.a_temp_dir() as dirname:
+            with mock.patch("gitmit.sqlite_cache.log") as log:
+                set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+                self.assertEqual(get_cached_commit_times(dirname, ".", ["one"]), (None, {}))
+            self.assertEqual(len(log.warning.mock_calls), 2)
+            assert not os.path.exists(sqlite_cache_location(dirname))
+
+    it "remembers commit times for each set of files":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1, "fé": 2}, ["fé", "one"])
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+            set_cached_commit_times(dirname, "other", "def", {"other/one": 3}, ["one"])
+
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["fé", "one"]), ("abc", {"one": 1, "fé": 2}))
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one"]), ("abc", {"one": 1}))
+            self.assertEqual(get_cached_commit_times(dirname, "other", ["one"]), ("def", {"other/one": 3}))
+
+    it "shares the rows for the same commit between sets of files":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"])
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+            self.assertEqual(count(dirname, "times"), 2)
+            self.assertEqual(count(dirname, "filters"), 2)
+
+    it "finds the commit times of paths at a commit from any set of files":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            self.assertEqual(get_times_at_commit(dirname, "abc", ["one"]), {})
+
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"])
+            set_cached_commit_times(dirname, "sub", "abc", {"sub/three": 3}, ["three"])
+            set_cached_commit_times(dirname, "other", "def", {"four": 4}, ["four"])
+
+            self.assertEqual(get_times_at_commit(dirname, "abc", ["two", "sub/three", "four", "five"]), {"two": 2, "sub/three": 3})
+            self.assertEqual(get_times_at_commit(dirname, "def", ["one", "four"]), {"four": 4})
+            self.assertEqual(get_times_at_commit(dirname, "ghi", ["one"]), {})
+
+    it "keeps the commit times found by each backend apart":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"], backend="git")
+            set_cached_commit_times(dirname, "sub", "abc", {"sub/three": 3}, ["three"])
+            set_cached_commit_times(dirname, ".", "abc", {"one": 10, "two": 20}, ["one", "two"])
+
+            self.assertEqual(get_times_at_commit(dirname, "abc", ["one", "sub/three"]), {"one": 10, "sub/three": 3})
+            self.assertEqual(get_times_at_commit(dirname, "abc", ["one", "sub/three"], backend="git"), {"one": 1})
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one", "two"]), ("abc", {"one": 10, "two": 20}))
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one", "two"], backend="git"), ("abc", {"one": 1, "two": 2}))
+
+    it "replaces the commit times for a set of files and forgets the old commit":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1, "two": 2}, ["one", "two"])
+            set_cached_commit_times(dirname, ".", "def", {"one": 3, "two": 2}, ["one", "two"])
+
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one", "two"]), ("def", {"one": 3, "two": 2}))
+            self.assertEqual(count(dirname, "commits"), 1)
+            self.assertEqual(count(dirname, "times"), 2)
+
+    it "removes the least recently used sets of files":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            for parent_dir in ("a", "b", "c"):
+                set_cached_commit_times(dirname, parent_dir, parent_dir * 40, {parent_dir + "/one": 1}, ["one"], max_entries=2)
+            self.assertEqual(sorted(entry["parent_dir"] for entry in get_all_cached_commit_times(dirname).values()), ["b", "c"])
+
+            # Using b means c is the next to go
+            self.assertEqual(get_cached_commit_times(dirname, "b", ["one"]), ("b" * 40, {"b/one": 1}))
+            set_cached_commit_times(dirname, "d", "d" * 40, {"d/one": 1}, ["one"], max_entries=2)
+            self.assertEqual(sorted(entry["parent_dir"] for entry in get_all_cached_commit_times(dirname).values()), ["b", "d"])
+
+            # And the rows for what we forgot are gone
+            self.assertEqual(count(dirname, "commits"), 2)
+            self.assertEqual(count(dirname, "times"), 2)
+            self.assertEqual(count(dirname, "paths"), 2)
+
+    it "starts afresh if the database is from another version":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+
+            connection = sqlite3.connect(sqlite_cache_location(dirname))
+            connection.execute("PRAGMA user_version=100")
+            connection.close()
+
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one"]), (None, {}))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+            self.assertEqual(get_cached_commit_times(dirname, ".", ["one"]), ("abc", {"one": 1}))
+
+    it "can be exported as json":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            set_cached_commit_times(dirname, ".", "abc", {"one": 1}, ["one"])
+
+            with self.a_temp_file() as filename:
+                with open(filename, "w") as fle:
+                    export_cached_commit_times(dirname, fle)
+                with open(filename) as fle:
+                    exported = json.load(fle)
+
+            entry = exported["entries"][cache_key(".", ["one"])]
+            self.assertEqual((entry["parent_dir"], entry["commit"], entry["commit_times"]), (".", "abc", {"one": 1}))
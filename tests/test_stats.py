@@ -0,0 +1,69 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.stats import Stats, bucket_for
+
+import mock
+
+describe TestCase, "Stats":
+    it "puts resolved files in buckets":
+        self.assertEqual([bucket_for(count) for count in (1, 2, 9, 10, 99, 100, 999, 1000, 1001)]
+            , ["1", "2-9", "2-9", "10-99", "10-99", "100-999", "100-999", "1000+", "1000+"]
+            )
+
+        stats = Stats()
+        for count in (1, 1, 5, 2000):
+            stats.resolved_files(count)
+        self.assertEqual(dict(stats.resolved), {"1": 2, "2-9": 1, "10-99": 0, "100-999": 0, "1000+": 1})
+
+    it "adds up the time spent in each phase":
+        stats = Stats()
+        with mock.patch("time.time", side_effect=[1, 3, 10, 11]):
+            with stats.timing("index"):
+                pass
+            with stats.timing("index"):
+                pass
+        self.assertEqual(dict(stats.phases), {"index": 3})
+
+    it "times making each item and using each item separately":
+        stats = Stats()
+        times = iter([0, 2, 2, 7, 7, 8, 8, 9, 9, 13])
+
+        def things():
+            yield 1
+            yield 2
+
+        with mock.patch("time.time", lambda: next(times)):
+            found = list(stats.consumed("output", stats.timed("walk", things())))
+
+        self.assertEqual(found, [1, 2])
+        # walk is 0-2, 7-8 and 9-13 and output is 2-7 and 8-9
+        self.assertEqual(dict(stats.phases), {"walk": 7, "output": 6})
+
+    it "counts output even if the consumer stops early":
+        stats = Stats()
+        with mock.patch("time.time", side_effect=[5, 8]):
+            for _ in stats.consumed("output", [1, 2, 3]):
+                break
+        self.assertEqual(dict(stats.phases), {"output": 3})
+
+    it "can be a dictionary or a report":
+        stats = Stats()
+        stats.commits_walked = 4
+        stats.merge_commits = 1
+        stats.cache = "miss"
+        stats.resolved_files(3)
+        stats.add_time("walk", 1.5)
+        stats.add_time("output", 0.25)
+
+        self.assertEqual(stats.as_dict()["commits_walked"], 4)
+        self.assertEqual(stats.as_dict()["resolved"]["2-9"], 1)
+
+        report = stats.report()
+        assert "commits walked           4\n" in report, report
+        assert "merge commits            1\n" in report, report
+        assert "cache                    miss\n" in report, report
+        assert "commits resolving files  1=0 2-9=1 10-99=0 100-999=0 1000+=0\n" in report, report
+        assert "phase walk               1.500s\n" in report, report
+        assert report.endswith("phase total              1.750s\n"), report
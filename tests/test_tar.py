@@ -0,0 +1,89 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.tar import write_tar, TarWriter
+
+import tarfile
+import mock
+import io
+import os
+
+describe TestCase, "write_tar":
+    def make_folder(self, folder):
+        os.mkdir(os.path.join(folder, "three"))
+        with open(os.path.join(folder, "one"), "w") as fle:
+            fle.write("one")
+        with open(os.path.join(folder, "three", "four"), "wb") as fle:
+            fle.write(b"four" * 1000)
+        os.chmod(os.path.join(folder, "one"), 0o755)
+        os.symlink("three", os.path.join(folder, "five"))
+        os.symlink("one", os.path.join(folder, "six"))
+        return [("one", 10), ("three/four", 20), ("five", 30), ("five/four", 20), ("six", 40), ("missing", 50)]
+
+    def assertArchive(self, data):
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            members = dict((member.name, member) for member in archive.getmembers())
+            self.assertEqual(sorted(members), ["five", "five/four", "one", "six", "three/four"])
+
+            self.assertEqual(dict((name, member.mtime) for name, member in members.items())
+                , {"one": 10, "three/four": 20, "five": 30, "five/four": 20, "six": 40}
+                )
+
+            assert members["five"].isdir()
+            assert members["six"].issym()
+            self.assertEqual(members["six"].linkname, "one")
+            self.assertEqual(members["one"].mode, 0o755)
+            self.assertEqual(members["one"].uid, 0)
+            self.assertEqual(members["one"].uname, "")
+
+            self.assertEqual(archive.extractfile("one").read(), b"one")
+            self.assertEqual(archive.extractfile("three/four").read(), b"four" * 1000)
+            self.assertEqual(archive.extractfile("five/four").read(), b"four" * 1000)
+
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+
+    it "writes the files with their commit times to a file object without a fileno":
+        with self.a_temp_dir() as folder:
+            times = self.make_folder(folder)
+            out = io.BytesIO()
+            self.assertEqual(write_tar(folder, times, out, buffer_size=7), 5)
+            self.assertArchive(out.getvalue())
+
+    it "uses sendfile for real files":
+        with self.a_temp_dir() as folder:
+            times = self.make_folder(folder)
+            with self.a_temp_file() as location:
+                sendfile = mock.Mock(name="sendfile", side_effect=os.sendfile)
+                with open(location, "wb") as out:
+                    with mock.patch("os.sendfile", sendfile):
+                        write_tar(folder, times, out)
+
+                assert len(sendfile.mock_calls) >= 3
+                with open(location, "rb") as fle:
+                    self.assertArchive(fle.read())
+
+    it "copies instead if sendfile doesn't work":
+        with self.a_temp_dir() as folder:
+            times = self.make_folder(folder)
+            with self.a_temp_file() as location:
+                with open(location, "wb") as out:
+                    with mock.patch("os.sendfile", side_effect=OSError(22, "nope")):
+                        write_tar(folder, times, out)
+
+                with open(location, "rb") as fle:
+                    self.assertArchive(fle.read())
+
+describe TestCase, "TarWriter":
+    it "pads files that shrink while we copy them":
+        with self.a_temp_file("abc") as location:
+            out = io.BytesIO()
+            writer = TarWriter(out)
+
+            info = tarfile.TarInfo("thing")
+            info.size = 10
+            writer.add(info, location)
+            writer.close()
+
+            with tarfile.open(fileobj=io.BytesIO(out.getvalue())) as archive:
+                self.assertEqual(archive.extractfile("thing").read(), b"abc" + b"\0" * 7)
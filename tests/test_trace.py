@@ -0,0 +1,114 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.trace import Tracer
+from gitmit.mit import GitTimes
+
+import json
+import mock
+
+describe TestCase, "Tracer":
+    it "only adds spans that are long enough unless told to always add them":
+        tracer = Tracer(min_duration=0.5)
+        tracer.start = 10
+
+        tracer.add("short", "test", 11, 11.25)
+        tracer.add("always", "test", 11, 11.25, always=True)
+        tracer.add("long", "test", 12, 13, {"thing": 1})
+
+        self.assertEqual([(event["name"], event["ts"], event["dur"], event.get("args")) for event in tracer.events]
+            , [("always", 1000000, 250000, None), ("long", 2000000, 1000000, {"thing": 1})]
+            )
+        self.assertEqual(set(event["ph"] for event in tracer.events), set(["X"]))
+
+    it "lets args be added to a span before it ends":
+        tracer = Tracer()
+        with tracer.span("thing", "test", commit="one") as args:
+            args["found"] = 2
+        self.assertEqual(tracer.events[0]["args"], {"commit": "one", "found": 2})
+
+    it "adds a span and a counter for each batch of commits":
+        tracer = Tracer(batch_size=2)
+        for found, remaining in [(1, 9), (0, 9), (3, 6), (0, 6), (6, 0)]:
+            tracer.walked_commit(found, remaining)
+        tracer.finish_batch(0)
+        tracer.finish_batch(0)
+
+        spans = [(event["name"], event["args"]) for event in tracer.events if event["ph"] == "X"]
+        self.assertEqual(spans
+            , [ ("commits 0-1", {"found": 1, "remaining": 9})
+              , ("commits 2-3", {"found": 3, "remaining": 6})
+              , ("commits 4-4", {"found": 6, "remaining": 0})
+              ]
+            )
+
+        counters = [event["args"] for event in tracer.events if event["ph"] == "C"]
+        self.assertEqual(counters, [{"remaining": 9}, {"remaining": 6}, {"remaining": 0}])
+
+    it "saves the events as a trace":
+        tracer = Tracer()
+        tracer.add("thing", "test", tracer.start, tracer.start + 1)
+
+        with self.a_temp_file() as location:
+            tracer.save(location)
+            with open(location) as fle:
+                trace = json.load(fle)
+
+        self.assertEqual(trace["displayTimeUnit"], "ms")
+        self.assertEqual([event["name"] for event in trace["traceEvents"]], ["process_name", "thing"])
+
+    it "traces finding commit times":
+        with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+            tracer = Tracer(min_duration=0)
+            gittimes = GitTimes(root_folder, ".", silent=True, with_cache=False, tracer=tracer)
+            self.assertEqual(dict(gittimes.find()), commit_times)
+
+            spans = [event for event in tracer.events if event["ph"] == "X"]
+            phases = [event["name"] for event in spans if event["cat"] == "phase"]
+            self.assertEqual(phases[:3], ["index", "filtering", "symlinks"])
+            self.assertEqual(set(phases[3:]), set(["walk", "output"]))
+
+            batches = [event for event in spans if event["cat"] == "walk"]
+            self.assertEqual(len(batches), 1)
+            self.assertEqual(batches[0]["name"], "commits 0-{0}".format(gittimes.stats.commits_walked - 1))
+            self.assertEqual(batches[0]["args"], {"found": len(commit_times), "remaining": 0})
+
+            diffs = [event for event in spans if event["cat"] == "diff"]
+            self.assertEqual(len(diffs), gittimes.stats.commits_walked)
+            self.assertEqual(sum(event["args"].get("found", 0) for event in diffs), len(commit_times))
+
+            loads = [event["name"] for event in spans if event["cat"] == "objects"]
+            self.assertEqual(loads.count("load tree"), gittimes.stats.trees_decoded)
+            self.assertEqual(loads.count("decode tree"), gittimes.stats.trees_decoded)
+            assert "load commit" in loads
+
+    it "traces comparing the folders that are big enough":
+        with self.cloned_repo("merge_with_changes") as (root_folder, commit_times):
+            tracer = Tracer(min_duration=0, min_entries=0)
+            gittimes = GitTimes(root_folder, ".", silent=True, with_cache=False, tracer=tracer)
+            self.assertEqual(dict(gittimes.find()), commit_times)
+
+            subtrees = [event["args"] for event in tracer.events if event["ph"] == "X" and event["cat"] == "subtree"]
+            assert subtrees
+            folders = set(["."])
+            for path in commit_times:
+                parts = path.split("/")[:-1]
+                folders.update("/".join(parts[:i + 1]) for i in range(len(parts)))
+
+            assert "." in [args["folder"] for args in subtrees]
+            for args in subtrees:
+                assert args["folder"] in folders, args
+
+            tracer = Tracer(min_duration=0, min_entries=1000000)
+            list(GitTimes(root_folder, ".", silent=True, with_cache=False, tracer=tracer).find())
+            self.assertEqual([event for event in tracer.events if event.get("cat") == "subtree"], [])
+
+    it "traces the batches of commits with the git backend":
+        with self.cloned_repo("paths") as (root_folder, commit_times):
+            tracer = Tracer(batch_size=2)
+            list(GitTimes(root_folder, ".", silent=True, with_cache=False, backend="git", tracer=tracer).find())
+
+            batches = [event["args"] for event in tracer.events if event["ph"] == "X" and event["cat"] == "walk"]
+            self.assertEqual(batches[-1]["remaining"], 0)
+            self.assertEqual(sum(batch["found"] for batch in batches), len(commit_times))
@@ -0,0 +1,139 @@
+# coding: spec
+
+from tests.helpers import TestCase
+
+from gitmit.atomic import locked
+from gitmit.tree_cache import TreeEntryCache, tree_cache_location, encode_entries, decode_entries
+
+import binascii
+import struct
+import mock
+import os
+
+entries1 = (("one", False, b"3b5b7321662dac4ad026e1434206f19167fb119b"), ("three", True, b"dd53cbd0fe752a982d79710e0b801c08fb10bce9"))
+entries2 = (("fé", False, b"f719efd430d52bcfc8566a43b2eb655688d38871"), )
+
+oid1 = b"9fc25f91ffb9dc693f999a8983954c777f8cb2f6"
+oid2 = b"1d19714ffbc272ba0da6eb419d66123c20527174"
+oid3 = b"ffe2fce498955b628014618b28c6bcf152466a4a"
+
+describe TestCase, "TreeEntryCache":
+    it "encodes and decodes entries":
+        self.assertEqual(decode_entries(encode_entries(entries1)), entries1)
+        self.assertEqual(decode_entries(encode_entries(entries2)), entries2)
+        self.assertEqual(decode_entries(encode_entries(())), ())
+
+    it "returns None for trees it doesn't know about":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            self.assertIs(TreeEntryCache(dirname).get(oid1), None)
+
+    it "remembers entries between instances once saved":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache = TreeEntryCache(dirname)
+            cache.add(oid1, entries1)
+            cache.add(oid2, entries2)
+            self.assertEqual(cache.get(oid1), entries1)
+
+            assert not os.path.exists(tree_cache_location(dirname))
+            cache.save()
+            assert os.path.exists(tree_cache_location(dirname))
+
+            cache = TreeEntryCache(dirname)
+            self.assertEqual(cache.get(oid1), entries1)
+            self.assertEqual(cache.get(oid2), entries2)
+            self.assertIs(cache.get(oid3), None)
+
+    it "keeps the trees other instances saved since it loaded the file":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            first = TreeEntryCache(dirname)
+            second = TreeEntryCache(dirname)
+            self.assertIs(first.get(oid1), None)
+            self.assertIs(second.get(oid2), None)
+
+            first.add(oid1, entries1)
+            second.add(oid2, entries2)
+            first.save()
+            second.save()
+
+            cache = TreeEntryCache(dirname)
+            self.assertEqual(cache.get(oid1), entries1)
+            self.assertEqual(cache.get(oid2), entries2)
+
+    it "saves while holding the lock":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache = TreeEntryCache(dirname)
+            cache.add(oid1, entries1)
+
+            with mock.patch("gitmit.tree_cache.locked", wraps=locked) as fake_locked:
+                cache.save()
+            fake_locked.assert_called_once_with(tree_cache_location(dirname))
+
+    it "doesn't complain if it can't write or read the cache":
+        with self.a_temp_dir() as dirname:
+            cache = TreeEntryCache(dirname)
+            cache.add(oid1, entries1)
+            cache.save()
+            assert not os.path.exists(tree_cache_location(dirname))
+
+            os.mkdir(os.path.join(dirname, ".git"))
+            with open(tree_cache_location(dirname), "wb") as fle:
+                fle.write(b"not a cache")
+            self.assertIs(TreeEntryCache(dirname).get(oid1), None)
+
+    it "ignores records that are truncated or invalid":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache = TreeEntryCache(dirname)
+            cache.add(oid1, entries1)
+            cache.add(oid2, entries2)
+            cache.save()
+
+            location = tree_cache_location(dirname)
+            with open(location, "rb") as fle:
+                data = fle.read()
+
+            # Cut the file off part way through the last record
+            with open(location, "wb") as fle:
+                fle.write(data[:-5])
+
+            with mock.patch("gitmit.tree_cache.log") as log:
+                cache = TreeEntryCache(dirname)
+                found = [cache.get(oid1), cache.get(oid2)]
+            self.assertEqual(found.count(None), 1)
+            self.assertIn(entries1 if found[0] is not None else entries2, found)
+            assert log.warning.mock_calls
+
+            # And garbage inside a record
+            header = data[:5]
+            record = struct.pack(">20sI", binascii.unhexlify(oid3), 30) + b"\xff" * 30
+            with open(location, "wb") as fle:
+                fle.write(header + record)
+
+            with mock.patch("gitmit.tree_cache.log") as log:
+                cache = TreeEntryCache(dirname)
+                self.assertIs(cache.get(oid3), None)
+                self.assertIs(cache.get(oid3), None)
+            self.assertEqual(len(log.warning.mock_calls), 1)
+
+    it "evicts the least recently used trees when it gets too big":
+        with self.a_temp_dir() as dirname:
+            os.mkdir(os.path.join(dirname, ".git"))
+            cache = TreeEntryCache(dirname)
+            cache.add(oid1, entries1)
+            cache.add(oid2, entries2)
+            cache.save()
+            size = os.path.getsize(tree_cache_location(dirname))
+
+            cache = TreeEntryCache(dirname, max_bytes=size)
+            self.assertEqual(cache.get(oid1), entries1)
+            cache.add(oid3, entries2)
+            cache.save()
+
+            cache = TreeEntryCache(dirname)
+            self.assertEqual(cache.get(oid3), entries2)
+            self.assertEqual(cache.get(oid1), entries1)
+            self.assertIs(cache.get(oid2), None)